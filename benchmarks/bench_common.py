@@ -0,0 +1,35 @@
+"""Funções compartilhadas pelos benchmarks de banco de dados."""
+import json
+import time
+import statistics
+
+
+def measure(fn, iterations, setup=None):
+    """
+    Executa `fn` `iterations` vezes e retorna as estatísticas em milissegundos.
+
+    Com `setup`, cada execução recebe `fn(setup())`; o tempo de `setup` (ex.:
+    gerar o lote) não é medido.
+    """
+    samples = []
+    for _ in range(iterations):
+        args = (setup(),) if setup else ()
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "mean_ms": round(statistics.mean(samples), 3),
+        "p50_ms": round(samples[len(samples) // 2], 3),
+        "p95_ms": round(samples[max(0, int(len(samples) * 0.95) - 1)], 3),
+        "p99_ms": round(samples[max(0, int(len(samples) * 0.99) - 1)], 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def write_results(results, output):
+    """Imprime o resultado e o grava em JSON."""
+    print(json.dumps(results, indent=2))
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
@@ -0,0 +1,247 @@
+"""
+Benchmark do armazenamento compacto de fipe_vehicle_model_value (migração 003).
+
+Cria um esquema descartável (`fipe_bench_compact`) em um PostgreSQL local com
+duas versões da tabela de valores, populadas com as mesmas linhas:
+
+- legacy: ano, código e nome do mês de referência em character varying e
+  valor em double precision;
+- compact: ano em smallint, código de referência em integer (com a dimensão
+  fipe_reference_table) e valor em centavos (integer).
+
+Mede o tamanho da tabela e dos índices, a latência de uma varredura completa
+(agregação por tabela de referência) e a latência do upsert em lote usado pelo
+ingestor. O resultado é impresso e gravado em JSON.
+
+Uso:
+    FIPE_BENCH_DSN="dbname=fipe_bench user=postgres" \\
+        python benchmarks/bench_compact_storage.py --rows 2000000 --output result.json
+"""
+import os
+import random
+import argparse
+import psycopg2
+from psycopg2.extras import execute_values
+from bench_common import measure, write_results
+
+SCHEMA = "fipe_bench_compact"
+
+MONTHS = [
+    "janeiro", "fevereiro", "março", "abril", "maio", "junho", "julho",
+    "agosto", "setembro", "outubro", "novembro", "dezembro",
+]
+
+CREATE_TABLES_SQL = f"""
+    DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+    CREATE SCHEMA {SCHEMA};
+
+    CREATE TABLE {SCHEMA}.legacy
+    (
+        id serial PRIMARY KEY,
+        name character varying NOT NULL,
+        model_id integer,
+        code character varying,
+        fipe_code character varying NOT NULL,
+        manufacturer_id integer,
+        manufacture_year character varying,
+        reference_month character varying,
+        reference_month_code character varying,
+        fipe_value double precision,
+        fuel_type character varying,
+        vehicle_type integer,
+        active boolean,
+        create_date timestamp without time zone,
+        write_date timestamp without time zone
+    );
+    CREATE UNIQUE INDEX legacy_natural_key_unique ON {SCHEMA}.legacy
+        (model_id, fipe_code, manufacture_year, reference_month_code, fuel_type) NULLS NOT DISTINCT;
+    CREATE INDEX legacy_fipe_code_reference_idx ON {SCHEMA}.legacy (fipe_code, reference_month_code);
+
+    CREATE TABLE {SCHEMA}.fipe_reference_table
+    (
+        code integer PRIMARY KEY,
+        month_name character varying NOT NULL,
+        create_date timestamp without time zone
+    );
+
+    CREATE TABLE {SCHEMA}.compact
+    (
+        id serial PRIMARY KEY,
+        name character varying NOT NULL,
+        model_id integer,
+        code character varying,
+        fipe_code character varying NOT NULL,
+        manufacturer_id integer,
+        manufacture_year smallint,
+        reference_month_code integer NOT NULL REFERENCES {SCHEMA}.fipe_reference_table (code),
+        fipe_value_cents integer,
+        fuel_type character varying,
+        vehicle_type integer,
+        active boolean,
+        create_date timestamp without time zone,
+        write_date timestamp without time zone
+    );
+    CREATE UNIQUE INDEX compact_natural_key_unique ON {SCHEMA}.compact
+        (model_id, fipe_code, manufacture_year, reference_month_code, fuel_type) NULLS NOT DISTINCT;
+    CREATE INDEX compact_fipe_code_reference_idx ON {SCHEMA}.compact (fipe_code, reference_month_code);
+"""
+
+# Mesmas linhas nas duas tabelas: `models` modelos x 35 anos x N meses
+SEED_SQL = f"""
+    INSERT INTO {SCHEMA}.fipe_reference_table (code, month_name, create_date)
+    SELECT DISTINCT 300 - n / (%(models)s * 35), %(month_name)s, NOW()
+    FROM generate_series(0, %(rows)s - 1) AS n;
+
+    INSERT INTO {SCHEMA}.legacy (
+        name, model_id, code, fipe_code, manufacturer_id, manufacture_year,
+        reference_month, reference_month_code, fipe_value, fuel_type,
+        vehicle_type, active, create_date
+    )
+    SELECT
+        'Modelo ' || mod(n, %(models)s) || ' ' || (1990 + mod(n / %(models)s, 35)),
+        mod(n, %(models)s),
+        mod(n, %(models)s)::text,
+        lpad(mod(n, %(models)s)::text, 6, '0') || '-1',
+        mod(n, 100),
+        (1990 + mod(n / %(models)s, 35))::text,
+        %(month_name)s,
+        (300 - n / (%(models)s * 35))::text,
+        round((random() * 10000000)::numeric) / 100,
+        '1',
+        1,
+        TRUE,
+        NOW()
+    FROM generate_series(0, %(rows)s - 1) AS n;
+
+    INSERT INTO {SCHEMA}.compact (
+        name, model_id, code, fipe_code, manufacturer_id, manufacture_year,
+        reference_month_code, fipe_value_cents, fuel_type, vehicle_type,
+        active, create_date
+    )
+    SELECT
+        name, model_id, code, fipe_code, manufacturer_id, manufacture_year::smallint,
+        reference_month_code::integer, round(fipe_value * 100)::integer, fuel_type,
+        vehicle_type, active, create_date
+    FROM {SCHEMA}.legacy;
+"""
+
+SCAN_SQL = {
+    "legacy": f"""
+        SELECT reference_month, reference_month_code, avg(fipe_value), count(*)
+        FROM {SCHEMA}.legacy
+        GROUP BY reference_month, reference_month_code
+    """,
+    "compact": f"""
+        SELECT r.month_name, v.reference_month_code, avg(v.fipe_value_cents) / 100.0, count(*)
+        FROM {SCHEMA}.compact v
+        JOIN {SCHEMA}.fipe_reference_table r ON r.code = v.reference_month_code
+        GROUP BY r.month_name, v.reference_month_code
+    """,
+}
+
+UPSERT_SQL = {
+    "legacy": (f"""
+        INSERT INTO {SCHEMA}.legacy (
+            name, code, model_id, fipe_code, manufacturer_id, manufacture_year,
+            reference_month, reference_month_code, fipe_value, fuel_type,
+            vehicle_type, active, create_date
+        ) VALUES %s
+        ON CONFLICT (model_id, fipe_code, manufacture_year, reference_month_code, fuel_type)
+        DO UPDATE SET fipe_value = EXCLUDED.fipe_value, write_date = NOW()
+    """, "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, TRUE, NOW())"),
+    "compact": (f"""
+        INSERT INTO {SCHEMA}.compact (
+            name, code, model_id, fipe_code, manufacturer_id, manufacture_year,
+            reference_month_code, fipe_value_cents, fuel_type, vehicle_type,
+            active, create_date
+        ) VALUES %s
+        ON CONFLICT (model_id, fipe_code, manufacture_year, reference_month_code, fuel_type)
+        DO UPDATE SET fipe_value_cents = EXCLUDED.fipe_value_cents, write_date = NOW()
+    """, "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, TRUE, NOW())"),
+}
+
+
+def make_batch(layout, models, reference_month_code, month_name, batch_size):
+    """Gera um lote de preços do mês mais recente no formato de cada tabela."""
+    rows = {}
+    for _ in range(batch_size):
+        model_id = random.randrange(models)
+        year = random.randrange(1990, 2025)
+        cents = random.randrange(1_000_000, 100_000_000)
+        common = (f"Modelo {model_id} {year}", str(model_id), model_id, f"{model_id:06d}-1", model_id % 100)
+        if layout == "legacy":
+            row = common + (str(year), month_name, str(reference_month_code), cents / 100, "1", 1)
+        else:
+            row = common + (year, reference_month_code, cents, "1", 1)
+        rows[(model_id, year)] = row
+    return list(rows.values())
+
+
+def table_sizes(conn, table):
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT pg_relation_size(%s), pg_indexes_size(%s), pg_total_relation_size(%s)",
+            (f"{SCHEMA}.{table}",) * 3,
+        )
+        heap, indexes, total = cur.fetchone()
+    conn.rollback()
+    return {"table_bytes": heap, "indexes_bytes": indexes, "total_bytes": total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("FIPE_BENCH_DSN", "dbname=fipe_bench"))
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Linhas de cada tabela")
+    parser.add_argument("--models", type=int, default=6_000, help="Modelos distintos")
+    parser.add_argument("--batch-size", type=int, default=10, help="Preços por lote SQS")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--output", default="bench_compact_storage.json")
+    args = parser.parse_args()
+
+    random.seed(42)
+    month_name = f"{random.choice(MONTHS)} de 2026"
+    reference_month_code = 300
+
+    conn = psycopg2.connect(args.dsn)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(CREATE_TABLES_SQL)
+        cur.execute(SEED_SQL, {"rows": args.rows, "models": args.models, "month_name": month_name})
+        for layout in ("legacy", "compact"):
+            cur.execute(f"VACUUM ANALYZE {SCHEMA}.{layout}")
+    conn.autocommit = False
+
+    def scan(layout):
+        with conn.cursor() as cur:
+            cur.execute(SCAN_SQL[layout])
+            cur.fetchall()
+        conn.rollback()
+
+    def upsert(layout):
+        sql, template = UPSERT_SQL[layout]
+        rows = make_batch(layout, args.models, reference_month_code, month_name, args.batch_size)
+        with conn.cursor() as cur:
+            execute_values(cur, sql, rows, template=template)
+        conn.commit()
+
+    results = {"benchmark": "compact_storage", "rows": args.rows, "models": args.models}
+    for layout in ("legacy", "compact"):
+        results[layout] = {
+            **table_sizes(conn, layout),
+            "full_scan": measure(lambda: scan(layout), args.iterations),
+            "bulk_upsert": measure(lambda: upsert(layout), args.iterations),
+        }
+    results["total_bytes_ratio"] = round(
+        results["compact"]["total_bytes"] / results["legacy"]["total_bytes"], 3
+    )
+
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    conn.close()
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+"""
+Benchmark do caminho de escrita do FipeSomaIngestor.
+
+Aplica o esquema de sql/create_fipe_db.sql em um PostgreSQL local e popula
+`fipe_vehicle_model_value` com volumes realistas (por padrão 1M, 5M e 20M
+valores; cerca de 48 mil por mês de referência, como o catálogo da FIPE). A
+cada volume, mede a latência por lote (p50/p99) e a vazão (linhas/s) de:
+
+- `process_batch`: lote SQS completo (decodificação, cache de dimensões,
+  partição do mês e upsert em lote) em um mês novo e em um mês já gravado
+  (reprocessamento, ON CONFLICT DO UPDATE);
+- `bulk_upsert_model_values`: upsert em lote de registros já resolvidos;
+- `insert_model_value`: gravação registro a registro (caminho de fallback).
+
+O banco deve ser descartável: as tabelas do esquema `public` são esvaziadas
+quando o catálogo semeado não corresponde aos parâmetros. Entre execuções com
+os mesmos parâmetros, os valores já semeados são reaproveitados.
+
+O resultado é gravado em JSON com o commit e a versão do PostgreSQL; com
+`--baseline`, cada medida é comparada com a de uma execução anterior e as
+regressões acima de `--tolerance` são listadas.
+
+Uso:
+    FIPE_BENCH_DSN="dbname=fipe_bench user=postgres" \\
+        python benchmarks/bench_ingest.py --rows 1000000,5000000,20000000 \\
+        --output bench_ingest.json --baseline bench_ingest_anterior.json
+"""
+import os
+import sys
+import json
+import time
+import logging
+import random
+import argparse
+import subprocess
+from psycopg2.extensions import parse_dsn
+from bench_common import measure, write_results
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+LAMBDA_SRC = os.path.join(ROOT_DIR, "code_lambdas", "src", "fipe_api")
+SCHEMA_FILE = os.path.join(ROOT_DIR, "sql", "create_fipe_db.sql")
+
+# Fabricantes por tipo de veículo (como o catálogo da FIPE: carros, motos e caminhões)
+MANUFACTURERS = {1: 90, 2: 80, 3: 20}
+# Anos por modelo em cada mês: modelos x anos = valores por mês de referência
+YEARS_PER_MODEL = 8
+LATEST_YEAR = 2025
+# Meses de referência usados nas medidas de mês novo (fora da faixa semeada)
+MEASURE_REFERENCE_BASE = 900000
+
+# As sequências de id não pertencem às colunas (sem OWNED BY), então o
+# RESTART IDENTITY do TRUNCATE não as reinicia: os ids determinísticos da
+# semeadura dependem do ALTER SEQUENCE explícito
+RESET_SQL = """
+    TRUNCATE public.fipe_vehicle_model_value, public.fipe_vehicle_model,
+             public.fipe_vehicle_manufacturer, public.fipe_reference_table
+    RESTART IDENTITY CASCADE;
+
+    ALTER SEQUENCE public.fipe_vehicle_manufacturer_id_seq RESTART WITH 1;
+    ALTER SEQUENCE public.fipe_vehicle_model_id_seq RESTART WITH 1;
+    ALTER SEQUENCE public.fipe_vehicle_model_value_id_seq RESTART WITH 1;
+"""
+
+# IDs determinísticos: fabricante m (1..N) e modelo j (id j + 1, do fabricante j % N + 1)
+SEED_DIMENSIONS_SQL = """
+    INSERT INTO public.fipe_vehicle_manufacturer (name, code, vehicle_type, create_date)
+    SELECT 'Marca ' || m, m::text, %(vehicle_type_case)s, NOW()
+    FROM generate_series(1, %(manufacturers)s) AS m
+    ORDER BY m;
+
+    INSERT INTO public.fipe_vehicle_model (name, code, manufacturer_id, create_date)
+    SELECT 'Modelo ' || j, j::text, mod(j, %(manufacturers)s) + 1, NOW()
+    FROM generate_series(0, %(models)s - 1) AS j
+    ORDER BY j;
+"""
+
+SEED_MONTH_SQL = """
+    INSERT INTO public.fipe_vehicle_model_value (
+        name, model_id, code, fipe_code, manufacturer_id, manufacture_year,
+        reference_month_code, fipe_value_cents, fuel_type, vehicle_type,
+        active, create_date
+    )
+    SELECT
+        'Modelo ' || j || ' ' || (%(latest_year)s - y),
+        j + 1,
+        j::text,
+        lpad(j::text, 6, '0') || '-1',
+        mod(j, %(manufacturers)s) + 1,
+        %(latest_year)s - y,
+        %(code)s,
+        (100000 + random() * 50000000)::integer,
+        '1',
+        %(vehicle_type_case)s,
+        TRUE,
+        NOW()
+    FROM generate_series(0, %(models)s - 1) AS j
+    CROSS JOIN generate_series(0, %(years)s - 1) AS y
+"""
+
+
+def vehicle_type_of(manufacturer):
+    """Tipo de veículo do fabricante m, na ordem de MANUFACTURERS."""
+    limit = 0
+    for vehicle_type, count in MANUFACTURERS.items():
+        limit += count
+        if manufacturer <= limit:
+            return vehicle_type
+    raise ValueError(manufacturer)
+
+
+def vehicle_type_case(column):
+    """Expressão SQL equivalente a `vehicle_type_of`."""
+    limit = 0
+    whens = []
+    for vehicle_type, count in MANUFACTURERS.items():
+        limit += count
+        whens.append(f"WHEN {column} <= {limit} THEN {vehicle_type}")
+    return "CASE " + " ".join(whens) + " END"
+
+
+def seed_params(models, code=None):
+    manufacturers = sum(MANUFACTURERS.values())
+    return {
+        "manufacturers": manufacturers,
+        "models": models,
+        "years": YEARS_PER_MODEL,
+        "latest_year": LATEST_YEAR,
+        "code": code,
+    }
+
+
+def execute(conn, sql, params=None):
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+    conn.commit()
+
+
+def fetch_one(conn, sql, params=None):
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        row = cur.fetchone()
+    conn.rollback()
+    return row
+
+
+def seeded_months(conn, models):
+    """Meses já semeados, ou None se o catálogo não corresponder a `models`."""
+    manufacturers, seeded_models = fetch_one(conn, """
+        SELECT (SELECT count(*) FROM public.fipe_vehicle_manufacturer),
+               (SELECT count(*) FROM public.fipe_vehicle_model)
+    """)
+    if manufacturers != sum(MANUFACTURERS.values()) or seeded_models != models:
+        return None
+    return fetch_one(
+        conn, "SELECT count(*) FROM public.fipe_reference_table WHERE code < %s",
+        (MEASURE_REFERENCE_BASE,),
+    )[0]
+
+
+def seed(conn, models, rows):
+    """
+    Garante ao menos `rows` valores semeados, acrescentando meses de
+    referência (códigos 1, 2, ...) ao que já existe.
+
+    Returns:
+        tuple: (valores semeados, código do mês mais recente)
+    """
+    per_month = models * YEARS_PER_MODEL
+    months = seeded_months(conn, models)
+    if months is None:
+        print("Catálogo do banco não corresponde aos parâmetros: recriando os dados")
+        execute(conn, RESET_SQL)
+        dimensions_sql = SEED_DIMENSIONS_SQL.replace("%(vehicle_type_case)s", vehicle_type_case("m"))
+        execute(conn, dimensions_sql, seed_params(models))
+        months = 0
+
+    target = -(-rows // per_month)
+    manufacturer_expression = f"mod(j, {sum(MANUFACTURERS.values())}) + 1"
+    month_sql = SEED_MONTH_SQL.replace("%(vehicle_type_case)s", vehicle_type_case(manufacturer_expression))
+    for code in range(months + 1, target + 1):
+        start = time.perf_counter()
+        execute(conn, """
+            INSERT INTO public.fipe_reference_table (code, month_name, create_date)
+            VALUES (%s, %s, NOW())
+        """, (code, f"mês {code}"))
+        execute(conn, "SELECT public.fipe_ensure_value_partition(%s)", (code,))
+        execute(conn, month_sql, seed_params(models, code))
+        print(f"Mês {code}/{target} semeado ({per_month} valores em {time.perf_counter() - start:.1f}s)")
+
+    if target > months:
+        conn.autocommit = True
+        execute(conn, "VACUUM ANALYZE public.fipe_vehicle_model_value")
+        conn.autocommit = False
+    return max(months, target) * per_month, max(months, target)
+
+
+def price_record(models, code):
+    """Registro de preço no formato enviado pelo FipePriceLoader."""
+    manufacturers = sum(MANUFACTURERS.values())
+    j = random.randrange(models)
+    manufacturer = j % manufacturers + 1
+    year = LATEST_YEAR - random.randrange(YEARS_PER_MODEL)
+    cents = random.randrange(100_000, 50_000_000)
+    return {
+        "manufacturer": f"Marca {manufacturer}",
+        "manufacturer_code": str(manufacturer),
+        "model": f"Modelo {j}",
+        "model_code": str(j),
+        "model_year": f"{year} Gasolina",
+        "model_year_code": str(year),
+        "fipe_value": "R$ " + f"{cents // 100:,}".replace(",", ".") + f",{cents % 100:02d}",
+        "fipe_code": f"{j:06d}-1",
+        "fuel_type": "1",
+        "vehicle_type": vehicle_type_of(manufacturer),
+        "mesReferenciaAno": f"mês {code}",
+        "codigoTabelaReferencia": code,
+    }
+
+
+def sqs_batch(models, code, messages, records_per_message):
+    """Lote SQS com `messages` mensagens de `records_per_message` registros cada."""
+    from message_packing import pack_records
+
+    records = []
+    for index in range(messages):
+        prices = [price_record(models, code) for _ in range(records_per_message)]
+        if records_per_message == 1:
+            body = json.dumps(prices[0], ensure_ascii=False)
+        else:
+            body = pack_records(prices)[0]
+        records.append({"messageId": f"bench-{index}", "body": body})
+    return records
+
+
+def resolved_items(conn, models, code, count):
+    """Registros com fabricante e modelo resolvidos, prontos para o upsert."""
+    from fipe_soma_ingestor import parse_values, resolve_dimensions
+    from dimension_cache import get_dimension_cache
+
+    items = [(f"bench-{index}", parse_values("bench", price_record(models, code))) for index in range(count)]
+    items, failed = resolve_dimensions(conn, items, get_dimension_cache(conn))
+    assert not failed, failed
+    return items
+
+
+def with_throughput(stats, rows):
+    """Acrescenta a vazão (linhas/s) às estatísticas de `measure`."""
+    return {**stats, "rows_per_iteration": rows, "rows_per_second": round(rows / (stats["mean_ms"] / 1000), 1)}
+
+
+def drop_reference(conn, code):
+    """Remove um mês usado nas medidas (partição e dimensão)."""
+    import fipe_soma_ingestor
+
+    execute(conn, f"DROP TABLE IF EXISTS public.fipe_vehicle_model_value_{int(code)}")
+    execute(conn, "DELETE FROM public.fipe_reference_table WHERE code = %s", (code,))
+    fipe_soma_ingestor._known_reference_tables.discard(code)
+
+
+def measure_level(conn, args, latest_code, level):
+    """Medidas com o volume atual de valores semeados."""
+    from fipe_soma_ingestor import process_batch, bulk_upsert_model_values, insert_model_value
+
+    new_code = MEASURE_REFERENCE_BASE + level
+    rows_per_batch = args.batch_size * args.records_per_message
+    drop_reference(conn, new_code)
+    # Primeiro lote do mês novo: cria a partição (fora da medida)
+    process_batch(conn, sqs_batch(args.models, new_code, 1, 1))
+
+    def run_batch(records):
+        failed = process_batch(conn, records)
+        assert not failed, failed
+
+    cases = {
+        "process_batch_new_month": with_throughput(measure(
+            run_batch, args.iterations,
+            setup=lambda: sqs_batch(args.models, new_code, args.batch_size, args.records_per_message),
+        ), rows_per_batch),
+        "process_batch_existing_month": with_throughput(measure(
+            run_batch, args.iterations,
+            setup=lambda: sqs_batch(args.models, latest_code, args.batch_size, args.records_per_message),
+        ), rows_per_batch),
+        "bulk_upsert_model_values": with_throughput(measure(
+            lambda items: bulk_upsert_model_values(conn, items), args.iterations,
+            setup=lambda: resolved_items(conn, args.models, new_code, args.bulk_rows),
+        ), args.bulk_rows),
+        "insert_model_value_per_row": with_throughput(measure(
+            lambda items: [insert_model_value(conn, data) for _, data in items], args.iterations,
+            setup=lambda: resolved_items(conn, args.models, new_code, args.batch_size),
+        ), args.batch_size),
+    }
+    drop_reference(conn, new_code)
+    return cases
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compara cada medida com a execução de referência (mesmo volume).
+
+    Returns:
+        list: Regressões de vazão ou de p99 acima de `tolerance`
+    """
+    previous = {level["rows"]: level["cases"] for level in baseline.get("levels", [])}
+    regressions = []
+    for level in results["levels"]:
+        for case, stats in level["cases"].items():
+            before = previous.get(level["rows"], {}).get(case)
+            if not before:
+                continue
+            throughput = stats["rows_per_second"] / before["rows_per_second"]
+            p99 = stats["p99_ms"] / before["p99_ms"]
+            stats["vs_baseline"] = {"rows_per_second": round(throughput, 3), "p99_ms": round(p99, 3)}
+            if throughput < 1 - tolerance or p99 > 1 + tolerance:
+                regressions.append({"rows": level["rows"], "case": case, **stats["vs_baseline"]})
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def configure_ingestor(dsn):
+    """Conexão do ingestor (get_db_connection) a partir do DSN do benchmark."""
+    params = parse_dsn(dsn)
+    os.environ["RDS_HOST"] = params.get("host", "localhost")
+    os.environ["RDS_PORT"] = str(params.get("port", "5432"))
+    os.environ["RDS_DATABASE"] = params["dbname"]
+    os.environ["RDS_USER"] = params.get("user", os.getenv("USER", "postgres"))
+    os.environ["DB_PASSWORD"] = params.get("password") or os.getenv("PGPASSWORD", "")
+    sys.path.insert(0, LAMBDA_SRC)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("FIPE_BENCH_DSN", "dbname=fipe_bench"))
+    parser.add_argument("--rows", default="1000000,5000000,20000000",
+                        help="Volumes de valores semeados, separados por vírgula")
+    parser.add_argument("--models", type=int, default=6_000, help="Modelos distintos")
+    parser.add_argument("--batch-size", type=int, default=10, help="Mensagens por lote SQS")
+    parser.add_argument("--records-per-message", type=int, default=1,
+                        help="Registros por mensagem (>1 usa o formato empacotado)")
+    parser.add_argument("--bulk-rows", type=int, default=1000, help="Registros por upsert em lote")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--baseline", help="JSON de uma execução anterior para comparação")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Variação tolerada (0.1 = 10%%)")
+    parser.add_argument("--output", default="bench_ingest.json")
+    args = parser.parse_args()
+
+    configure_ingestor(args.dsn)
+    from fipe_soma_ingestor import get_db_connection
+
+    # O ingestor registra cada mensagem em INFO; o benchmark mede a escrita
+    logging.getLogger().setLevel(logging.WARNING)
+
+    random.seed(42)
+    conn = get_db_connection()
+    with open(SCHEMA_FILE, "r", encoding="utf-8") as f:
+        execute(conn, f.read())
+
+    results = {
+        "benchmark": "ingest",
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "postgres": fetch_one(conn, "SHOW server_version")[0],
+        "models": args.models,
+        "batch_size": args.batch_size,
+        "records_per_message": args.records_per_message,
+        "bulk_rows": args.bulk_rows,
+        "iterations": args.iterations,
+        "levels": [],
+    }
+    for level, rows in enumerate(sorted(int(value) for value in args.rows.split(","))):
+        seeded, latest_code = seed(conn, args.models, rows)
+        print(f"Medindo com {seeded} valores semeados")
+        results["levels"].append({
+            "rows": rows,
+            "seeded_rows": seeded,
+            "cases": measure_level(conn, args, latest_code, level),
+        })
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            results["regressions"] = compare(results, json.load(f), args.tolerance)
+    conn.close()
+
+    write_results(results, args.output)
+    if results.get("regressions"):
+        print(f"{len(results['regressions'])} regressões acima de {args.tolerance:.0%}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
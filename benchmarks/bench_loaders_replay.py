@@ -0,0 +1,249 @@
+"""
+Benchmark das Lambdas de carga reproduzindo um corpus gravado da API FIPE.
+
+Com FIPE_FIXTURE_MODE=record, o FipeAPI grava cada par requisição/resposta
+em um corpus (JSON Lines + gzip). Por exemplo, para gravar um crawl de
+amostra com o runner local:
+
+    FIPE_FIXTURE_MODE=record FIPE_FIXTURE_PATH=fipe_fixtures.jsonl.gz \\
+        python benchmarks/run_local_pipeline.py --sample
+
+Este benchmark reproduz o corpus (FIPE_FIXTURE_MODE=replay), sem acesso à
+rede e de forma determinística, e mede:
+
+- `parse_years` e `build_brand_messages` sobre todas as respostas gravadas
+  de ConsultarAnoModelo e ConsultarMarcas;
+- os `lambda_handler`s do FipeManufacturerLoader, FipeModelLoader e
+  FipePriceLoader, etapa por etapa: as mensagens enviadas por uma etapa
+  (capturadas em memória) são a entrada da seguinte, em lotes de
+  `--batch-size`. Mensagens sem resposta no corpus são descartadas na
+  primeira passagem (aquecimento) e contadas no resultado.
+
+Com `--timing original` cada resposta leva a latência gravada; o padrão
+(`fast`) responde imediatamente. `--profile` grava o perfil (cProfile) das
+etapas medidas, para análise com `python -m pstats` ou snakeviz.
+
+Uso:
+    python benchmarks/bench_loaders_replay.py --corpus fipe_fixtures.jsonl.gz \\
+        --iterations 5 --output bench_loaders_replay.json --profile loaders.prof
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from bench_common import measure, write_results
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_SRC = os.path.join(os.path.dirname(BENCHMARKS_DIR), "code_lambdas", "src", "fipe_api")
+
+# URL fictícia: na reprodução apenas o endpoint (último segmento) é usado
+REPLAY_URL = "http://fipe-fixtures.local/api/veiculos"
+REPLAY_QUEUE_URL = "local://fipe-replay"
+
+
+class CollectingSqsClient:
+    """Cliente SQS que apenas guarda as mensagens enviadas."""
+
+    def __init__(self):
+        self.bodies = []
+        self._lock = threading.Lock()
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        with self._lock:
+            self.bodies.append(MessageBody)
+        return {}
+
+    def send_message_batch(self, QueueUrl, Entries, **kwargs):
+        with self._lock:
+            self.bodies.extend(entry["MessageBody"] for entry in Entries)
+        return {}
+
+    def change_message_visibility(self, **kwargs):
+        return {}
+
+    def drain(self):
+        with self._lock:
+            bodies, self.bodies = self.bodies, []
+        return [json.loads(body) for body in bodies]
+
+
+def configure_environment(args):
+    """Variáveis lidas pelas Lambdas no import: reprodução e sem banco."""
+    os.environ["FIPE_FIXTURE_MODE"] = "replay"
+    os.environ["FIPE_FIXTURE_PATH"] = args.corpus
+    os.environ["FIPE_FIXTURE_TIMING"] = args.timing
+    os.environ["URL_FIPE"] = REPLAY_URL
+    os.environ["SQS_INPUT_URL"] = REPLAY_QUEUE_URL
+    os.environ["SQS_OUTPUT_URL"] = REPLAY_QUEUE_URL
+    os.environ["FIPE_IDEMPOTENCY_LEDGER"] = "off"
+    os.environ["FIPE_CRAWL_PROGRESS"] = "false"
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.pop("RDS_HOST", None)
+    if args.sample:
+        os.environ["TEST"] = "true"
+    sys.path.insert(0, LAMBDA_SRC)
+
+
+def recorded_bodies(corpus, endpoint):
+    """Respostas 200 gravadas de um endpoint, já decodificadas."""
+    return [
+        json.loads(entry["body"])
+        for entries in corpus.entries.values()
+        for entry in entries
+        if entry["endpoint"] == endpoint and entry["status"] == 200
+    ]
+
+
+def sqs_records(messages):
+    return [
+        {
+            "messageId": f"replay-{index}",
+            "receiptHandle": f"replay-{index}",
+            "body": json.dumps(message, ensure_ascii=False),
+            "eventSourceARN": "arn:aws:sqs:local:000000000000:fipe-replay",
+        }
+        for index, message in enumerate(messages)
+    ]
+
+
+def batches(messages, size):
+    return [sqs_records(messages[i:i + size]) for i in range(0, len(messages), size)]
+
+
+def run_stage(handler, inputs, batch_size):
+    """
+    Passagem de aquecimento de uma etapa: descarta as mensagens que falham
+    (requisições ausentes do corpus).
+
+    Returns:
+        tuple: (mensagens aceitas, quantidade descartada)
+    """
+    accepted = []
+    for start in range(0, len(inputs), batch_size):
+        chunk = inputs[start:start + batch_size]
+        result = handler({"Records": sqs_records(chunk)}, None)
+        failed = {failure["itemIdentifier"] for failure in result.get("batchItemFailures", [])}
+        accepted.extend(
+            message for index, message in enumerate(chunk) if f"replay-{index}" not in failed
+        )
+    return accepted, len(inputs) - len(accepted)
+
+
+def measure_stage(handler, messages, args, profiler):
+    """Latência por invocação (lote) e vazão em mensagens/s de uma etapa."""
+    stage_batches = batches(messages, args.batch_size)
+    iterator = iter(stage_batches * args.iterations)
+
+    def invoke(records):
+        if profiler:
+            profiler.enable()
+        handler({"Records": records}, None)
+        if profiler:
+            profiler.disable()
+
+    start = time.perf_counter()
+    stats = measure(invoke, len(stage_batches) * args.iterations, setup=lambda: next(iterator))
+    elapsed = time.perf_counter() - start
+    return {
+        **stats,
+        "messages": len(messages),
+        "messages_per_second": round(len(messages) * args.iterations / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.getenv("FIPE_FIXTURE_PATH", "fipe_fixtures.jsonl.gz"))
+    parser.add_argument("--timing", choices=("fast", "original"), default="fast")
+    parser.add_argument("--sample", action="store_true", help="Modo TEST das Lambdas (como na gravação)")
+    parser.add_argument("--batch-size", type=int, default=10, help="Mensagens por invocação")
+    parser.add_argument("--iterations", type=int, default=5, help="Passagens medidas por etapa")
+    parser.add_argument("--profile", help="Grava o perfil (cProfile) das etapas neste arquivo")
+    parser.add_argument("--output", default="bench_loaders_replay.json")
+    args = parser.parse_args()
+
+    configure_environment(args)
+    from fixture_corpus import get_fixture_corpus
+    from fipe_api_service import FipeAPI, parse_years
+    import fipe_manufacturer_loader
+    import fipe_model_loader
+    import fipe_price_loader
+
+    # O corpus é reproduzido sem rede; os logs das Lambdas não são exibidos
+    logging.getLogger().setLevel(logging.WARNING)
+
+    corpus = get_fixture_corpus()
+    sqs_client = CollectingSqsClient()
+    FipeAPI.sqs_client = sqs_client
+    profiler = None
+    if args.profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+
+    year_bodies = recorded_bodies(corpus, "ConsultarAnoModelo")
+    brand_bodies = recorded_bodies(corpus, "ConsultarMarcas")
+    api = FipeAPI(reference_table_code=0, reference_month_name="replay")
+
+    results = {
+        "benchmark": "loaders_replay",
+        "corpus": args.corpus,
+        "timing": args.timing,
+        "recorded_requests": len(corpus.entries),
+        "parsing": {
+            "parse_years": {
+                **measure(lambda: [parse_years(body) for body in year_bodies], args.iterations),
+                "responses": len(year_bodies),
+            },
+            "build_brand_messages": {
+                **measure(
+                    lambda: [
+                        fipe_manufacturer_loader.build_brand_messages(api, 1, body)
+                        for body in brand_bodies
+                    ],
+                    args.iterations,
+                ),
+                "responses": len(brand_bodies),
+            },
+        },
+    }
+
+    # Etapa inicial: uma invocação do FipeManufacturerLoader gera as marcas
+    manufacturer = measure(
+        lambda: fipe_manufacturer_loader.lambda_handler({"mes": 0, "ano": 0}, None), args.iterations
+    )
+    brand_messages = [
+        message for message in sqs_client.drain()
+        if "codigoMarca" in message and "model_code" not in message
+    ]
+    # As passagens repetidas geram as mesmas marcas: uma cópia de cada basta
+    brand_messages = list({json.dumps(m, sort_keys=True): m for m in brand_messages}.values())
+    stages = {"FipeManufacturerLoader": {**manufacturer, "messages": len(brand_messages)}}
+
+    def stage(name, handler, messages):
+        accepted, skipped = run_stage(handler, messages, args.batch_size)
+        outputs = sqs_client.drain()
+        stages[name] = {**measure_stage(handler, accepted, args, profiler), "skipped_messages": skipped}
+        sqs_client.drain()
+        return outputs
+
+    model_messages = [
+        message for message in stage("FipeModelLoader", fipe_model_loader.lambda_handler, brand_messages)
+        if "model_code" in message and "fipe_value" not in message and "retryAttempt" not in message
+    ]
+    stage("FipePriceLoader", fipe_price_loader.lambda_handler, model_messages)
+
+    results["stages"] = stages
+    results["replay"] = corpus.stats()
+    if profiler:
+        profiler.dump_stats(args.profile)
+        results["profile"] = args.profile
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Benchmark da gravação de valores FIPE antes e depois da migração 001.
+
+Cria um esquema descartável (`fipe_bench`) em um PostgreSQL local, popula
+`fipe_vehicle_model_value` com um volume realista de linhas (vários meses de
+tabelas de referência) e mede a latência de gravação de lotes de preços:
+
+- antes: caminho antigo do ingestor (SELECT de existência + INSERT/UPDATE por
+  linha), sem índices na tabela;
+- depois: mesmo caminho por linha e o upsert em lote (INSERT ... ON CONFLICT),
+  com o índice único da chave natural e o índice de leitura criados.
+
+Também mede a leitura por código FIPE + tabela de referência. O resultado é
+impresso e gravado em JSON.
+
+Uso:
+    FIPE_BENCH_DSN="dbname=fipe_bench user=postgres" \\
+        python benchmarks/bench_value_table_indexes.py --rows 2000000 --output result.json
+"""
+import os
+import random
+import argparse
+import psycopg2
+from psycopg2.extras import execute_values
+from bench_common import measure, write_results
+
+SCHEMA = "fipe_bench"
+
+CREATE_TABLE_SQL = f"""
+    DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+    CREATE SCHEMA {SCHEMA};
+    CREATE TABLE {SCHEMA}.fipe_vehicle_model_value
+    (
+        id serial PRIMARY KEY,
+        name character varying NOT NULL,
+        model_id integer,
+        code character varying,
+        fipe_code character varying NOT NULL,
+        manufacturer_id integer,
+        manufacture_year character varying,
+        reference_month character varying,
+        reference_month_code character varying,
+        fipe_value double precision,
+        fuel_type character varying,
+        vehicle_type integer,
+        active boolean,
+        create_date timestamp without time zone,
+        write_date timestamp without time zone
+    );
+"""
+
+# Popula a tabela com `rows` linhas distribuídas entre modelos, anos e meses
+SEED_SQL = f"""
+    INSERT INTO {SCHEMA}.fipe_vehicle_model_value (
+        name, model_id, code, fipe_code, manufacturer_id, manufacture_year,
+        reference_month, reference_month_code, fipe_value, fuel_type,
+        vehicle_type, active, create_date
+    )
+    SELECT
+        'Modelo ' || (mod(n, %(models)s)),
+        mod(n, %(models)s),
+        (mod(n, %(models)s))::text,
+        lpad((mod(n, %(models)s))::text, 6, '0') || '-1',
+        mod(n, 100),
+        (1990 + mod(n / %(models)s, 35))::text || '-1',
+        'mes ' || (300 - n / (%(models)s * 35)),
+        (300 - n / (%(models)s * 35))::text,
+        random() * 100000,
+        '1',
+        1,
+        TRUE,
+        NOW()
+    FROM generate_series(0, %(rows)s - 1) AS n
+"""
+
+MIGRATION_SQL = f"""
+    CREATE UNIQUE INDEX fipe_vehicle_model_value_natural_key_unique
+        ON {SCHEMA}.fipe_vehicle_model_value
+        (model_id, fipe_code, manufacture_year, reference_month_code, fuel_type)
+        NULLS NOT DISTINCT;
+    CREATE INDEX fipe_vehicle_model_value_fipe_code_reference_idx
+        ON {SCHEMA}.fipe_vehicle_model_value (fipe_code, reference_month_code);
+    ANALYZE {SCHEMA}.fipe_vehicle_model_value;
+"""
+
+UPSERT_SQL = f"""
+    INSERT INTO {SCHEMA}.fipe_vehicle_model_value (
+        name, code, model_id, fipe_code, manufacturer_id,
+        manufacture_year, reference_month, reference_month_code,
+        fipe_value, fuel_type, vehicle_type, active, create_date
+    ) VALUES %s
+    ON CONFLICT (model_id, fipe_code, manufacture_year, reference_month_code, fuel_type)
+    DO UPDATE SET fipe_value = EXCLUDED.fipe_value, write_date = NOW()
+"""
+UPSERT_TEMPLATE = "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, TRUE, NOW())"
+
+
+def make_batch(models, reference_month_code, batch_size):
+    """Gera um lote de preços de um mês de referência (metade já existente)."""
+    rows = []
+    for _ in range(batch_size):
+        model_id = random.randrange(models)
+        rows.append((
+            f"Modelo {model_id}",
+            str(model_id),
+            model_id,
+            f"{model_id:06d}-1",
+            model_id % 100,
+            f"{random.randrange(1990, 2025)}-1",
+            f"mes {reference_month_code}",
+            str(reference_month_code),
+            random.random() * 100000,
+            "1",
+            1,
+        ))
+    return rows
+
+
+def write_per_row(conn, rows):
+    """Caminho antigo do ingestor: SELECT + UPDATE/INSERT para cada linha."""
+    with conn.cursor() as cur:
+        for row in rows:
+            cur.execute(f"""
+                SELECT id FROM {SCHEMA}.fipe_vehicle_model_value
+                WHERE model_id = %s AND fipe_code = %s AND
+                      manufacture_year = %s AND reference_month_code = %s
+            """, (row[2], row[3], row[5], row[7]))
+            existing = cur.fetchone()
+            if existing:
+                cur.execute(f"""
+                    UPDATE {SCHEMA}.fipe_vehicle_model_value
+                    SET fipe_value = %s, write_date = NOW() WHERE id = %s
+                """, (row[8], existing[0]))
+            else:
+                cur.execute(f"""
+                    INSERT INTO {SCHEMA}.fipe_vehicle_model_value (
+                        name, code, model_id, fipe_code, manufacturer_id,
+                        manufacture_year, reference_month, reference_month_code,
+                        fipe_value, fuel_type, vehicle_type, active, create_date
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, TRUE, NOW())
+                """, row)
+            conn.commit()
+
+
+def write_bulk(conn, rows):
+    """Caminho novo do ingestor: um INSERT ... ON CONFLICT por lote."""
+    unique_rows = {(row[2], row[3], row[5], row[7], row[9]): row for row in rows}
+    with conn.cursor() as cur:
+        execute_values(cur, UPSERT_SQL, list(unique_rows.values()), template=UPSERT_TEMPLATE)
+    conn.commit()
+
+
+def read_by_fipe_code(conn, models, reference_month_code):
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT manufacture_year, fipe_value FROM {SCHEMA}.fipe_vehicle_model_value
+            WHERE fipe_code = %s AND reference_month_code = %s
+        """, (f"{random.randrange(models):06d}-1", str(reference_month_code)))
+        cur.fetchall()
+    conn.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("FIPE_BENCH_DSN", "dbname=fipe_bench"))
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Linhas iniciais da tabela")
+    parser.add_argument("--models", type=int, default=6_000, help="Modelos distintos")
+    parser.add_argument("--batch-size", type=int, default=10, help="Preços por lote SQS")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--output", default="bench_value_table_indexes.json")
+    args = parser.parse_args()
+
+    random.seed(42)
+    conn = psycopg2.connect(args.dsn)
+    conn.autocommit = False
+    with conn.cursor() as cur:
+        cur.execute(CREATE_TABLE_SQL)
+        cur.execute(SEED_SQL, {"rows": args.rows, "models": args.models})
+        cur.execute(f"ANALYZE {SCHEMA}.fipe_vehicle_model_value")
+    conn.commit()
+
+    # Mês de referência mais recente já presente na tabela: metade dos preços
+    # do lote atualiza linhas existentes, como em um reprocessamento
+    reference_month_code = 300
+
+    def batch():
+        return make_batch(args.models, reference_month_code, args.batch_size)
+
+    results = {
+        "benchmark": "value_table_indexes",
+        "rows": args.rows,
+        "models": args.models,
+        "batch_size": args.batch_size,
+        "before": {
+            "per_row_write": measure(lambda: write_per_row(conn, batch()), args.iterations),
+            "read_by_fipe_code": measure(
+                lambda: read_by_fipe_code(conn, args.models, reference_month_code), args.iterations
+            ),
+        },
+    }
+
+    with conn.cursor() as cur:
+        cur.execute(MIGRATION_SQL)
+    conn.commit()
+
+    results["after"] = {
+        "per_row_write": measure(lambda: write_per_row(conn, batch()), args.iterations),
+        "bulk_upsert": measure(lambda: write_bulk(conn, batch()), args.iterations),
+        "read_by_fipe_code": measure(
+            lambda: read_by_fipe_code(conn, args.models, reference_month_code), args.iterations
+        ),
+    }
+
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    conn.commit()
+    conn.close()
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+"""
+Servidor local que simula os endpoints da API FIPE usados pelo FipeAPI.
+
+Serve catálogos sintéticos e determinísticos (marcas, modelos, anos/combustíveis
+e preços) para os cinco endpoints consultados pelas Lambdas:
+
+- ConsultarTabelaDeReferencia
+- ConsultarMarcas
+- ConsultarModelos
+- ConsultarAnoModelo
+- ConsultarValorComTodosParametros
+
+A latência (média e variação) e a taxa de respostas 429 são configuráveis por
+endpoint, assim como o cabeçalho Retry-After. Opcionalmente, o servidor
+também limita a taxa global de requisições (`--rate-limit`), respondendo 429
+quando ela é excedida, como a API real, para exercitar o limitador adaptativo
+do FipeAPI.
+
+As Lambdas usam o servidor pela variável de ambiente URL_FIPE:
+
+    python benchmarks/fipe_mock_server.py --port 8080 --latency-ms 80 \\
+        --endpoint-throttle ConsultarValorComTodosParametros=0.05
+    URL_FIPE=http://localhost:8080/api/veiculos python ...
+
+Configurações também podem ser lidas de um arquivo JSON (`--config`) com as
+mesmas chaves de DEFAULT_CONFIG. `GET /__stats` retorna os contadores de
+requisições, respostas 429 e latência por endpoint; `POST /__reset` os zera.
+"""
+import json
+import time
+import random
+import zlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENDPOINTS = (
+    "ConsultarTabelaDeReferencia",
+    "ConsultarMarcas",
+    "ConsultarModelos",
+    "ConsultarAnoModelo",
+    "ConsultarValorComTodosParametros",
+)
+
+MONTHS = [
+    "janeiro", "fevereiro", "março", "abril", "maio", "junho", "julho",
+    "agosto", "setembro", "outubro", "novembro", "dezembro",
+]
+
+# Combustíveis (código, nome, sigla) por tipo de veículo: 1 carro, 2 moto, 3 caminhão
+FUELS = {
+    1: [("1", "Gasolina", "G"), ("2", "Álcool", "A"), ("3", "Diesel", "D")],
+    2: [("1", "Gasolina", "G")],
+    3: [("3", "Diesel", "D")],
+}
+
+# Ano usado pela FIPE para veículos "zero km"
+ZERO_KM_YEAR = 32000
+
+DEFAULT_CONFIG = {
+    "seed": 42,
+    # Tabela de referência mais recente e quantidade de meses publicados
+    "latest_reference_table": 300,
+    "latest_month": [10, 2026],
+    "reference_tables": 24,
+    # Marcas por tipo de veículo e faixas (mín., máx.) de modelos por marca e
+    # de anos por modelo: cerca de 6 mil modelos e 50 mil preços por mês
+    "brands": {"1": 90, "2": 80, "3": 20},
+    "models_per_brand": [5, 60],
+    "years_per_model": [1, 14],
+    # Comportamento padrão dos endpoints (latência em ms, taxa de 429 entre 0 e 1)
+    "latency_ms": 50.0,
+    "jitter_ms": 20.0,
+    "throttle_rate": 0.0,
+    # Sobrescritas por endpoint: {"ConsultarValorComTodosParametros": {"latency_ms": 120}}
+    "endpoints": {},
+    # Retry-After (segundos) das respostas 429; null omite o cabeçalho
+    "retry_after": 1.0,
+    # Limite global de requisições por segundo (null desabilita)
+    "rate_limit": None,
+    "rate_limit_burst": 5,
+}
+
+
+def _rng(config, *parts):
+    """Gerador determinístico para uma parte do catálogo (mesma entrada, mesma saída)."""
+    key = ":".join(str(part) for part in (config["seed"],) + parts)
+    return random.Random(zlib.crc32(key.encode("utf-8")))
+
+
+def format_brl(cents):
+    """Formata centavos no padrão da API FIPE (ex.: "R$ 45.123,00")."""
+    reais, cents = divmod(int(cents), 100)
+    return f"R$ {reais:,}".replace(",", ".") + f",{cents:02d}"
+
+
+class SyntheticCatalog:
+    """Catálogo sintético da FIPE gerado sob demanda a partir da semente."""
+
+    def __init__(self, config):
+        self.config = config
+
+    def reference_tables(self):
+        month, year = self.config["latest_month"]
+        code = int(self.config["latest_reference_table"])
+        tables = []
+        for _ in range(int(self.config["reference_tables"])):
+            tables.append({"Codigo": code, "Mes": f"{MONTHS[month - 1]}/{year} "})
+            code -= 1
+            month -= 1
+            if month == 0:
+                month, year = 12, year - 1
+        return tables
+
+    def brand_count(self, vehicle_type):
+        return int(self.config["brands"].get(str(vehicle_type), 0))
+
+    def brands(self, vehicle_type):
+        return [
+            {"Label": f"Marca {vehicle_type}-{brand}", "Value": str(brand)}
+            for brand in range(1, self.brand_count(vehicle_type) + 1)
+        ]
+
+    def model_count(self, vehicle_type, brand):
+        low, high = self.config["models_per_brand"]
+        return _rng(self.config, "models", vehicle_type, brand).randint(low, high)
+
+    def models(self, vehicle_type, brand):
+        return [
+            {"Label": f"Modelo {brand}.{model} {vehicle_type}", "Value": brand * 1000 + model}
+            for model in range(1, self.model_count(vehicle_type, brand) + 1)
+        ]
+
+    def years(self, vehicle_type, brand, model):
+        """Pares (ano, combustível) do modelo, do mais recente para o mais antigo."""
+        rng = _rng(self.config, "years", vehicle_type, brand, model)
+        low, high = self.config["years_per_model"]
+        count = rng.randint(low, high)
+        last_year = rng.randint(2000, 2026)
+        fuels = FUELS[vehicle_type]
+        fuel = fuels[0] if len(fuels) == 1 or rng.random() < 0.8 else rng.choice(fuels[1:])
+        years = [last_year - offset for offset in range(count)]
+        if last_year == 2026 and rng.random() < 0.5:
+            years.insert(0, ZERO_KM_YEAR)
+        return [(year, fuel) for year in years]
+
+    def valid_brand(self, vehicle_type, brand):
+        return 1 <= brand <= self.brand_count(vehicle_type)
+
+    def valid_model(self, vehicle_type, brand, model):
+        return self.valid_brand(vehicle_type, brand) and 1 <= model - brand * 1000 <= self.model_count(vehicle_type, brand)
+
+    def price(self, reference_table_code, vehicle_type, brand, model, year, fuel_code):
+        for candidate_year, fuel in self.years(vehicle_type, brand, model):
+            if candidate_year == year and fuel[0] == fuel_code:
+                break
+        else:
+            return None
+        base = _rng(self.config, "price", vehicle_type, brand, model).randint(1_500_000, 40_000_000)
+        age = 0 if year == ZERO_KM_YEAR else max(0, 2026 - year)
+        # Depreciação anual e pequena variação mensal por tabela de referência
+        monthly = _rng(self.config, "month", reference_table_code, brand, model).uniform(0.98, 1.02)
+        cents = round(base * (0.9 ** age) * monthly / 100) * 100
+        _, fuel_name, fuel_initial = fuel
+        table = next(
+            (t for t in self.reference_tables() if t["Codigo"] == reference_table_code),
+            {"Mes": "desconhecido "},
+        )
+        return {
+            "Valor": format_brl(cents),
+            "Marca": f"Marca {vehicle_type}-{brand}",
+            "Modelo": f"Modelo {brand}.{model - brand * 1000} {vehicle_type}",
+            "AnoModelo": year,
+            "Combustivel": fuel_name,
+            "CodigoFipe": f"{brand:03d}{(model - brand * 1000):03d}-{model % 10}",
+            "MesReferencia": table["Mes"].replace("/", " de "),
+            "Autenticacao": f"{zlib.crc32(f'{brand}{model}{year}'.encode()):08x}",
+            "TipoVeiculo": vehicle_type,
+            "SiglaCombustivel": fuel_initial,
+            "DataConsulta": time.strftime("%d/%m/%Y %H:%M"),
+        }
+
+
+def not_found():
+    # A API real responde 200 com um objeto de erro para parâmetros inexistentes
+    return {"codigo": "0", "erro": "nadaencontrado"}
+
+
+class MockState:
+    """Comportamento configurado e contadores do servidor (compartilhados entre threads)."""
+
+    def __init__(self, config):
+        self.config = config
+        self.catalog = SyntheticCatalog(config)
+        self.random = random.Random(config["seed"])
+        self._lock = threading.Lock()
+        self.tokens = float(config["rate_limit_burst"])
+        self.updated_at = time.monotonic()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stats = {
+                endpoint: {"requests": 0, "throttled": 0, "latency_ms_total": 0.0}
+                for endpoint in ENDPOINTS
+            }
+            self.started_at = time.monotonic()
+
+    def behavior(self, endpoint):
+        overrides = self.config["endpoints"].get(endpoint, {})
+        return {
+            key: overrides.get(key, self.config[key])
+            for key in ("latency_ms", "jitter_ms", "throttle_rate")
+        }
+
+    def admit(self, endpoint):
+        """
+        Decide se a requisição é atendida ou limitada.
+
+        Returns:
+            tuple: (True, None) para atender ou (False, retry_after) para 429
+        """
+        behavior = self.behavior(endpoint)
+        with self._lock:
+            self.stats[endpoint]["requests"] += 1
+            rate_limit = self.config["rate_limit"]
+            if rate_limit:
+                now = time.monotonic()
+                self.tokens = min(
+                    float(self.config["rate_limit_burst"]),
+                    self.tokens + (now - self.updated_at) * rate_limit,
+                )
+                self.updated_at = now
+                if self.tokens < 1:
+                    self.stats[endpoint]["throttled"] += 1
+                    return False, (1 - self.tokens) / rate_limit
+                self.tokens -= 1
+            if self.random.random() < behavior["throttle_rate"]:
+                self.stats[endpoint]["throttled"] += 1
+                return False, self.config["retry_after"]
+        return True, None
+
+    def delay(self, endpoint):
+        """Latência simulada (segundos) de uma resposta do endpoint."""
+        behavior = self.behavior(endpoint)
+        with self._lock:
+            latency_ms = max(0.0, self.random.gauss(behavior["latency_ms"], behavior["jitter_ms"]))
+            self.stats[endpoint]["latency_ms_total"] += latency_ms
+        return latency_ms / 1000
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = time.monotonic() - self.started_at
+            endpoints = {}
+            for endpoint, values in self.stats.items():
+                served = values["requests"] - values["throttled"]
+                endpoints[endpoint] = {
+                    "requests": values["requests"],
+                    "throttled": values["throttled"],
+                    "mean_latency_ms": round(values["latency_ms_total"] / served, 3) if served else None,
+                }
+            total = sum(values["requests"] for values in self.stats.values())
+            return {
+                "elapsed_seconds": round(elapsed, 3),
+                "requests": total,
+                "requests_per_second": round(total / elapsed, 3) if elapsed else None,
+                "throttled": sum(values["throttled"] for values in self.stats.values()),
+                "endpoints": endpoints,
+            }
+
+    def respond(self, endpoint, payload):
+        """Resposta do endpoint para o payload recebido (sem latência/429)."""
+        catalog = self.catalog
+        if endpoint == "ConsultarTabelaDeReferencia":
+            return catalog.reference_tables()
+        try:
+            vehicle_type = int(payload["codigoTipoVeiculo"])
+            if endpoint == "ConsultarMarcas":
+                return catalog.brands(vehicle_type) if vehicle_type in FUELS else not_found()
+            brand = int(payload["codigoMarca"])
+            if endpoint == "ConsultarModelos":
+                if not catalog.valid_brand(vehicle_type, brand):
+                    return not_found()
+                models = catalog.models(vehicle_type, brand)
+                return {"Modelos": models, "Anos": []}
+            model = int(payload["codigoModelo"])
+            if not catalog.valid_model(vehicle_type, brand, model):
+                return not_found()
+            if endpoint == "ConsultarAnoModelo":
+                return [
+                    {"Label": f"{year} {fuel_name}", "Value": f"{year}-{fuel_code}"}
+                    for year, (fuel_code, fuel_name, _) in catalog.years(vehicle_type, brand, model)
+                ]
+            price = catalog.price(
+                int(payload["codigoTabelaReferencia"]),
+                vehicle_type,
+                brand,
+                model,
+                int(payload["anoModelo"]),
+                str(payload["codigoTipoCombustivel"]),
+            )
+            return price or not_found()
+        except (KeyError, TypeError, ValueError):
+            return {"codigo": "2", "erro": "Parâmetros inválidos"}
+
+
+def make_handler(state):
+    class FipeMockHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, headers=None):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("__stats"):
+                self._send(200, state.snapshot())
+            else:
+                self._send(404, {"erro": "endpoint desconhecido"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            endpoint = self.path.rstrip("/").rsplit("/", 1)[-1]
+            if endpoint == "__reset":
+                state.reset()
+                self._send(200, {"reset": True})
+                return
+            if endpoint not in ENDPOINTS:
+                self._send(404, {"erro": "endpoint desconhecido"})
+                return
+
+            admitted, retry_after = state.admit(endpoint)
+            if not admitted:
+                headers = {}
+                if retry_after is not None:
+                    headers["Retry-After"] = f"{retry_after:.3f}".rstrip("0").rstrip(".")
+                self._send(429, {"erro": "Too Many Requests"}, headers)
+                return
+
+            time.sleep(state.delay(endpoint))
+            try:
+                payload = json.loads(raw) if raw else {}
+            except ValueError:
+                payload = {}
+            self._send(200, state.respond(endpoint, payload))
+
+    return FipeMockHandler
+
+
+def load_config(path=None, **overrides):
+    """Combina DEFAULT_CONFIG, o arquivo JSON `path` e as sobrescritas informadas."""
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            config.update(json.load(f))
+    for key, value in overrides.items():
+        if key == "endpoints":
+            for endpoint, behavior in value.items():
+                config["endpoints"].setdefault(endpoint, {}).update(behavior)
+        elif value is not None:
+            config[key] = value
+    unknown = set(config["endpoints"]) - set(ENDPOINTS)
+    if unknown:
+        raise ValueError(f"Endpoints desconhecidos: {sorted(unknown)}")
+    return config
+
+
+def start_mock_server(config=None, host="127.0.0.1", port=0):
+    """
+    Inicia o servidor em uma thread de fundo (uso em benchmarks e testes).
+
+    Returns:
+        tuple: (servidor, estado, URL base para URL_FIPE); encerre com
+        `servidor.shutdown()`
+    """
+    state = MockState(config or load_config())
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://{server.server_address[0]}:{server.server_address[1]}/api/veiculos"
+    return server, state, url
+
+
+def _parse_endpoint_values(values, key, cast=float):
+    overrides = {}
+    for item in values or []:
+        endpoint, _, value = item.partition("=")
+        overrides.setdefault(endpoint, {})[key] = cast(value)
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--config", help="Arquivo JSON com as chaves de DEFAULT_CONFIG")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--latency-ms", type=float, help="Latência média das respostas")
+    parser.add_argument("--jitter-ms", type=float, help="Desvio padrão da latência")
+    parser.add_argument("--throttle-rate", type=float, help="Fração de respostas 429 (0 a 1)")
+    parser.add_argument("--retry-after", help="Retry-After (s) das respostas 429, ou 'none' para omitir")
+    parser.add_argument("--rate-limit", type=float, help="Limite global de requisições por segundo")
+    parser.add_argument("--endpoint-latency", action="append", metavar="ENDPOINT=MS",
+                        help="Latência média de um endpoint (pode ser repetido)")
+    parser.add_argument("--endpoint-throttle", action="append", metavar="ENDPOINT=RATE",
+                        help="Fração de 429 de um endpoint (pode ser repetido)")
+    args = parser.parse_args()
+
+    endpoints = _parse_endpoint_values(args.endpoint_latency, "latency_ms")
+    for endpoint, behavior in _parse_endpoint_values(args.endpoint_throttle, "throttle_rate").items():
+        endpoints.setdefault(endpoint, {}).update(behavior)
+
+    retry_after = args.retry_after
+    if retry_after is not None:
+        retry_after = None if retry_after.lower() == "none" else float(retry_after)
+
+    config = load_config(
+        args.config,
+        seed=args.seed,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        throttle_rate=args.throttle_rate,
+        rate_limit=args.rate_limit,
+        endpoints=endpoints,
+    )
+    if args.retry_after is not None:
+        config["retry_after"] = retry_after
+
+    state = MockState(config)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    print(f"API FIPE simulada em http://{args.host}:{args.port}/api/veiculos")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(state.snapshot(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
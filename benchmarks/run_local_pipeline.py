@@ -0,0 +1,555 @@
+"""
+Executa o pipeline completo (as quatro Lambdas) em um único processo.
+
+Os `lambda_handler`s do FipeManufacturerLoader, FipeModelLoader,
+FipePriceLoader e FipeSomaIngestor são ligados por filas em memória que
+reproduzem a semântica usada pelo pipeline no SQS:
+
+- lotes de até `--batch-size` mensagens, com janela de agrupamento;
+- `batchItemFailures`: somente as mensagens reportadas voltam à fila, após
+  o visibility timeout (300 s, como nas filas do CDK);
+- `DelaySeconds` (reagendamentos de 429) e `ChangeMessageVisibility`;
+- após 5 recebimentos (`maxReceiveCount`) a mensagem vai para a DLQ.
+
+Cada fila é consumida por `--*-workers` threads, cada uma equivalente a uma
+instância concorrente da Lambda. O ingestor grava em um PostgreSQL local
+(`FIPE_BENCH_DSN` ou `--dsn`; `--init-schema` aplica sql/create_fipe_db.sql);
+sem banco, as mensagens de preço são apenas contadas e descartadas.
+
+Ao final são reportados a vazão de cada etapa, a profundidade das filas ao
+longo do tempo (amostrada a cada `--sample-interval` segundos) e o tempo
+total do crawl, do início do FipeManufacturerLoader até todas as filas
+esvaziarem, além das métricas das etapas (latência e 429s por endpoint da
+API FIPE, envios ao SQS e linhas/s do ingestor). Com `--mock`, a API FIPE simulada (`fipe_mock_server.py`) é
+iniciada no mesmo processo.
+
+Uso:
+    FIPE_BENCH_DSN="dbname=fipe_local user=postgres" \\
+        python benchmarks/run_local_pipeline.py --mock --init-schema \\
+        --price-workers 8 --delay-scale 0.01 --output pipeline.json
+
+As demais configurações das Lambdas (FIPE_RATE_LIMIT, FIPE_ASYNC_ENABLED,
+FIPE_PACK_MESSAGES, ...) são lidas do ambiente, como na AWS. Note que todas
+as etapas compartilham o limitador de taxa do processo, como instâncias
+atrás de um único IP.
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import uuid
+import logging
+import argparse
+import threading
+from collections import deque
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+LAMBDA_SRC = os.path.join(ROOT_DIR, "code_lambdas", "src", "fipe_api")
+SCHEMA_FILE = os.path.join(ROOT_DIR, "sql", "create_fipe_db.sql")
+
+# Filas do pipeline (nomes das filas do CDK) e a Lambda que consome cada uma
+QUEUE_MANUFACTURER = "manufacturer"
+QUEUE_MODEL = "model"
+QUEUE_PRICE = "price"
+QUEUES = (QUEUE_MANUFACTURER, QUEUE_MODEL, QUEUE_PRICE)
+
+# URL única usada como SQS_INPUT_URL/SQS_OUTPUT_URL de todas as Lambdas: o
+# cliente em memória encaminha cada mensagem para a fila pelo conteúdo
+PIPELINE_QUEUE_URL = "local://fipe-pipeline"
+QUEUE_ARN_PREFIX = "arn:aws:sqs:local:000000000000:fipe-{}-queue-local"
+
+# Parâmetros das filas e funções no CDK (fipe_api_stack.py)
+VISIBILITY_TIMEOUT = 300
+MAX_RECEIVE_COUNT = 5
+LAMBDA_TIMEOUT = 300
+
+
+def route_message(body):
+    """
+    Fila de destino de uma mensagem, pelo conteúdo: registros de preço (ou
+    empacotados) vão ao ingestor, modelos ao FipePriceLoader e marcas ao
+    FipeModelLoader.
+    """
+    message = json.loads(body)
+    if "format" in message or "fipe_value" in message:
+        return QUEUE_PRICE
+    if "model_code" in message:
+        return QUEUE_MODEL
+    if "codigoMarca" in message:
+        return QUEUE_MANUFACTURER
+    raise ValueError(f"Mensagem sem fila de destino: {body[:200]}")
+
+
+def queue_from_url(url):
+    """Fila a partir da URL derivada do eventSourceARN (fipe-<fila>-queue-local)."""
+    name = url.rstrip("/").rsplit("/", 1)[-1]
+    for queue in QUEUES:
+        if name == f"fipe-{queue}-queue-local":
+            return queue
+    return None
+
+
+class InMemoryQueue:
+    """Fila SQS em memória: mensagens visíveis, atrasadas e em processamento."""
+
+    def __init__(self, name, delay_scale=1.0, visibility_timeout=VISIBILITY_TIMEOUT,
+                 max_receive_count=MAX_RECEIVE_COUNT):
+        self.name = name
+        self.delay_scale = delay_scale
+        self.visibility_timeout = visibility_timeout
+        self.max_receive_count = max_receive_count
+        self.sent = 0
+        self.deleted = 0
+        self.redelivered = 0
+        self.dead_letters = []
+        self._ready = deque()
+        self._delayed = []
+        self._in_flight = {}
+        self._sequence = 0
+        self._cond = threading.Condition()
+
+    def send(self, body, delay_seconds=0):
+        message = {"messageId": str(uuid.uuid4()), "body": body, "receive_count": 0}
+        with self._cond:
+            self.sent += 1
+            self._push(message, delay_seconds)
+
+    def _push(self, message, delay_seconds):
+        if delay_seconds > 0:
+            self._sequence += 1
+            ready_at = time.monotonic() + delay_seconds * self.delay_scale
+            heapq.heappush(self._delayed, (ready_at, self._sequence, message))
+        else:
+            self._ready.append(message)
+        self._cond.notify_all()
+
+    def _promote(self):
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            self._ready.append(heapq.heappop(self._delayed)[2])
+
+    def receive(self, max_messages, batch_window, stop):
+        """
+        Recebe até `max_messages` mensagens, aguardando até `batch_window`
+        segundos para completar o lote (como o MaximumBatchingWindow).
+        """
+        deadline = time.monotonic() + batch_window
+        with self._cond:
+            while not stop.is_set():
+                self._promote()
+                remaining = deadline - time.monotonic()
+                if len(self._ready) >= max_messages or (self._ready and remaining <= 0):
+                    break
+                if remaining <= 0:
+                    return []
+                timeout = remaining
+                if self._delayed:
+                    timeout = min(timeout, max(0.0, self._delayed[0][0] - time.monotonic()))
+                self._cond.wait(timeout)
+            batch = []
+            while self._ready and len(batch) < max_messages:
+                message = self._ready.popleft()
+                message["receive_count"] += 1
+                receipt = str(uuid.uuid4())
+                self._in_flight[receipt] = {"message": message, "visibility": None}
+                batch.append((receipt, message))
+            return batch
+
+    def change_visibility(self, receipt, timeout):
+        with self._cond:
+            if receipt in self._in_flight:
+                self._in_flight[receipt]["visibility"] = timeout
+
+    def complete(self, receipt, failed):
+        """Remove a mensagem (sucesso) ou a devolve após o visibility timeout."""
+        with self._cond:
+            entry = self._in_flight.pop(receipt)
+            if not failed:
+                self.deleted += 1
+            elif entry["message"]["receive_count"] >= self.max_receive_count:
+                self.dead_letters.append(entry["message"])
+            else:
+                self.redelivered += 1
+                visibility = entry["visibility"]
+                self._push(entry["message"], self.visibility_timeout if visibility is None else visibility)
+            self._cond.notify_all()
+
+    def depth(self):
+        with self._cond:
+            return {
+                "visible": len(self._ready),
+                "delayed": len(self._delayed),
+                "in_flight": len(self._in_flight),
+            }
+
+    def idle(self):
+        with self._cond:
+            return not (self._ready or self._delayed or self._in_flight)
+
+
+class InMemorySqsClient:
+    """Subconjunto do cliente SQS do boto3 usado pelas Lambdas."""
+
+    def __init__(self, queues, discard_prices=False):
+        self.queues = queues
+        self.discard_prices = discard_prices
+        self.discarded = 0
+        self._receipts = {}
+        self._lock = threading.Lock()
+
+    def _queue(self, url, body):
+        name = queue_from_url(url) or route_message(body)
+        if name == QUEUE_PRICE and self.discard_prices:
+            with self._lock:
+                self.discarded += 1
+            return None
+        return self.queues[name]
+
+    def send_message(self, QueueUrl, MessageBody, DelaySeconds=0, **kwargs):
+        queue = self._queue(QueueUrl, MessageBody)
+        if queue:
+            queue.send(MessageBody, DelaySeconds)
+        return {"MessageId": str(uuid.uuid4())}
+
+    def send_message_batch(self, QueueUrl, Entries, **kwargs):
+        successful = []
+        for entry in Entries:
+            self.send_message(QueueUrl, entry["MessageBody"], entry.get("DelaySeconds", 0))
+            successful.append({"Id": entry["Id"], "MessageId": str(uuid.uuid4())})
+        return {"Successful": successful}
+
+    def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout, **kwargs):
+        queue = self._receipts.get(ReceiptHandle)
+        if queue:
+            queue.change_visibility(ReceiptHandle, VisibilityTimeout)
+        return {}
+
+    def register(self, receipt, queue):
+        with self._lock:
+            self._receipts[receipt] = queue
+
+    def unregister(self, receipt):
+        with self._lock:
+            self._receipts.pop(receipt, None)
+
+
+class LocalContext:
+    """Contexto da Lambda com o prazo de execução da invocação."""
+
+    def __init__(self, function_name, timeout=LAMBDA_TIMEOUT):
+        self.function_name = function_name
+        self.invoked_function_arn = f"arn:aws:lambda:local:000000000000:function:{function_name}"
+        self.aws_request_id = str(uuid.uuid4())
+        self._deadline = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+class StageStats:
+    """Contadores de uma etapa (fila + Lambda consumidora)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.invocations = 0
+        self.messages = 0
+        self.failures = 0
+        self.errors = 0
+        self.handler_seconds = 0.0
+        self.first_start = None
+        self.last_end = None
+        self._lock = threading.Lock()
+
+    def record(self, start, end, messages, failures, error=False):
+        with self._lock:
+            self.invocations += 1
+            self.messages += messages
+            self.failures += failures
+            self.errors += int(error)
+            self.handler_seconds += end - start
+            self.first_start = start if self.first_start is None else min(self.first_start, start)
+            self.last_end = end if self.last_end is None else max(self.last_end, end)
+
+    def report(self):
+        active = (self.last_end - self.first_start) if self.first_start is not None else 0.0
+        return {
+            "invocations": self.invocations,
+            "messages": self.messages,
+            "failed_messages": self.failures,
+            "handler_errors": self.errors,
+            "active_seconds": round(active, 3),
+            "messages_per_second": round(self.messages / active, 2) if active else 0.0,
+            "mean_invocation_seconds": round(self.handler_seconds / self.invocations, 3) if self.invocations else 0.0,
+        }
+
+
+def stage_worker(name, handler, queue, sqs_client, stats, args, stop):
+    """Consome a fila como uma instância da Lambda: um lote por invocação."""
+    arn = QUEUE_ARN_PREFIX.format(queue.name)
+    while not stop.is_set():
+        batch = queue.receive(args.batch_size, args.batch_window, stop)
+        if not batch:
+            continue
+        records = []
+        for receipt, message in batch:
+            sqs_client.register(receipt, queue)
+            records.append({
+                "messageId": message["messageId"],
+                "receiptHandle": receipt,
+                "body": message["body"],
+                "attributes": {"ApproximateReceiveCount": str(message["receive_count"])},
+                "eventSource": "aws:sqs",
+                "eventSourceARN": arn,
+            })
+
+        start = time.monotonic()
+        error = False
+        try:
+            result = handler({"Records": records}, LocalContext(name, args.lambda_timeout)) or {}
+            failed = {failure["itemIdentifier"] for failure in result.get("batchItemFailures", [])}
+        except Exception:
+            logging.exception(f"Erro não tratado em {name}")
+            error = True
+            failed = {record["messageId"] for record in records}
+        end = time.monotonic()
+        stats.record(start, end, len(records), len(failed), error)
+
+        for receipt, message in batch:
+            sqs_client.unregister(receipt)
+            queue.complete(receipt, message["messageId"] in failed)
+
+
+def configure_environment(args, fipe_url):
+    """Variáveis de ambiente lidas pelas Lambdas (antes de importá-las)."""
+    os.environ["SQS_INPUT_URL"] = PIPELINE_QUEUE_URL
+    os.environ["SQS_OUTPUT_URL"] = PIPELINE_QUEUE_URL
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    if fipe_url:
+        os.environ["URL_FIPE"] = fipe_url
+    if args.sample:
+        os.environ["TEST"] = "true"
+    # Métricas das etapas acumuladas em memória e incluídas no relatório
+    os.environ["FIPE_METRICS"] = "local"
+    if args.dsn:
+        from psycopg2.extensions import parse_dsn
+
+        params = parse_dsn(args.dsn)
+        os.environ["RDS_HOST"] = params.get("host", "localhost")
+        os.environ["RDS_PORT"] = str(params.get("port", "5432"))
+        os.environ["RDS_DATABASE"] = params["dbname"]
+        os.environ["RDS_USER"] = params.get("user", os.getenv("USER", "postgres"))
+        os.environ["DB_PASSWORD"] = params.get("password") or os.getenv("PGPASSWORD", "")
+    else:
+        # Sem banco: registro de idempotência e progresso ficam desabilitados
+        os.environ.pop("RDS_HOST", None)
+
+
+def init_schema():
+    from fipe_soma_ingestor import get_db_connection
+
+    conn = get_db_connection()
+    with open(SCHEMA_FILE, "r", encoding="utf-8") as f:
+        schema = f.read()
+    with conn.cursor() as cur:
+        cur.execute(schema)
+    conn.commit()
+    conn.close()
+
+
+def count_values():
+    from fipe_soma_ingestor import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) FROM public.fipe_vehicle_model_value")
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def run_pipeline(args, fipe_url=None):
+    """
+    Executa um crawl completo e retorna o relatório.
+
+    Returns:
+        dict: Vazão por etapa, profundidade das filas ao longo do tempo e
+        tempo total do crawl
+    """
+    configure_environment(args, fipe_url)
+    sys.path.insert(0, LAMBDA_SRC)
+    from fipe_api_service import FipeAPI
+    from metrics import get_metrics
+    import fipe_manufacturer_loader
+    import fipe_model_loader
+    import fipe_price_loader
+
+    if args.dsn and args.init_schema:
+        init_schema()
+    values_before = count_values() if args.dsn else 0
+
+    queues = {name: InMemoryQueue(name, delay_scale=args.delay_scale,
+                                  visibility_timeout=args.visibility_timeout)
+              for name in QUEUES}
+    sqs_client = InMemorySqsClient(queues, discard_prices=not args.dsn)
+    FipeAPI.sqs_client = sqs_client
+
+    stages = [
+        ("FipeModelLoader", fipe_model_loader.lambda_handler, QUEUE_MANUFACTURER, args.model_workers),
+        ("FipePriceLoader", fipe_price_loader.lambda_handler, QUEUE_MODEL, args.price_workers),
+    ]
+    if args.dsn:
+        import fipe_soma_ingestor
+
+        stages.append(("FipeSomaIngestor", fipe_soma_ingestor.lambda_handler, QUEUE_PRICE, args.ingest_workers))
+    stats = {name: StageStats(name) for name, _, _, _ in stages}
+
+    stop = threading.Event()
+    threads = []
+    for name, handler, queue_name, workers in stages:
+        for index in range(workers):
+            thread = threading.Thread(
+                target=stage_worker,
+                args=(name, handler, queues[queue_name], sqs_client, stats[name], args, stop),
+                name=f"{name}-{index}",
+                daemon=True,
+            )
+            thread.start()
+            threads.append(thread)
+
+    started = time.monotonic()
+    samples = []
+
+    def sample():
+        samples.append({
+            "t": round(time.monotonic() - started, 3),
+            **{name: queue.depth() for name, queue in queues.items()},
+        })
+
+    event = {"mes": args.month, "ano": args.year}
+    if args.vehicle_types:
+        event["vehicle_types"] = [int(vt) for vt in args.vehicle_types.split(",")]
+    manufacturer_result = fipe_manufacturer_loader.lambda_handler(
+        event, LocalContext("FipeManufacturerLoader", args.lambda_timeout)
+    )
+    manufacturer_seconds = time.monotonic() - started
+    if manufacturer_result.get("statusCode") != 200:
+        stop.set()
+        raise RuntimeError(f"FipeManufacturerLoader falhou: {manufacturer_result}")
+
+    while True:
+        sample()
+        if all(queue.idle() for queue in queues.values()):
+            break
+        if args.max_seconds and time.monotonic() - started > args.max_seconds:
+            logging.warning(f"Tempo máximo de {args.max_seconds}s atingido; encerrando com filas pendentes")
+            break
+        time.sleep(args.sample_interval)
+    crawl_seconds = time.monotonic() - started
+    completed = all(queue.idle() for queue in queues.values())
+
+    stop.set()
+    if completed:
+        # Com as filas vazias os workers estão apenas aguardando mensagens; do
+        # contrário, as invocações em andamento são abandonadas (threads daemon)
+        for thread in threads:
+            thread.join()
+
+    report = {
+        "config": {
+            "model_workers": args.model_workers,
+            "price_workers": args.price_workers,
+            "ingest_workers": args.ingest_workers if args.dsn else 0,
+            "batch_size": args.batch_size,
+            "batch_window": args.batch_window,
+            "delay_scale": args.delay_scale,
+            "fipe_url": os.environ.get("URL_FIPE"),
+            "async_enabled": fipe_price_loader.ASYNC_ENABLED,
+        },
+        "crawl_seconds": round(crawl_seconds, 3),
+        "completed": completed,
+        "manufacturer_loader": {
+            "seconds": round(manufacturer_seconds, 3),
+            "messages": manufacturer_result.get("message_count"),
+            "failed_vehicle_types": manufacturer_result.get("failed_vehicle_types"),
+        },
+        "stages": {name: stage.report() for name, stage in stats.items()},
+        "queues": {
+            name: {
+                "sent": queue.sent,
+                "deleted": queue.deleted,
+                "redelivered": queue.redelivered,
+                "dead_letters": len(queue.dead_letters),
+                "max_depth": max((s[name]["visible"] + s[name]["delayed"] for s in samples), default=0),
+            }
+            for name, queue in queues.items()
+        },
+        "queue_depth": samples,
+        "metrics": get_metrics().snapshot(),
+    }
+    if args.dsn:
+        report["ingested_values"] = count_values() - values_before
+    else:
+        report["discarded_price_messages"] = sqs_client.discarded
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("FIPE_BENCH_DSN"),
+                        help="PostgreSQL local do ingestor (padrão: FIPE_BENCH_DSN)")
+    parser.add_argument("--init-schema", action="store_true", help="Aplica sql/create_fipe_db.sql antes do crawl")
+    parser.add_argument("--mock", action="store_true", help="Inicia a API FIPE simulada no processo")
+    parser.add_argument("--mock-config", help="Arquivo JSON de configuração da API simulada")
+    parser.add_argument("--mock-latency-ms", type=float, help="Latência média da API simulada")
+    parser.add_argument("--mock-throttle-rate", type=float, help="Fração de 429 da API simulada")
+    parser.add_argument("--month", type=int, default=0, help="Mês de referência (0 = mais recente)")
+    parser.add_argument("--year", type=int, default=0, help="Ano de referência (0 = mais recente)")
+    parser.add_argument("--vehicle-types", help="Tipos de veículo separados por vírgula (padrão: 1,2,3)")
+    parser.add_argument("--sample", action="store_true", help="Modo TEST das Lambdas (poucas marcas e modelos)")
+    parser.add_argument("--model-workers", type=int, default=2)
+    parser.add_argument("--price-workers", type=int, default=4)
+    parser.add_argument("--ingest-workers", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--batch-window", type=float, default=1.0,
+                        help="Janela de agrupamento dos lotes, em segundos (30 s no CDK)")
+    parser.add_argument("--lambda-timeout", type=float, default=LAMBDA_TIMEOUT)
+    parser.add_argument("--visibility-timeout", type=float, default=VISIBILITY_TIMEOUT)
+    parser.add_argument("--delay-scale", type=float, default=1.0,
+                        help="Fator aplicado a DelaySeconds e ao visibility timeout (ex.: 0.01)")
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--max-seconds", type=float, help="Encerra o crawl após este tempo")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", default="pipeline_results.json")
+    args = parser.parse_args()
+
+    # O nível é aplicado no handler: as Lambdas (e o FipeAPI, a cada instância)
+    # elevam o nível dos próprios loggers para INFO
+    handler = logging.StreamHandler()
+    handler.setLevel(args.log_level)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(threadName)s %(levelname)s %(message)s"))
+    logging.getLogger().addHandler(handler)
+    fipe_url = None
+    server = None
+    if args.mock:
+        from fipe_mock_server import load_config, start_mock_server
+
+        config = load_config(args.mock_config, latency_ms=args.mock_latency_ms,
+                             throttle_rate=args.mock_throttle_rate)
+        server, _, fipe_url = start_mock_server(config)
+
+    try:
+        report = run_pipeline(args, fipe_url)
+    finally:
+        if server:
+            server.shutdown()
+
+    from bench_common import write_results
+
+    write_results(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
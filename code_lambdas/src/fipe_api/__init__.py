@@ -16,10 +16,23 @@ Este pacote contém as seguintes Lambdas:
 - fipe_model_loader: Carrega modelos da API FIPE
 - fipe_price_loader: Carrega preços da API FIPE
 - fipe_soma_ingestor: Insere dados da API FIPE no banco de dados
+- fipe_crawl_resume: Reenfileira as unidades não concluídas de uma execução do crawl
 
 Além das funções de suporte:
 - fipe_api_service: Cliente para a API FIPE
+- async_fipe_api_service: Cliente assíncrono (httpx) para a API FIPE
 - get_db_password: Utilitário para obter a senha do banco de dados do Secrets Manager
+- catalog_cache: Cache persistente de marcas, modelos e anos/combustíveis da API FIPE
+- retry_scheduler: Reagendamento de mensagens limitadas (429) via SQS DelaySeconds
+- time_budget: Controle do tempo restante da invocação e mensagens de continuação
+- rate_limiter: Limitador de taxa adaptativo (token bucket/AIMD) para a API FIPE
+- dimension_cache: Cache em memória dos IDs de fabricantes e modelos usado pelo ingestor
+- message_packing: Empacotamento (e compressão) de vários registros por mensagem SQS
+- sqs_sender: Envio paralelo de lotes SQS limitados por quantidade e tamanho
+- idempotency_ledger: Registro de idempotência que ignora entregas duplicadas do SQS
+- crawl_progress: Progresso de cada execução do crawl (marcas, modelos e pares ano/combustível)
+- fixture_corpus: Gravação e reprodução das respostas da API FIPE (benchmarks sem rede)
+- metrics: Métricas das etapas (latência, 429s, mensagens e linhas/s) em CloudWatch EMF ou em memória
 """
 
 __version__ = '1.0.0'
@@ -28,5 +41,18 @@ from . import fipe_manufacturer_loader
 from . import fipe_model_loader
 from . import fipe_price_loader
 from . import fipe_soma_ingestor
+from . import fipe_crawl_resume
 from . import fipe_api_service
-from . import get_db_password
\ No newline at end of file
+from . import async_fipe_api_service
+from . import get_db_password
+from . import rate_limiter
+from . import catalog_cache
+from . import retry_scheduler
+from . import time_budget
+from . import dimension_cache
+from . import message_packing
+from . import sqs_sender
+from . import idempotency_ledger
+from . import crawl_progress
+from . import fixture_corpus
+from . import metrics
\ No newline at end of file
@@ -0,0 +1,167 @@
+import os
+import copy
+import time
+import asyncio
+import logging
+import httpx
+from fipe_api_service import (
+    DEFAULT_POOL_SIZE,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_READ_TIMEOUT,
+    parse_years,
+    build_years_payload,
+    build_price_payload,
+)
+from rate_limiter import get_shared_rate_limiter, parse_retry_after
+from catalog_cache import get_catalog_cache
+from fixture_corpus import fixture_async_client, fixture_rate_limiter
+from metrics import get_metrics, record_api_call
+from time_budget import TimeBudget, TimeBudgetExceeded
+
+# Número máximo de consultas simultâneas à API FIPE
+DEFAULT_CONCURRENCY = int(os.getenv("FIPE_PRICE_CONCURRENCY", "8"))
+
+
+class AsyncFipeAPI:
+    """
+    Variante assíncrona do FipeAPI, baseada em httpx.AsyncClient.
+
+    As requisições são limitadas por um semáforo (`concurrency`) e pelo
+    mesmo limitador de taxa compartilhado usado pelo cliente síncrono.
+    Deve ser usada como gerenciador de contexto assíncrono:
+
+        async with AsyncFipeAPI(reference_table_code) as api:
+            price = await api.get_price(...)
+
+    Use `for_reference` para consultar outra tabela de referência reaproveitando
+    o mesmo cliente HTTP, semáforo e limitador de taxa.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(
+        self,
+        reference_table_code=None,
+        reference_month_name="Desconhecido",
+        concurrency=None,
+        rate_limiter=None,
+        client=None,
+        pool_size=None,
+        connect_timeout=None,
+        read_timeout=None,
+        catalog_cache=None,
+        time_budget=None,
+        metrics=None,
+    ):
+        self.logger.setLevel(logging.INFO)
+        self.url_base = os.getenv("URL_FIPE")
+        if not bool(self.url_base):
+            raise ValueError("Variável de ambiente URL_FIPE nao definida")
+        self.reference_table_code = reference_table_code
+        self.reference_month_name = reference_month_name
+        self.concurrency = int(concurrency or DEFAULT_CONCURRENCY)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.rate_limiter = rate_limiter or fixture_rate_limiter() or get_shared_rate_limiter()
+        self.catalog_cache = catalog_cache or get_catalog_cache()
+        self.time_budget = time_budget or TimeBudget()
+        self.metrics = metrics or get_metrics()
+        self._owns_client = client is None
+        pool_size = int(pool_size or max(DEFAULT_POOL_SIZE, self.concurrency))
+        self.client = client or fixture_async_client(
+            lambda: httpx.AsyncClient(
+                timeout=httpx.Timeout(
+                    read_timeout or DEFAULT_READ_TIMEOUT,
+                    connect=connect_timeout or DEFAULT_CONNECT_TIMEOUT,
+                ),
+                limits=httpx.Limits(
+                    max_connections=pool_size, max_keepalive_connections=pool_size
+                ),
+                headers={"Accept-Encoding": "gzip, deflate"},
+            )
+        )
+
+    def for_reference(self, reference_table_code, reference_month_name=None):
+        """Retorna uma cópia do cliente apontando para outra tabela de referência."""
+        api = copy.copy(self)
+        api.reference_table_code = reference_table_code
+        api.reference_month_name = reference_month_name or "Desconhecido"
+        api._owns_client = False
+        return api
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        if self._owns_client:
+            await self.client.aclose()
+
+    async def _post(self, endpoint, payload=None):
+        """
+        Executa um POST assíncrono respeitando o semáforo e o limitador de taxa.
+
+        Levanta TimeBudgetExceeded, sem chamar a API, se o tempo da invocação
+        se esgotou enquanto a requisição aguardava sua vez.
+        """
+        url = f"{self.url_base}/{endpoint}"
+        async with self.semaphore:
+            await self.rate_limiter.acquire_async()
+            if self.time_budget.exhausted():
+                raise TimeBudgetExceeded()
+            start = time.monotonic()
+            try:
+                response = await self.client.post(url, json=payload)
+            except Exception:
+                record_api_call(self.metrics, endpoint, payload, None, start)
+                raise
+        record_api_call(self.metrics, endpoint, payload, response.status_code, start)
+        if response.status_code == 429:
+            self.rate_limiter.on_throttle(
+                parse_retry_after(response.headers.get("Retry-After"))
+            )
+        response.raise_for_status()
+        self.rate_limiter.on_success()
+        return response.json()
+
+    async def get_years(self, manufacturer_code, model_code, vehicle_type):
+        payload = build_years_payload(
+            self.reference_table_code, manufacturer_code, model_code, vehicle_type
+        )
+        self.logger.info(f"Querying years with payload: {payload}")
+        key = (vehicle_type, manufacturer_code, model_code)
+        years = None
+        if self.catalog_cache is not None:
+            years = self.catalog_cache.get("years", key, self.reference_table_code)
+        if years is None:
+            years = await self._post("ConsultarAnoModelo", payload)
+            if self.catalog_cache is not None:
+                self.catalog_cache.put("years", key, self.reference_table_code, years)
+        processed_years, available_fuel_types = parse_years(years, self.logger)
+        self.logger.info(f"Available fuel types: {available_fuel_types}")
+        self.logger.info(f"Years obtained: {processed_years}")
+        return processed_years, available_fuel_types
+
+    async def get_price(
+        self, manufacturer_code, model_code, year_model, vehicle_type, fuel_type
+    ):
+        """Obtém o preço do veículo para um determinado ano e tipo de combustível."""
+        payload = build_price_payload(
+            self.reference_table_code,
+            manufacturer_code,
+            model_code,
+            year_model,
+            vehicle_type,
+            fuel_type,
+        )
+        self.logger.info(f"Querying price with payload: {payload}")
+        price = await self._post("ConsultarValorComTodosParametros", payload)
+        self.logger.info(f"Price obtained: {price}")
+        return price
+
+
+def is_throttled(error):
+    """Indica se a exceção corresponde a uma resposta 429 da API FIPE."""
+    response = getattr(error, "response", None)
+    return response is not None and response.status_code == 429
@@ -0,0 +1,224 @@
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Backend do cache de catálogo: vazio (desabilitado), "postgres" ou um diretório
+CATALOG_CACHE_BACKEND = os.getenv("FIPE_CATALOG_CACHE", "")
+# Modo de uso: "off", "exact" (mesma tabela de referência) ou "revalidate"
+CATALOG_CACHE_MODE = os.getenv("FIPE_CATALOG_CACHE_MODE", "exact")
+# Idade máxima (em tabelas de referência/meses) de uma entrada reaproveitada
+CATALOG_CACHE_MAX_AGE = int(os.getenv("FIPE_CATALOG_CACHE_MAX_AGE", "3"))
+
+MODE_OFF = "off"
+MODE_EXACT = "exact"
+MODE_REVALIDATE = "revalidate"
+
+# Listagens que revelam marcas/modelos novos: sempre consultadas no modo
+# "revalidate", para que apenas os itens novos gerem chamadas de catálogo
+DISCOVERY_KINDS = ("brands", "models")
+
+
+class CatalogCache:
+    """
+    Cache persistente das listagens de catálogo da API FIPE.
+
+    As entradas são indexadas por tipo de listagem (`brands`, `models`,
+    `years`), chave (tipo de veículo, marca, modelo) e código da tabela de
+    referência. No modo `exact` somente a mesma tabela de referência é
+    reaproveitada; no modo `revalidate` as listagens de anos/combustíveis de
+    modelos já conhecidos são reaproveitadas de meses anteriores (até
+    `max_age` tabelas atrás), e apenas marcas e modelos novos consultam a API.
+
+    A implementação base não armazena nada (toda consulta é um miss);
+    subclasses sobrescrevem `read`, `read_latest` e `write`. As chamadas a
+    `get` e `put` são serializadas, de modo que a mesma instância (e a mesma
+    conexão, no backend PostgreSQL) pode ser usada por várias threads.
+    """
+
+    def __init__(self, mode=None, max_age=None):
+        self.mode = mode or CATALOG_CACHE_MODE
+        self.max_age = CATALOG_CACHE_MAX_AGE if max_age is None else int(max_age)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def read(self, kind, key, reference_table_code):
+        """Retorna o payload da chave na tabela de referência, ou None."""
+        return None
+
+    def read_latest(self, kind, key):
+        """Retorna (codigo_tabela_referencia, payload) mais recente da chave, ou None."""
+        return None
+
+    def write(self, kind, key, reference_table_code, payload):
+        """Armazena o payload da chave na tabela de referência."""
+
+    def get(self, kind, key, reference_table_code):
+        """
+        Busca uma listagem no cache conforme o modo configurado.
+
+        Returns:
+            O payload original da API, ou None se a API deve ser consultada
+        """
+        if self.mode == MODE_OFF:
+            return None
+        with self._lock:
+            try:
+                payload = self.read(kind, key, reference_table_code)
+                if payload is None and self.mode == MODE_REVALIDATE and kind not in DISCOVERY_KINDS:
+                    latest = self.read_latest(kind, key)
+                    if latest and int(reference_table_code) - int(latest[0]) <= self.max_age:
+                        payload = latest[1]
+                        self.write(kind, key, reference_table_code, payload)
+            except Exception as e:
+                logger.warning(f"Erro ao consultar cache de catálogo ({kind} {key}): {e}")
+                payload = None
+
+            if payload is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return payload
+
+    def put(self, kind, key, reference_table_code, payload):
+        """Armazena a resposta da API; falhas do cache não interrompem o crawl."""
+        if self.mode == MODE_OFF:
+            return
+        with self._lock:
+            try:
+                self.write(kind, key, reference_table_code, payload)
+            except Exception as e:
+                logger.warning(f"Erro ao gravar cache de catálogo ({kind} {key}): {e}")
+
+    def stats(self):
+        return {"mode": self.mode, "hits": self.hits, "misses": self.misses}
+
+
+class FileCatalogCache(CatalogCache):
+    """Cache de catálogo em arquivos JSON locais (um arquivo por chave)."""
+
+    def __init__(self, base_dir, mode=None, max_age=None):
+        super().__init__(mode=mode, max_age=max_age)
+        self.base_dir = base_dir
+
+    def _path(self, kind, key):
+        name = "_".join(str(part) for part in key if part not in (None, ""))
+        return os.path.join(self.base_dir, kind, f"{name}.json")
+
+    def _load(self, kind, key):
+        path = self._path(kind, key)
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def read(self, kind, key, reference_table_code):
+        return self._load(kind, key).get(str(reference_table_code))
+
+    def read_latest(self, kind, key):
+        entries = self._load(kind, key)
+        if not entries:
+            return None
+        reference_table_code = max(entries, key=int)
+        return reference_table_code, entries[reference_table_code]
+
+    def write(self, kind, key, reference_table_code, payload):
+        path = self._path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entries = self._load(kind, key)
+        entries[str(reference_table_code)] = payload
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class PostgresCatalogCache(CatalogCache):
+    """Cache de catálogo na tabela public.fipe_catalog_cache do PostgreSQL."""
+
+    def __init__(self, connection_factory=None, mode=None, max_age=None):
+        super().__init__(mode=mode, max_age=max_age)
+        self.connection_factory = connection_factory or _default_connection_factory
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = self.connection_factory()
+        return self._conn
+
+    @staticmethod
+    def _key_params(key):
+        vehicle_type, brand_code, model_code = (list(key) + [None, None, None])[:3]
+        return int(vehicle_type), str(brand_code or ""), str(model_code or "")
+
+    def read(self, kind, key, reference_table_code):
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT payload FROM public.fipe_catalog_cache
+                WHERE kind = %s AND vehicle_type = %s AND brand_code = %s
+                      AND model_code = %s AND reference_table_code = %s
+            """, (kind, *self._key_params(key), int(reference_table_code)))
+            result = cur.fetchone()
+        self.conn.rollback()
+        return result[0] if result else None
+
+    def read_latest(self, kind, key):
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT reference_table_code, payload FROM public.fipe_catalog_cache
+                WHERE kind = %s AND vehicle_type = %s AND brand_code = %s
+                      AND model_code = %s
+                ORDER BY reference_table_code DESC
+                LIMIT 1
+            """, (kind, *self._key_params(key)))
+            result = cur.fetchone()
+        self.conn.rollback()
+        return (result[0], result[1]) if result else None
+
+    def write(self, kind, key, reference_table_code, payload):
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO public.fipe_catalog_cache
+                    (kind, vehicle_type, brand_code, model_code, reference_table_code, payload, create_date)
+                    VALUES (%s, %s, %s, %s, %s, %s, NOW())
+                    ON CONFLICT (kind, vehicle_type, brand_code, model_code, reference_table_code)
+                    DO UPDATE SET payload = EXCLUDED.payload, write_date = NOW()
+                """, (
+                    kind,
+                    *self._key_params(key),
+                    int(reference_table_code),
+                    json.dumps(payload, ensure_ascii=False),
+                ))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+
+def _default_connection_factory():
+    from fipe_soma_ingestor import get_db_connection
+
+    return get_db_connection()
+
+
+# Instância compartilhada no escopo do módulo (reaproveitada entre invocações)
+_catalog_cache = None
+
+
+def get_catalog_cache():
+    """
+    Retorna o cache de catálogo configurado por FIPE_CATALOG_CACHE, ou None
+    se o cache estiver desabilitado.
+    """
+    global _catalog_cache
+    if _catalog_cache is None and CATALOG_CACHE_BACKEND and CATALOG_CACHE_MODE != MODE_OFF:
+        if CATALOG_CACHE_BACKEND == "postgres":
+            _catalog_cache = PostgresCatalogCache()
+        else:
+            _catalog_cache = FileCatalogCache(CATALOG_CACHE_BACKEND)
+    return _catalog_cache
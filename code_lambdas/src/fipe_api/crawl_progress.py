@@ -0,0 +1,319 @@
+import os
+import json
+import logging
+import threading
+from time_budget import PENDING_PAIRS_FIELD
+
+logger = logging.getLogger(__name__)
+
+# Registra o progresso do crawl (fipe_crawl_run/fipe_crawl_unit) no PostgreSQL
+CRAWL_PROGRESS_ENABLED = os.getenv("FIPE_CRAWL_PROGRESS", "true").lower() == "true"
+
+# Unidades de trabalho: marca (FipeModelLoader), modelo (FipePriceLoader) e
+# par ano/combustível de um modelo (uma consulta de preço)
+UNIT_BRAND = "brand"
+UNIT_MODEL = "model"
+UNIT_PRICE = "price"
+
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+RUN_RUNNING = "running"
+RUN_DONE = "done"
+
+
+def brand_key(message):
+    """Chave da unidade de marca: tipo de veículo:marca."""
+    return f"{message['codigoTipoVeiculo']}:{message['codigoMarca']}"
+
+
+def model_key(message):
+    """Chave da unidade de modelo: tipo de veículo:marca:modelo."""
+    return f"{message['vehicle_type']}:{message['manufacturer_code']}:{message['model_code']}"
+
+
+def price_key(message, year, fuel_type_code):
+    """Chave da unidade de preço: chave do modelo:ano:combustível."""
+    return f"{model_key(message)}:{year.get('yearModel')}:{fuel_type_code}"
+
+
+def brand_unit(message):
+    """Unidade de marca a partir da mensagem enviada ao FipeModelLoader."""
+    return (message["codigoTabelaReferencia"], UNIT_BRAND, brand_key(message), None, message)
+
+
+def model_unit(message):
+    """Unidade de modelo a partir da mensagem enviada ao FipePriceLoader."""
+    payload = {key: value for key, value in message.items() if key != PENDING_PAIRS_FIELD}
+    return (
+        message["codigoTabelaReferencia"],
+        UNIT_MODEL,
+        model_key(message),
+        f"{message['vehicle_type']}:{message['manufacturer_code']}",
+        payload,
+    )
+
+
+def price_unit(message, year, fuel_type_code):
+    """Unidade de preço (par ano/combustível) de um modelo."""
+    return (
+        message["codigoTabelaReferencia"],
+        UNIT_PRICE,
+        price_key(message, year, fuel_type_code),
+        model_key(message),
+        {"yearModel": year.get("yearModel"), "Label": year.get("Label"), "fuelType": fuel_type_code},
+    )
+
+
+class CrawlProgress:
+    """
+    Progresso de cada execução mensal do crawl no PostgreSQL.
+
+    `fipe_crawl_run` tem uma linha por tabela de referência e
+    `fipe_crawl_unit` uma linha por unidade de trabalho (marca, modelo ou par
+    ano/combustível), com status `pending`, `done` ou `failed` e a mensagem
+    necessária para reenfileirá-la. `incomplete_units` alimenta a retomada
+    (`fipe_crawl_resume`), que reenvia somente o que não foi concluído.
+
+    Unidades são `(codigo_tabela_referencia, tipo, chave, chave_pai, payload)`.
+    Falhas de gravação apenas são logadas: o progresso nunca
+    interrompe o crawl.
+    """
+
+    def __init__(self, connection_factory=None):
+        self.connection_factory = connection_factory or _default_connection_factory
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = self.connection_factory()
+        return self._conn
+
+    def _write(self, description, sql, params=None, values=None, template=None):
+        from psycopg2.extras import execute_values
+
+        with self._lock:
+            try:
+                with self.conn.cursor() as cur:
+                    if values is None:
+                        cur.execute(sql, params)
+                    else:
+                        execute_values(cur, sql, values, template=template)
+                self.conn.commit()
+            except Exception as e:
+                try:
+                    self.conn.rollback()
+                except Exception:
+                    pass
+                logger.warning(f"Erro ao gravar progresso do crawl ({description}): {e}")
+
+    def start_run(self, reference_table_code, reference_month_name):
+        """Registra o início da execução de uma tabela de referência."""
+        self._write("start_run", """
+            INSERT INTO public.fipe_crawl_run
+            (reference_table_code, reference_month_name, status, started_at)
+            VALUES (%s, %s, %s, NOW())
+            ON CONFLICT (reference_table_code) DO UPDATE
+            SET reference_month_name = EXCLUDED.reference_month_name, status = EXCLUDED.status
+        """, (int(reference_table_code), reference_month_name, RUN_RUNNING))
+
+    def add_pending(self, units):
+        """Registra unidades enfileiradas; unidades já existentes não mudam de status."""
+        self._set(units, STATUS_PENDING, "ON CONFLICT (reference_table_code, unit_type, unit_key) DO NOTHING")
+
+    def mark(self, units, status):
+        """Define o status (`done` ou `failed`) das unidades, criando-as se necessário."""
+        self._set(units, status, """
+            ON CONFLICT (reference_table_code, unit_type, unit_key) DO UPDATE
+            SET status = EXCLUDED.status,
+                attempts = public.fipe_crawl_unit.attempts + 1,
+                write_date = NOW()
+        """)
+
+    def _set(self, units, status, conflict_clause):
+        # Uma unidade pode aparecer mais de uma vez no mesmo lote (ex.: o mesmo
+        # modelo em mensagens duplicadas); o ON CONFLICT exige linhas únicas
+        rows = {}
+        for reference_table_code, unit_type, key, parent_key, payload in units:
+            rows[(int(reference_table_code), unit_type, key)] = (
+                int(reference_table_code),
+                unit_type,
+                key,
+                parent_key,
+                status,
+                json.dumps(payload, ensure_ascii=False),
+            )
+        if not rows:
+            return
+        self._write(f"{status}: {len(rows)} unidades", f"""
+            INSERT INTO public.fipe_crawl_unit
+            (reference_table_code, unit_type, unit_key, parent_key, status, payload, create_date)
+            VALUES %s
+            {conflict_clause}
+        """, values=list(rows.values()), template="(%s, %s, %s, %s, %s, %s::jsonb, NOW())")
+
+    def incomplete_units(self, reference_table_code):
+        """
+        Retorna as unidades não concluídas (`pending` ou `failed`) de uma
+        tabela de referência: lista de (tipo, chave, chave_pai, status, payload).
+        """
+        with self._lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT unit_type, unit_key, parent_key, status, payload
+                        FROM public.fipe_crawl_unit
+                        WHERE reference_table_code = %s AND status <> %s
+                        ORDER BY unit_type, unit_key
+                    """, (int(reference_table_code), STATUS_DONE))
+                    return cur.fetchall()
+            finally:
+                self.conn.rollback()
+
+    def summary(self, reference_table_code):
+        """Contagem de unidades por tipo e status: {tipo: {status: quantidade}}."""
+        with self._lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT unit_type, status, count(*)
+                        FROM public.fipe_crawl_unit
+                        WHERE reference_table_code = %s
+                        GROUP BY unit_type, status
+                    """, (int(reference_table_code),))
+                    rows = cur.fetchall()
+            finally:
+                self.conn.rollback()
+        summary = {}
+        for unit_type, status, count in rows:
+            summary.setdefault(unit_type, {})[status] = count
+        return summary
+
+    def latest_run_code(self):
+        """Código da tabela de referência da execução mais recente, ou None."""
+        with self._lock:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT reference_table_code FROM public.fipe_crawl_run
+                        ORDER BY started_at DESC NULLS LAST, reference_table_code DESC
+                        LIMIT 1
+                    """)
+                    row = cur.fetchone()
+            finally:
+                self.conn.rollback()
+        return row[0] if row else None
+
+    def record_resume(self, reference_table_code, finished):
+        """Registra uma retomada; sem unidades pendentes a execução é concluída."""
+        self._write("record_resume", """
+            UPDATE public.fipe_crawl_run
+            SET resume_count = resume_count + 1,
+                resumed_at = NOW(),
+                status = %s,
+                finished_at = CASE WHEN %s THEN NOW() END
+            WHERE reference_table_code = %s
+        """, (RUN_DONE if finished else RUN_RUNNING, finished, int(reference_table_code)))
+
+
+class ProgressRecorder:
+    """
+    Acumula as unidades de uma invocação e grava o progresso de uma só vez.
+
+    Cada mensagem SQS de entrada (messageId) tem sua própria unidade e as
+    unidades filhas que gerou (ex.: os modelos de uma marca). Em `flush`, as
+    mensagens concluídas são marcadas `done`, as reportadas como falha
+    `failed`, e as demais (reenfileiradas para continuação) seguem `pending`.
+    Sem registro de progresso (`progress=None`) todas as chamadas são ignoradas.
+    """
+
+    def __init__(self, progress):
+        self.progress = progress
+        self._entries = {}
+
+    def _entry(self, message_id):
+        return self._entries.setdefault(message_id, {"unit": None, "pending": [], "done": []})
+
+    @staticmethod
+    def _build(builder, args):
+        try:
+            return builder(*args)
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def track(self, message_id, builder, *args):
+        """Associa a unidade da mensagem de entrada, criada por `builder(*args)`."""
+        if self.progress:
+            self._entry(message_id)["unit"] = self._build(builder, args)
+
+    def child_pending(self, message_id, builder, *args):
+        """Unidade filha enfileirada (ou reenfileirada) e ainda não concluída."""
+        if self.progress:
+            self._entry(message_id)["pending"].append(self._build(builder, args))
+
+    def child_done(self, message_id, builder, *args):
+        """Unidade filha concluída nesta invocação."""
+        if self.progress:
+            self._entry(message_id)["done"].append(self._build(builder, args))
+
+    def flush(self, completed, batch_item_failures):
+        """
+        Grava o progresso acumulado.
+
+        Args:
+            completed (iterable): messageIds cujas unidades foram concluídas
+            batch_item_failures (list): Falhas reportadas ao SQS
+        """
+        if not self.progress or not self._entries:
+            return
+        completed = set(completed)
+        failed = {failure["itemIdentifier"] for failure in batch_item_failures}
+        pending_units, done_units, failed_units = [], [], []
+        for message_id, entry in self._entries.items():
+            pending_units.extend(entry["pending"])
+            if message_id in failed:
+                # Filhos "concluídos" de uma mensagem com falha podem não ter
+                # sido enviados: continuam pendentes até a nova tentativa
+                failed_units.append(entry["unit"])
+                pending_units.extend(entry["done"])
+                continue
+            done_units.extend(entry["done"])
+            if message_id in completed:
+                done_units.append(entry["unit"])
+            else:
+                pending_units.append(entry["unit"])
+        self.progress.add_pending(unit for unit in pending_units if unit)
+        self.progress.mark((unit for unit in done_units if unit), STATUS_DONE)
+        self.progress.mark((unit for unit in failed_units if unit), STATUS_FAILED)
+        self._entries = {}
+
+
+def _default_connection_factory():
+    from fipe_soma_ingestor import get_db_connection
+
+    return get_db_connection()
+
+
+# Instância compartilhada no escopo do módulo (reaproveitada entre invocações)
+_crawl_progress = None
+
+
+def get_crawl_progress():
+    """
+    Retorna o registro de progresso do crawl, ou None se estiver desabilitado
+    (FIPE_CRAWL_PROGRESS=false ou sem acesso ao banco, RDS_HOST; neste caso,
+    com um aviso no log).
+    """
+    global _crawl_progress
+    if _crawl_progress is None and CRAWL_PROGRESS_ENABLED:
+        if not os.getenv("RDS_HOST"):
+            logger.warning(
+                "RDS_HOST não definido: progresso do crawl desabilitado"
+                " (use FIPE_CRAWL_PROGRESS=false se for intencional)"
+            )
+            return None
+        _crawl_progress = CrawlProgress()
+    return _crawl_progress
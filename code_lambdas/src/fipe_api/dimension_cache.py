@@ -0,0 +1,114 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Pré-carrega todos os fabricantes e modelos na primeira invocação da instância
+DIMENSION_PRELOAD = os.getenv("FIPE_DIMENSION_PRELOAD", "true").lower() == "true"
+
+# Separador das partes da chave (não aparece em nomes/códigos da FIPE)
+KEY_SEPARATOR = "\x1f"
+
+PRELOAD_SQL = """
+    SELECT 'manufacturer', id, name, code, vehicle_type
+    FROM public.fipe_vehicle_manufacturer
+    UNION ALL
+    SELECT 'model', id, name, code, manufacturer_id
+    FROM public.fipe_vehicle_model
+"""
+
+
+def _key(parent, code, name):
+    # Uma única string por chave ocupa bem menos memória que uma tupla de três
+    # objetos, o que mantém o catálogo completo (dezenas de milhares de modelos)
+    # em poucos MB (~10 MB para 50 mil modelos)
+    return f"{int(parent)}{KEY_SEPARATOR}{code}{KEY_SEPARATOR}{name}"
+
+
+class DimensionCache:
+    """
+    Cache em memória dos IDs de fabricantes e modelos usado pelo ingestor.
+
+    Fabricantes são indexados por (tipo de veículo, código, nome) e modelos
+    por (ID do fabricante, código, nome). A instância é mantida no escopo do
+    módulo, sobrevivendo às invocações "quentes" da Lambda, e pode ser
+    pré-carregada com uma única consulta (`preload`).
+    """
+
+    def __init__(self):
+        self.manufacturers = {}
+        self.models = {}
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def preload(self, conn):
+        """Carrega todos os fabricantes e modelos do banco com uma única consulta."""
+        with conn.cursor() as cur:
+            cur.execute(PRELOAD_SQL)
+            for kind, dimension_id, name, code, parent in cur:
+                if kind == "manufacturer":
+                    self.manufacturers[_key(parent, code, name)] = dimension_id
+                else:
+                    self.models[_key(parent, code, name)] = dimension_id
+        conn.rollback()
+        self.loaded = True
+        logger.info(
+            f"Cache de dimensões carregado: {len(self.manufacturers)} fabricantes,"
+            f" {len(self.models)} modelos"
+        )
+
+    def _get(self, entries, key):
+        dimension_id = entries.get(key)
+        if dimension_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return dimension_id
+
+    def get_manufacturer(self, name, code, vehicle_type):
+        return self._get(self.manufacturers, _key(vehicle_type, code, name))
+
+    def put_manufacturer(self, name, code, vehicle_type, manufacturer_id):
+        self.manufacturers[_key(vehicle_type, code, name)] = manufacturer_id
+
+    def get_model(self, name, code, manufacturer_id):
+        return self._get(self.models, _key(manufacturer_id, code, name))
+
+    def put_model(self, name, code, manufacturer_id, model_id):
+        self.models[_key(manufacturer_id, code, name)] = model_id
+
+    def clear(self):
+        """Descarta as entradas; a próxima invocação recarrega o cache."""
+        self.manufacturers.clear()
+        self.models.clear()
+        self.loaded = False
+
+    def stats(self):
+        return {
+            "manufacturers": len(self.manufacturers),
+            "models": len(self.models),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Instância compartilhada no escopo do módulo (reaproveitada entre invocações)
+_dimension_cache = None
+
+
+def get_dimension_cache(conn=None):
+    """
+    Retorna o cache de dimensões do processo, pré-carregando-o na primeira
+    chamada com conexão (se FIPE_DIMENSION_PRELOAD estiver habilitado).
+    """
+    global _dimension_cache
+    if _dimension_cache is None:
+        _dimension_cache = DimensionCache()
+    if conn is not None and DIMENSION_PRELOAD and not _dimension_cache.loaded:
+        try:
+            _dimension_cache.preload(conn)
+        except Exception as e:
+            conn.rollback()
+            logger.warning(f"Erro ao pré-carregar o cache de dimensões: {e}")
+    return _dimension_cache
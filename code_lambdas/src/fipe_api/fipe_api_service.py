@@ -4,77 +4,339 @@ import boto3
 import os
 import time
 import logging
+from requests.adapters import HTTPAdapter
+from rate_limiter import get_shared_rate_limiter, parse_retry_after
+from catalog_cache import get_catalog_cache
+from sqs_sender import SqsBatchSender
+from fixture_corpus import fixture_session, fixture_rate_limiter
+from metrics import get_metrics, record_api_call
+
+# Configuração do transporte HTTP (pool de conexões keep-alive)
+DEFAULT_POOL_SIZE = int(os.getenv("FIPE_POOL_SIZE", "10"))
+DEFAULT_CONNECT_TIMEOUT = float(os.getenv("FIPE_CONNECT_TIMEOUT", "3.05"))
+DEFAULT_READ_TIMEOUT = float(os.getenv("FIPE_READ_TIMEOUT", "30"))
+
+# Sessões HTTP compartilhadas no escopo do módulo, reaproveitadas entre
+# invocações "quentes" da Lambda (uma por tamanho de pool)
+_http_sessions = {}
+
+# Cache das tabelas de referência, indexado por período (mes, ano). O período
+# (0, 0) corresponde à tabela mais recente.
+REFERENCE_TABLE_TTL = int(os.getenv("FIPE_REFERENCE_TABLE_TTL", "3600"))
+_reference_table_cache = {}
+_reference_table_expires_at = 0.0
+
+
+def get_http_session(pool_size=None):
+    """
+    Retorna uma sessão HTTP com pool de conexões keep-alive e compressão gzip.
+
+    A sessão é criada uma única vez por tamanho de pool e mantida no escopo do
+    módulo, de forma que as conexões TCP abertas sobrevivem entre invocações
+    da mesma instância da Lambda.
+
+    Args:
+        pool_size (int): Número máximo de conexões mantidas no pool
+
+    Returns:
+        requests.Session: Sessão HTTP compartilhada
+    """
+    pool_size = int(pool_size or DEFAULT_POOL_SIZE)
+    session = _http_sessions.get(pool_size)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(
+            {
+                "Accept-Encoding": "gzip, deflate",
+                "Connection": "keep-alive",
+            }
+        )
+        _http_sessions[pool_size] = session
+    return session
+
+
+# Dicionário com os nomes dos meses em português
+MESES = {
+    1: "janeiro",
+    2: "fevereiro",
+    3: "março",
+    4: "abril",
+    5: "maio",
+    6: "junho",
+    7: "julho",
+    8: "agosto",
+    9: "setembro",
+    10: "outubro",
+    11: "novembro",
+    12: "dezembro"
+}
+
 
 def mes_ano_formatado(mes, ano):
-    # Dicionário com os nomes dos meses em português
-    meses = {
-        1: "janeiro",
-        2: "fevereiro",
-        3: "março",
-        4: "abril",
-        5: "maio",
-        6: "junho",
-        7: "julho",
-        8: "agosto",
-        9: "setembro",
-        10: "outubro",
-        11: "novembro",
-        12: "dezembro"
-    }
-    
     # Verificar se o mês está dentro do intervalo válido (1-12)
     if mes < 1 or mes > 12:
         raise ValueError("Mês deve estar entre 1 e 12")
     
     # Retornar a string formatada
-    return f"{meses[mes]}/{ano}"
+    return f"{MESES[mes]}/{ano}"
+
+
+def parse_mes_ano(label):
+    """
+    Converte o rótulo "Mes" da API (ex.: "outubro/2026 ") em (mes, ano).
+
+    Returns:
+        tuple | None: (mes, ano) ou None se o rótulo não for reconhecido
+    """
+    nome, _, ano = str(label).strip().lower().partition("/")
+    for numero, mes_nome in MESES.items():
+        if mes_nome == nome and ano.strip().isdigit():
+            return numero, int(ano)
+    return None
+
+
+def index_reference_tables(reference_tables):
+    """
+    Indexa a lista de tabelas de referência por (mes, ano) no cache do módulo.
+
+    Uma única consulta a ConsultarTabelaDeReferencia alimenta todos os
+    períodos, que permanecem válidos por REFERENCE_TABLE_TTL segundos.
+    """
+    global _reference_table_expires_at
+    _reference_table_cache.clear()
+    _reference_table_cache[(0, 0)] = reference_tables[0]
+    for table in reference_tables:
+        period = parse_mes_ano(table.get("Mes", ""))
+        if period:
+            _reference_table_cache.setdefault(period, table)
+    _reference_table_expires_at = time.monotonic() + REFERENCE_TABLE_TTL
+
+
+def get_cached_reference_table(period):
+    """Retorna a tabela de referência em cache para o período, se ainda válida."""
+    if time.monotonic() >= _reference_table_expires_at:
+        return None
+    return _reference_table_cache.get(tuple(period))
+
+
+def parse_years(years, logger=None):
+    """
+    Converte a resposta de ConsultarAnoModelo em anos e tipos de combustível.
+
+    Args:
+        years (list): Itens retornados pela API ({"Label": ..., "Value": ...})
+        logger: Logger usado para avisos de rótulos inválidos
+
+    Cada ano processado carrega o tipo de combustível extraído do seu
+    próprio `Value` (ex.: "2015-1"), formando os pares (ano, combustível)
+    efetivamente disponíveis para o modelo.
+
+    Returns:
+        tuple: (lista de anos processados, conjunto de tipos de combustível)
+    """
+    logger = logger or logging.getLogger(__name__)
+    processed_years = []
+    available_fuel_types = set()
+
+    fuel_type_map = {"Gasolina": "1", "Álcool": "2", "Diesel": "3"}
+
+    for item in years:
+        label = item.get("Label", "")
+        value = item.get("Value", "")
+
+        # Extrai o ano do label
+        year_str = label.split(" ")[0]
+
+        # Verifica se o Value contém um hífen
+        if "-" in value:
+            fuel_type_number = value.split("-")[-1]  # Extrai o número após o hífen
+        else:
+            # Se não houver hífen, tenta pegar a palavra após o ano
+            fuel_type_from_label = (
+                label.split(" ")[1] if len(label.split(" ")) > 1 else ""
+            )
+
+            fuel_type_number = fuel_type_map.get(fuel_type_from_label, "")
+
+        if fuel_type_number:
+            available_fuel_types.add(fuel_type_number)
+
+        # Verifica se o ano é válido e adiciona à lista de anos processados
+        if year_str.isdigit():
+            processed_years.append(
+                {"yearModel": year_str, "Label": label, "fuelType": fuel_type_number}
+            )
+        else:
+            logger.warning(f"Ignoring invalid year label: {label}")
+
+    return processed_years, available_fuel_types
+
+
+def build_years_payload(reference_table_code, manufacturer_code, model_code, vehicle_type):
+    """Monta o payload de ConsultarAnoModelo."""
+    return {
+        "codigoTabelaReferencia": reference_table_code,
+        "codigoTipoVeiculo": vehicle_type,
+        "codigoMarca": manufacturer_code,
+        "codigoModelo": model_code,
+    }
+
+
+def build_price_payload(
+    reference_table_code, manufacturer_code, model_code, year_model, vehicle_type, fuel_type
+):
+    """Monta o payload de ConsultarValorComTodosParametros."""
+    return {
+        "codigoTabelaReferencia": reference_table_code,
+        "codigoTipoVeiculo": vehicle_type,
+        "codigoMarca": manufacturer_code,
+        "codigoModelo": model_code,
+        "anoModelo": year_model,
+        "codigoTipoCombustivel": fuel_type,
+        "modeloCodigoExterno": "",
+        "tipoConsulta": "tradicional",
+    }
+
 
 class FipeAPI:
     # Inicializando o cliente SQS e o logger como atributos de classe
     sqs_client = boto3.client("sqs")
     logger = logging.getLogger(__name__)  # Definindo o nome do logger
 
-    def __init__(self, period=None):
+    def __init__(
+        self,
+        period=None,
+        session=None,
+        pool_size=None,
+        connect_timeout=None,
+        read_timeout=None,
+        rate_limiter=None,
+        reference_table_code=None,
+        reference_month_name=None,
+        catalog_cache=None,
+        metrics=None,
+    ):
         if period== None:
             period = (0,0,)
         self.logger.setLevel(logging.INFO)  # Definindo o nível de log
+        # Sem sessão explícita, FIPE_FIXTURE_MODE pode gravar ou reproduzir as respostas
+        self.session = session or fixture_session(get_http_session(pool_size))
+        self.timeout = (
+            connect_timeout or DEFAULT_CONNECT_TIMEOUT,
+            read_timeout or DEFAULT_READ_TIMEOUT,
+        )
+        self.rate_limiter = rate_limiter or fixture_rate_limiter() or get_shared_rate_limiter()
+        self.catalog_cache = catalog_cache or get_catalog_cache()
+        self.metrics = metrics or get_metrics()
         self.url_base = os.getenv("URL_FIPE")
         self.logger.info(f"Fipe URL -> {self.url_base}")
         if not bool(self.url_base):
             raise ValueError("Variável de ambiente URL_FIPE nao definida")
-        self.reference_table = self.get_reference_table(period)
-        self.reference_table_code = self.reference_table.get("Codigo")
-        self.reference_month_name = self.reference_table.get(
-            "Mes", "Desconhecido"
-        ).strip()
+        self.period = tuple(period)
+        self._reference_table = None
+        if reference_table_code is not None:
+            # Código já conhecido (ex.: vindo da mensagem SQS): não consulta a API
+            self._reference_table = {
+                "Codigo": reference_table_code,
+                "Mes": reference_month_name or "Desconhecido",
+            }
+
+    @classmethod
+    def from_message(cls, message, **kwargs):
+        """
+        Cria um cliente para a tabela de referência informada na mensagem SQS,
+        sem consultar ConsultarTabelaDeReferencia.
+        """
+        return cls(
+            reference_table_code=message["codigoTabelaReferencia"],
+            reference_month_name=message.get("mesReferenciaAno"),
+            **kwargs,
+        )
+
+    @property
+    def reference_table(self):
+        # Resolvida sob demanda (e via cache) apenas quando realmente utilizada
+        if self._reference_table is None:
+            self._reference_table = self.get_reference_table(self.period)
+        return self._reference_table
+
+    @property
+    def reference_table_code(self):
+        return self.reference_table.get("Codigo")
+
+    @property
+    def reference_month_name(self):
+        return self.reference_table.get("Mes", "Desconhecido").strip()
+
+    def _post(self, endpoint, payload=None):
+        """
+        Executa um POST na API FIPE usando a sessão compartilhada.
+
+        O ritmo das requisições é controlado pelo limitador de taxa, que é
+        notificado do resultado de cada chamada (sucesso ou 429). A latência
+        registrada nas métricas não inclui a espera do limitador.
+        """
+        url = f"{self.url_base}/{endpoint}"
+        self.rate_limiter.acquire()
+        start = time.monotonic()
+        try:
+            response = self.session.post(url, json=payload, timeout=self.timeout)
+        except Exception:
+            record_api_call(self.metrics, endpoint, payload, None, start)
+            raise
+        record_api_call(self.metrics, endpoint, payload, response.status_code, start)
+        if response.status_code == 429:
+            self.rate_limiter.on_throttle(
+                parse_retry_after(response.headers.get("Retry-After"))
+            )
+        response.raise_for_status()
+        self.rate_limiter.on_success()
+        return response.json()
+
+    def _catalog_post(self, kind, key, endpoint, payload):
+        """
+        POST de uma listagem de catálogo (marcas, modelos ou anos), consultando
+        antes o cache persistente de catálogo, quando configurado.
+        """
+        if self.catalog_cache is None:
+            return self._post(endpoint, payload)
+        cached = self.catalog_cache.get(kind, key, self.reference_table_code)
+        if cached is not None:
+            self.logger.info(f"Catalog cache hit: {kind} {key}")
+            return cached
+        response = self._post(endpoint, payload)
+        self.catalog_cache.put(kind, key, self.reference_table_code, response)
+        return response
 
     def get_reference_table(self, period):
         try:
             mes = period[0]
             ano = period[1]
-            url = f"{self.url_base}/ConsultarTabelaDeReferencia"
-            response = requests.post(url)
-            response.raise_for_status()
-            reference_tables = response.json()
-            if reference_tables:
-                if mes == 0 and ano == 0:
-                    return reference_tables[0]
-                else:
-                    database = mes_ano_formatado(mes, ano)
-                    for table in reference_tables:
-                        if str(table["Mes"]).strip().lower() == database.lower():
-                            return table
-            else:
+            if not (mes == 0 and ano == 0):
+                mes_ano_formatado(mes, ano)  # Valida o mês informado
+            table = get_cached_reference_table((mes, ano))
+            if table is not None:
+                return table
+            reference_tables = self._post("ConsultarTabelaDeReferencia")
+            if not reference_tables:
                 self.logger.warning("No reference tables found.")
                 return {}
-            print(f"Mes/Ano: {mes}/{ano}")
+            index_reference_tables(reference_tables)
+            table = get_cached_reference_table((mes, ano))
+            if table is None:
+                raise ValueError(f"Tabela de referência não encontrada para {mes}/{ano}")
+            return table
         except Exception as e:
             self.logger.error(f"Error fetching reference table: {e}")
             raise
 
     def get_brands(self, vehicle_type):
         try:
-            url = f"{self.url_base}/ConsultarMarcas"
             payload = {
                 "codigoTabelaReferencia": self.reference_table_code,
                 "codigoTipoVeiculo": vehicle_type,
@@ -82,9 +344,9 @@ class FipeAPI:
             self.logger.info(
                 f"Fetching brands for vehicle type {vehicle_type} with payload: {payload}"
             )
-            response = requests.post(url, json=payload)
-            response.raise_for_status()
-            brands = response.json()
+            brands = self._catalog_post(
+                "brands", (vehicle_type,), "ConsultarMarcas", payload
+            )
             self.logger.info(f"Brands for vehicle type {vehicle_type}: {brands}")
             return brands
         except Exception as e:
@@ -94,7 +356,6 @@ class FipeAPI:
             raise
 
     def get_models(self, brand_code, vehicle_type):
-        url = f"{self.url_base}/ConsultarModelos"
         payload = {
             "codigoTabelaReferencia": self.reference_table_code,
             "codigoTipoVeiculo": vehicle_type,
@@ -102,63 +363,29 @@ class FipeAPI:
         }
         self.logger.info(f"Querying models with payload: {payload}")
         try:
-            response = requests.post(url, json=payload)
-            response.raise_for_status()
-            models = response.json()
+            models = self._catalog_post(
+                "models", (vehicle_type, brand_code), "ConsultarModelos", payload
+            )
             self.logger.info(f"Received response: {models}")
-            time.sleep(1)  # Adding delay after successful request
             return models
         except requests.RequestException as e:
             self.logger.error(f"Request failed: {e}")
             raise
 
     def get_years(self, manufacturer_code, model_code, vehicle_type):
-        url = f"{self.url_base}/ConsultarAnoModelo"
-        payload = {
-            "codigoTabelaReferencia": self.reference_table_code,
-            "codigoTipoVeiculo": vehicle_type,
-            "codigoMarca": manufacturer_code,
-            "codigoModelo": model_code,
-        }
+        payload = build_years_payload(
+            self.reference_table_code, manufacturer_code, model_code, vehicle_type
+        )
         self.logger.info(f"Querying years with payload: {payload}")
-        time.sleep(1)  # Delay entre as requisições
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-
-        years = response.json()
+        years = self._catalog_post(
+            "years",
+            (vehicle_type, manufacturer_code, model_code),
+            "ConsultarAnoModelo",
+            payload,
+        )
         self.logger.info(f"Raw API response: {years}")
 
-        processed_years = []
-        available_fuel_types = set()
-
-        fuel_type_map = {"Gasolina": "1", "Álcool": "2", "Diesel": "3"}
-
-        for item in years:
-            label = item.get("Label", "")
-            value = item.get("Value", "")
-
-            # Extrai o ano do label
-            year_str = label.split(" ")[0]
-
-            # Verifica se o Value contém um hífen
-            if "-" in value:
-                fuel_type_number = value.split("-")[-1]  # Extrai o número após o hífen
-            else:
-                # Se não houver hífen, tenta pegar a palavra após o ano
-                fuel_type_from_label = (
-                    label.split(" ")[1] if len(label.split(" ")) > 1 else ""
-                )
-
-                fuel_type_number = fuel_type_map.get(fuel_type_from_label, "")
-
-            if fuel_type_number:
-                available_fuel_types.add(fuel_type_number)
-
-            # Verifica se o ano é válido e adiciona à lista de anos processados
-            if year_str.isdigit():
-                processed_years.append({"yearModel": year_str, "Label": label})
-            else:
-                self.logger.warning(f"Ignoring invalid year label: {label}")
+        processed_years, available_fuel_types = parse_years(years, self.logger)
 
         self.logger.info(f"Available fuel types: {available_fuel_types}")
         self.logger.info(f"Years obtained: {processed_years}")
@@ -168,23 +395,16 @@ class FipeAPI:
         self, manufacturer_code, model_code, year_model, vehicle_type, fuel_type
     ):
         """Obtém o preço do veículo para um determinado ano e tipo de combustível."""
-        url = f"{self.url_base}/ConsultarValorComTodosParametros"
-        payload = {
-            "codigoTabelaReferencia": self.reference_table_code,
-            "codigoTipoVeiculo": vehicle_type,
-            "codigoMarca": manufacturer_code,
-            "codigoModelo": model_code,
-            "anoModelo": year_model,
-            "codigoTipoCombustivel": fuel_type,
-            "modeloCodigoExterno": "",
-            "tipoConsulta": "tradicional",
-        }
+        payload = build_price_payload(
+            self.reference_table_code,
+            manufacturer_code,
+            model_code,
+            year_model,
+            vehicle_type,
+            fuel_type,
+        )
         self.logger.info(f"Querying price with payload: {payload}")
-        time.sleep(1)  # Delay entre as requisições
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-
-        price = response.json()
+        price = self._post("ConsultarValorComTodosParametros", payload)
         self.logger.info(f"Price obtained: {price}")
         return price
 
@@ -203,39 +423,23 @@ class FipeAPI:
         for i in range(0, len(data), chunk_size):
             yield data[i : i + chunk_size]
 
-    def send_sqs_messages(self, queue_url, messages):
-        batch_item_failures = []  # Para registrar falhas
-        try:
-            entries = [
-                {
-                    "Id": str(index),
-                    "MessageBody": json.dumps(message, ensure_ascii=False),
-                }
-                for index, message in enumerate(messages)
-            ]
-            self.logger.info(f"Preparing to send messages in chunks.")
-
-            chunked_entries = self.chunk_list(entries, 10)
-
-            for chunk in chunked_entries:
-                self.logger.info(f"Sending batch of messages: {chunk}")
-                response = self.sqs_client.send_message_batch(
-                    QueueUrl=queue_url, Entries=chunk
-                )
-                failed_messages = response.get("Failed", [])
-                if failed_messages:
-                    self.logger.warning(
-                        f"Failed to send some messages: {failed_messages}"
-                    )
-                    # Adiciona falhas ao batch_item_failures
-                    for failed in failed_messages:
-                        batch_item_failures.append({"itemIdentifier": failed["Id"]})
-                self.logger.info(f"Messages sent in batch: {chunk}")
+    def send_sqs_messages(self, queue_url, messages, pack=False):
+        """
+        Envia mensagens para a fila SQS em lotes limitados por quantidade e
+        tamanho, enviados em paralelo (ver `SqsBatchSender`).
 
-        except Exception as e:
-            self.logger.error(f"Error sending messages to SQS: {e}")
-            raise
-        finally:
-            self.logger.info("Finalizing SQS message sending.")
+        Com `pack=True`, os registros são agrupados em mensagens no formato
+        empacotado (ver `message_packing.pack_records`).
 
-        return batch_item_failures  # Retorna as falhas
+        Returns:
+            list: Falhas no formato de batchItemFailures, identificadas pela
+            posição da mensagem em `messages`
+        """
+        self.logger.info(f"Sending {len(messages)} messages to {queue_url}")
+        with SqsBatchSender(self.sqs_client, queue_url, pack=pack, metrics=self.metrics) as sender:
+            for index, message in enumerate(messages):
+                sender.add(message, tag=str(index))
+        failed_tags = sorted(sender.failed_tags, key=int)
+        if failed_tags:
+            self.logger.warning(f"Failed to send {len(failed_tags)} messages")
+        return [{"itemIdentifier": tag} for tag in failed_tags]
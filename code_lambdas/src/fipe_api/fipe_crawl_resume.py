@@ -0,0 +1,157 @@
+import os
+import json
+import argparse
+import logging
+import boto3
+from collections import defaultdict
+from crawl_progress import get_crawl_progress, UNIT_BRAND, UNIT_MODEL, UNIT_PRICE
+from sqs_sender import SqsBatchSender
+from time_budget import PENDING_PAIRS_FIELD
+from metrics import log_metrics
+
+# Configuração do logger
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def build_resume_messages(units):
+    """
+    Monta as mensagens que retomam as unidades incompletas de uma execução.
+
+    - marcas incompletas são reenviadas à fila de fabricantes; o
+      FipeModelLoader reenvia todos os seus modelos (os já concluídos são
+      ignorados pelo registro de idempotência);
+    - modelos incompletos de marcas concluídas são reenviados à fila de
+      modelos: com pares ano/combustível pendentes registrados, como uma
+      continuação só com esses pares (`pendingPairs`); sem pares registrados,
+      como a mensagem original do modelo.
+
+    Args:
+        units (list): Unidades incompletas (tipo, chave, chave_pai, status, payload)
+
+    Returns:
+        tuple: (mensagens de marca, mensagens de modelo)
+    """
+    brands = {}
+    models = {}
+    pairs_by_model = defaultdict(list)
+    for unit_type, key, parent_key, _, payload in units:
+        if unit_type == UNIT_BRAND:
+            brands[key] = payload
+        elif unit_type == UNIT_MODEL:
+            models[key] = (parent_key, payload)
+        elif unit_type == UNIT_PRICE:
+            pairs_by_model[parent_key].append(payload)
+
+    model_messages = []
+    for key, (brand_key, payload) in models.items():
+        if brand_key in brands:
+            # Reenviado pelo FipeModelLoader ao processar a marca
+            continue
+        pairs = pairs_by_model.get(key)
+        model_messages.append({**payload, PENDING_PAIRS_FIELD: pairs} if pairs else payload)
+    return list(brands.values()), model_messages
+
+
+def send_messages(queue_url, messages):
+    """Envia as mensagens em lotes; retorna a quantidade que falhou."""
+    if not messages:
+        return 0
+    with SqsBatchSender(boto3.client("sqs"), queue_url) as sender:
+        for index, message in enumerate(messages):
+            sender.add(message, tag=index)
+    return len(sender.failed_tags)
+
+
+def resume_run(reference_table_code=None, manufacturer_queue_url=None, model_queue_url=None,
+               dry_run=False):
+    """
+    Reenfileira somente as unidades não concluídas de uma execução do crawl.
+
+    Args:
+        reference_table_code (int): Tabela de referência (padrão: execução mais recente)
+        manufacturer_queue_url (str): Fila de fabricantes (padrão: SQS_MANUFACTURER_URL)
+        model_queue_url (str): Fila de modelos (padrão: SQS_MODEL_URL)
+        dry_run (bool): Apenas calcula o que seria reenfileirado
+
+    Returns:
+        dict: Resumo da retomada
+    """
+    progress = get_crawl_progress()
+    if progress is None:
+        raise ValueError("Progresso do crawl desabilitado (FIPE_CRAWL_PROGRESS/RDS_HOST)")
+
+    if reference_table_code is None:
+        reference_table_code = progress.latest_run_code()
+        if reference_table_code is None:
+            raise ValueError("Nenhuma execução do crawl registrada")
+    manufacturer_queue_url = manufacturer_queue_url or os.getenv("SQS_MANUFACTURER_URL")
+    model_queue_url = model_queue_url or os.getenv("SQS_MODEL_URL")
+
+    units = progress.incomplete_units(reference_table_code)
+    brand_messages, model_messages = build_resume_messages(units)
+    logger.info(
+        f"Retomada da tabela {reference_table_code}: {len(units)} unidades incompletas,"
+        f" {len(brand_messages)} marcas e {len(model_messages)} modelos a reenfileirar"
+    )
+
+    result = {
+        "codigoTabelaReferencia": int(reference_table_code),
+        "incomplete_units": len(units),
+        "brand_messages": len(brand_messages),
+        "model_messages": len(model_messages),
+        "failed_messages": 0,
+        "summary": progress.summary(reference_table_code),
+        "dry_run": dry_run,
+    }
+    if dry_run:
+        return result
+
+    if (brand_messages and not manufacturer_queue_url) or (model_messages and not model_queue_url):
+        raise ValueError("Variáveis de ambiente SQS_MANUFACTURER_URL/SQS_MODEL_URL não definidas")
+
+    result["failed_messages"] = (
+        send_messages(manufacturer_queue_url, brand_messages)
+        + send_messages(model_queue_url, model_messages)
+    )
+    progress.record_resume(reference_table_code, finished=not units)
+    return result
+
+
+@log_metrics
+def lambda_handler(event, context):
+    """
+    Handler para AWS Lambda
+
+    Evento: {"codigoTabelaReferencia": 300, "dryRun": false}; sem código, a
+    execução mais recente é retomada.
+    """
+    try:
+        result = resume_run(
+            reference_table_code=event.get("codigoTabelaReferencia"),
+            dry_run=bool(event.get("dryRun")),
+        )
+    except ValueError as e:
+        logger.error(f"Erro ao retomar o crawl: {e}")
+        return {"statusCode": 400, "body": json.dumps(str(e), ensure_ascii=False)}
+    return {"statusCode": 200, "body": json.dumps(result, ensure_ascii=False)}
+
+
+if __name__ == "__main__":
+    """
+    Ponto de entrada para execução local
+    """
+    parser = argparse.ArgumentParser(description="Retoma uma execução incompleta do crawl FIPE")
+    parser.add_argument("--reference-table-code", "-r", type=int,
+                        help="Código da tabela de referência (padrão: execução mais recente)")
+    parser.add_argument("--manufacturer-queue-url", help="Fila de fabricantes (padrão: SQS_MANUFACTURER_URL)")
+    parser.add_argument("--model-queue-url", help="Fila de modelos (padrão: SQS_MODEL_URL)")
+    parser.add_argument("--dry-run", action="store_true", help="Apenas mostra o que seria reenfileirado")
+    args = parser.parse_args()
+
+    print(json.dumps(resume_run(
+        reference_table_code=args.reference_table_code,
+        manufacturer_queue_url=args.manufacturer_queue_url,
+        model_queue_url=args.model_queue_url,
+        dry_run=args.dry_run,
+    ), ensure_ascii=False, indent=2))
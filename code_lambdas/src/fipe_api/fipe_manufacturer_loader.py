@@ -1,19 +1,110 @@
 import os
-import time
 import json
+import time
 import argparse
+import boto3
+from concurrent.futures import ThreadPoolExecutor
 from fipe_api_service import FipeAPI
+from sqs_sender import SqsBatchSender
+from time_budget import TimeBudget, TimeBudgetExceeded
+from crawl_progress import get_crawl_progress, brand_unit, STATUS_FAILED
+from metrics import log_metrics
 from pip._vendor.pygments.unistring import Pe
 
-def process_vehicle_types(is_local=False, local_output_file=None, period=None):
+def invoke_continuation(context, fipe_api, vehicle_types):
+    """
+    Invoca assincronamente esta mesma Lambda para os tipos de veículo restantes,
+    fixando a tabela de referência já resolvida nesta invocação.
+    """
+    payload = {
+        "codigoTabelaReferencia": fipe_api.reference_table_code,
+        "mesReferenciaAno": fipe_api.reference_month_name,
+        "vehicle_types": vehicle_types,
+    }
+    boto3.client("lambda").invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType="Event",
+        Payload=json.dumps(payload, ensure_ascii=False),
+    )
+    print(f"Continuation invoked for vehicle types {vehicle_types}")
+
+
+def build_brand_messages(fipe_api, vehicle_type, brands, test=False):
+    """
+    Monta as mensagens de marca (uma por marca) de um tipo de veículo.
+
+    Args:
+        fipe_api (FipeAPI): Cliente com a tabela de referência já resolvida
+        vehicle_type (int): Tipo de veículo
+        brands (list): Marcas retornadas por ConsultarMarcas
+        test (bool): Limita a 3 marcas por tipo (testes em dev)
+    """
+    messages = []
+    for index, brand in enumerate(brands, start=1):
+        if test and index > 3:
+            print(f"Skipping brand {brand.get('Label')} for vehicle type {vehicle_type} in dev test.")
+            continue
+        brand_code = str(brand.get('Value'))
+        brand_name = str(brand.get('Label'))
+
+        if not (brand_code and brand_name):
+            print(f"Missing 'Value' or 'Label' in brand: {brand}")
+            continue
+
+        messages.append({
+            "codigoTabelaReferencia": fipe_api.reference_table_code,
+            "mesReferenciaAno": fipe_api.reference_month_name,
+            "codigoMarca": brand_code,
+            "nomeMarca": brand_name,
+            "codigoTipoVeiculo": vehicle_type
+        })
+    return messages
+
+
+def fetch_brands(fipe_api, vehicle_type, time_budget=None):
+    """
+    Consulta as marcas de um tipo de veículo; retorna (tipo, marcas, erro)
+    para que a falha de um tipo não interrompa os demais. Com o tempo da
+    invocação esgotado, a API não é consultada e o erro é TimeBudgetExceeded.
+    """
+    if time_budget is not None and time_budget.exhausted():
+        return vehicle_type, None, TimeBudgetExceeded()
+    try:
+        print(f"Starting process for vehicle type {vehicle_type}...")
+        return vehicle_type, fipe_api.get_brands(vehicle_type), None
+    except Exception as e:
+        print(f"Error processing vehicle type {vehicle_type}: {e}")
+        return vehicle_type, None, e
+
+
+def process_vehicle_types(is_local=False, local_output_file=None, period=None,
+                          vehicle_types=None, reference=None, context=None):
     """
     Função principal que processa os tipos de veículos
+
+    As marcas de todos os tipos de veículo são consultadas em paralelo e as
+    mensagens são enviadas em lotes (`SqsBatchSender`). Esta invocação é o
+    início de todo o pipeline mensal, então sua latência total é reportada no
+    resultado (`latency_seconds`).
+
+    Antes de montar e enviar as mensagens de cada tipo de veículo, o tempo
+    restante da invocação é verificado: esgotado, os tipos ainda não
+    enviados seguem em uma nova invocação (`invoke_continuation`).
     
     Args:
         is_local (bool): Indica se está rodando localmente
         local_output_file (str): Caminho para arquivo de saída local (quando is_local=True)
+        period (tuple): Período (mes, ano) da tabela de referência
+        vehicle_types (list): Tipos de veículo a processar (padrão: todos)
+        reference (dict): Tabela de referência já resolvida (codigoTabelaReferencia/mesReferenciaAno)
+        context: Contexto AWS Lambda, usado para controlar o tempo restante
     """
-    fipe_api = FipeAPI(period=period)
+    started_at = time.monotonic()
+    if reference and reference.get("codigoTabelaReferencia"):
+        fipe_api = FipeAPI.from_message(reference)
+    else:
+        fipe_api = FipeAPI(period=period)
+    time_budget = TimeBudget(context)
     queue_url = os.getenv('SQS_OUTPUT_URL')
     stage = os.getenv('STAGE')
     test = os.getenv('TEST')
@@ -31,57 +122,80 @@ def process_vehicle_types(is_local=False, local_output_file=None, period=None):
     
     print(f"Usando fila de saída: {queue_url}")
     
-    vehicle_types = [3, 1, 2]  # 1: Car, 2: Motorcycle, 3: Truck
-    delay = 1.0  # Delay aumentado para 1 segundo
+    vehicle_types = vehicle_types or [3, 1, 2]  # 1: Car, 2: Motorcycle, 3: Truck
+    remaining_vehicle_types = []
+    failed_vehicle_types = []
+    failed_messages = []
 
     # Para armazenar mensagens localmente em vez de enviar para SQS
     local_messages = []
+    message_count = 0
 
-    for vehicle_type in vehicle_types:
-        try:
-            print(f"Starting process for vehicle type {vehicle_type}...")
-            brands = fipe_api.get_brands(vehicle_type)
-            
+    # Resolve a tabela de referência uma única vez, antes das consultas paralelas
+    progress = None if is_local else get_crawl_progress()
+    if vehicle_types:
+        reference_table_code = fipe_api.reference_table_code
+        if progress:
+            progress.start_run(reference_table_code, fipe_api.reference_month_name)
+
+    # Consulta as marcas de todos os tipos de veículo em paralelo
+    results = []
+    if vehicle_types:
+        with ThreadPoolExecutor(max_workers=len(vehicle_types)) as executor:
+            results = list(executor.map(
+                lambda vehicle_type: fetch_brands(fipe_api, vehicle_type, time_budget), vehicle_types
+            ))
+    fetch_seconds = time.monotonic() - started_at
+
+    sent_messages = {}
+    sender = None
+    if not is_local and vehicle_types:
+        sender = SqsBatchSender(fipe_api.sqs_client, queue_url)
+    try:
+        for vehicle_type, brands, error in results:
+            if isinstance(error, TimeBudgetExceeded) or time_budget.exhausted():
+                # Tempo da invocação esgotado: o tipo segue em uma nova invocação
+                remaining_vehicle_types.append(vehicle_type)
+                continue
+            if error is not None:
+                failed_vehicle_types.append(vehicle_type)
+                continue
             if not brands:
                 print(f"No brands found for vehicle type {vehicle_type}.")
                 continue
 
             print(f"Found {len(brands)} brands for vehicle type {vehicle_type}.")
+            messages = build_brand_messages(fipe_api, vehicle_type, brands, test=test == 'true')
+            message_count += len(messages)
+
+            if is_local:
+                # Salvar mensagens localmente em vez de enviar para SQS
+                local_messages.extend(messages)
+                print(f"Locally saved {len(messages)} messages for vehicle type {vehicle_type}")
+            else:
+                for message in messages:
+                    tag = (vehicle_type, message["codigoMarca"])
+                    sent_messages[tag] = message
+                    sender.add(message, tag=tag)
+    finally:
+        if sender is not None:
+            failed_messages = sorted(sender.close())
+
+    if failed_messages:
+        print(f"Error sending {len(failed_messages)} brand messages to SQS: {failed_messages}")
+
+    if remaining_vehicle_types:
+        try:
+            invoke_continuation(context, fipe_api, remaining_vehicle_types)
+        except Exception as e:
+            print(f"Error invoking continuation for {remaining_vehicle_types}: {e}")
 
-            for index, brand in enumerate(brands, start=1):
-                if test == 'true' and index > 3:
-                    print(f"Skipping brand {brand.get('Label')} for vehicle type {vehicle_type} in dev test.")
-                    continue
-                brand_code = str(brand.get('Value'))
-                brand_name = str(brand.get('Label'))
-                
-                if not (brand_code and brand_name):
-                    print(f"Missing 'Value' or 'Label' in brand: {brand}")
-                    continue
-
-                print(f"Processing brand '{brand_name}' (Code: {brand_code}) for vehicle type {vehicle_type}.")
-
-                message = {
-                    "codigoTabelaReferencia": fipe_api.reference_table_code,
-                    "mesReferenciaAno": fipe_api.reference_month_name,
-                    "codigoMarca": brand_code,
-                    "nomeMarca": brand_name,
-                    "codigoTipoVeiculo": vehicle_type
-                }
-                
-                if is_local:
-                    # Salvar mensagem localmente em vez de enviar para SQS
-                    local_messages.append(message)
-                    print(f"Locally saved message for brand '{brand_name}'")
-                else:
-                    # Enviar para SQS quando estiver no Lambda
-                    fipe_api.send_message_sqs(queue_url, message)
-                    print(f"Message sent to SQS for brand '{brand_name}'")
-                
-                time.sleep(delay)
-
-        except Exception as e: 
-            print(f"Error processing vehicle type {vehicle_type}: {e}")
+    if progress and sent_messages:
+        # Marcas enfileiradas ficam pendentes até o FipeModelLoader concluí-las
+        progress.add_pending(
+            brand_unit(message) for tag, message in sent_messages.items() if tag not in failed_messages
+        )
+        progress.mark((brand_unit(sent_messages[tag]) for tag in failed_messages), STATUS_FAILED)
 
     # Se estiver rodando localmente e tiver mensagens, salva em arquivo
     if is_local and local_messages and local_output_file:
@@ -92,13 +206,27 @@ def process_vehicle_types(is_local=False, local_output_file=None, period=None):
         except Exception as e:
             print(f"Error saving local messages to file: {e}")
 
+    latency_seconds = round(time.monotonic() - started_at, 3)
     print("Processing completed for all vehicle types.")
+    print(f"Rate limiter: {fipe_api.rate_limiter.stats()}")
+    print(
+        f"Start-of-pipeline latency: {latency_seconds}s"
+        f" (brand listings: {round(fetch_seconds, 3)}s, {message_count} messages)"
+    )
     return {
         'statusCode': 200,
         'body': 'Processing completed successfully!',
-        'message_count': len(local_messages) if is_local else None
+        'message_count': message_count,
+        'continued_vehicle_types': remaining_vehicle_types,
+        'failed_vehicle_types': failed_vehicle_types,
+        'failed_messages': [
+            {'codigoTipoVeiculo': vehicle_type, 'codigoMarca': brand_code}
+            for vehicle_type, brand_code in failed_messages
+        ],
+        'latency_seconds': latency_seconds,
     }
 
+@log_metrics
 def lambda_handler(event, context):
     """
     Handler para AWS Lambda
@@ -108,7 +236,13 @@ def lambda_handler(event, context):
     mes = int(event.get('mes', 0))
     ano = int(event.get('ano', 0))
         
-    return process_vehicle_types(is_local=False, period=(mes, ano))
+    return process_vehicle_types(
+        is_local=False,
+        period=(mes, ano),
+        vehicle_types=event.get('vehicle_types'),
+        reference=event,
+        context=context,
+    )
 
 if __name__ == "__main__":
     """
@@ -2,13 +2,20 @@ import json
 import requests
 import os
 import logging
-import time
 from fipe_api_service import FipeAPI
+from rate_limiter import parse_retry_after
+from retry_scheduler import RetryScheduler
+from sqs_sender import SqsBatchSender, add_send_failures
+from time_budget import TimeBudget
+from idempotency_ledger import check_records, mark_completed, STAGE_MODELS
+from crawl_progress import get_crawl_progress, ProgressRecorder, brand_unit, model_unit
+from metrics import log_metrics
 
 # Configure logger
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+@log_metrics
 def lambda_handler(event, context):
     """
     Função Lambda para carregar modelos da API FIPE com base nos fabricantes recebidos via SQS.
@@ -27,6 +34,8 @@ def lambda_handler(event, context):
     
     try:
         fipe_api = FipeAPI()
+        retry_scheduler = RetryScheduler(fipe_api.sqs_client)
+        time_budget = TimeBudget(context)
         
         # Obter URLs das filas a partir das variáveis de ambiente
         output_queue_url = os.environ.get("SQS_OUTPUT_URL")
@@ -42,9 +51,17 @@ def lambda_handler(event, context):
         logger.info(f"Usando fila de saída: {output_queue_url}")
         logger.info(f"Processando {len(event['Records'])} mensagens da fila SQS...")
         
-        batch = []
         batch_item_failures = []
         
+        # Fabricantes já processados (entregas duplicadas do SQS) são
+        # identificados com uma única consulta ao registro de idempotência
+        ledger, entries, done = check_records(STAGE_MODELS, event["Records"])
+        completed = []
+        progress = ProgressRecorder(get_crawl_progress())
+        
+        # Os modelos são enviados em lotes à medida que são obtidos
+        sender = SqsBatchSender(fipe_api.sqs_client, output_queue_url)
+        
         for record in event["Records"]:
             message_id = record["messageId"]
             logger.info(f"Processando mensagem: {message_id}")
@@ -53,6 +70,20 @@ def lambda_handler(event, context):
                 message = json.loads(record["body"])
                 logger.info(f"Conteúdo da mensagem: {json.dumps(message, ensure_ascii=False)}")
                 
+                if entries[message_id] in done:
+                    logger.info(f"Fabricante já processado, mensagem duplicada ignorada: {message_id}")
+                    progress.track(message_id, brand_unit, message)
+                    completed.append(message_id)
+                    continue
+                
+                progress.track(message_id, brand_unit, message)
+                
+                if time_budget.exhausted():
+                    # Tempo da invocação esgotado: reenfileira a mensagem sem consultar a API
+                    if not retry_scheduler.requeue(record, message):
+                        batch_item_failures.append({"itemIdentifier": message_id})
+                    continue
+                
                 brand_code = message.get("codigoMarca")
                 vehicle_type = message.get("codigoTipoVeiculo")
                 reference_table_code = message.get("codigoTabelaReferencia")
@@ -70,75 +101,53 @@ def lambda_handler(event, context):
                 vehicle_type_name = vehicle_type_map.get(vehicle_type, "Desconhecido")
                 logger.info(f"Consultando modelos para: {manufacturer_name} ({vehicle_type_name})")
                 
-                # Tentar obter os modelos com retry em caso de erro 429 (rate limit)
-                retries = 2
-                delay = 5  # Delay inicial em segundos
+                # Usa a tabela de referência da própria mensagem (sem consultar a API)
+                record_api = FipeAPI.from_message(message)
                 
-                while retries > 0:
-                    try:
-                        models = fipe_api.get_models(brand_code, vehicle_type)
-                        
-                        if not isinstance(models, dict):
-                            logger.error(f"Resposta inesperada da API: {models}")
-                            batch_item_failures.append({"itemIdentifier": message_id})
-                            break
-                        
-                        model_list = models.get("Modelos", [])
-                        if not isinstance(model_list, list):
-                            logger.error(f"Campo 'Modelos' não é uma lista: {models}")
+                try:
+                    models = record_api.get_models(brand_code, vehicle_type)
+                except requests.HTTPError as e:
+                    if hasattr(e, 'response') and e.response.status_code == 429:
+                        # Reagenda a mensagem na fila em vez de aguardar dentro da Lambda
+                        retry_after = parse_retry_after(e.response.headers.get("Retry-After"))
+                        if not retry_scheduler.schedule(record, message, retry_after):
                             batch_item_failures.append({"itemIdentifier": message_id})
-                            break
-                        
-                        logger.info(f"Encontrados {len(model_list)} modelos para {manufacturer_name}")
-                        
-                        for model in model_list:
-                            model_code = model.get("Value", "Unknown")
-                            model_name = model.get("Label", "Unknown")
-                            
-                            message_to_send = {
-                                "manufacturer": manufacturer_name,
-                                "manufacturer_code": brand_code,
-                                "model": model_name,
-                                "model_code": model_code,
-                                "vehicle_type": vehicle_type,
-                                "mesReferenciaAno": reference_month_name,
-                                "codigoTabelaReferencia": reference_table_code,
-                            }
-                            
-                            batch.append(message_to_send)
-                            
-                            # Enviar em lotes para evitar exceder limites
-                            if len(batch) >= 10:
-                                failures = fipe_api.send_sqs_messages(output_queue_url, batch)
-                                batch_item_failures.extend(failures)
-                                batch = []  # Limpar o lote após envio
-                                
-                                # Pequeno delay entre lotes para evitar throttling
-                                time.sleep(0.5)
-                        
-                        # Mensagem processada com sucesso
-                        break
-                        
-                    except requests.HTTPError as e:
-                        if hasattr(e, 'response') and e.response.status_code == 429:
-                            logger.warning(f"[429] - Rate limit excedido. Aguardando {delay} segundos...")
-                            time.sleep(delay)
-                            retries -= 1
-                            delay *= 2  # Aumento exponencial do delay
-                        else:
-                            logger.error(f"Erro HTTP ao consultar modelos: {str(e)}")
-                            batch_item_failures.append({"itemIdentifier": message_id})
-                            break
-                            
-                    except Exception as e:
-                        logger.error(f"Erro ao processar mensagem: {str(e)}")
+                    else:
+                        logger.error(f"Erro HTTP ao consultar modelos: {str(e)}")
                         batch_item_failures.append({"itemIdentifier": message_id})
-                        break
+                    continue
                 
-                # Se esgotou as tentativas e ainda está no loop, adicionar à lista de falhas
-                if retries == 0:
-                    logger.error(f"Esgotadas as tentativas para a mensagem {message_id}")
+                if not isinstance(models, dict):
+                    logger.error(f"Resposta inesperada da API: {models}")
                     batch_item_failures.append({"itemIdentifier": message_id})
+                    continue
+                
+                model_list = models.get("Modelos", [])
+                if not isinstance(model_list, list):
+                    logger.error(f"Campo 'Modelos' não é uma lista: {models}")
+                    batch_item_failures.append({"itemIdentifier": message_id})
+                    continue
+                
+                logger.info(f"Encontrados {len(model_list)} modelos para {manufacturer_name}")
+                
+                for model in model_list:
+                    model_code = model.get("Value", "Unknown")
+                    model_name = model.get("Label", "Unknown")
+                    
+                    message_to_send = {
+                        "manufacturer": manufacturer_name,
+                        "manufacturer_code": brand_code,
+                        "model": model_name,
+                        "model_code": model_code,
+                        "vehicle_type": vehicle_type,
+                        "mesReferenciaAno": reference_month_name,
+                        "codigoTabelaReferencia": reference_table_code,
+                    }
+                    
+                    sender.add(message_to_send, tag=message_id)
+                    progress.child_pending(message_id, model_unit, message_to_send)
+                
+                completed.append(message_id)
             
             except json.JSONDecodeError as e:
                 logger.error(f"Erro ao decodificar mensagem JSON: {str(e)}")
@@ -148,17 +157,11 @@ def lambda_handler(event, context):
                 logger.error(f"Erro não tratado ao processar mensagem {message_id}: {str(e)}")
                 batch_item_failures.append({"itemIdentifier": message_id})
         
-        # Enviar qualquer item restante no lote
-        if batch:
-            try:
-                logger.info(f"Enviando lote final com {len(batch)} mensagens")
-                failures = fipe_api.send_sqs_messages(output_queue_url, batch)
-                batch_item_failures.extend(failures)
-            except Exception as e:
-                logger.error(f"Erro ao enviar lote final: {str(e)}")
-                # Se falhar ao enviar o lote final, marcar todas as mensagens do lote como falhas
-                for record in event["Records"]:
-                    batch_item_failures.append({"itemIdentifier": record["messageId"]})
+        # Envia os lotes restantes; mensagens cujos modelos não foram enviados falham
+        add_send_failures(sender, event["Records"], batch_item_failures)
+        
+        mark_completed(ledger, entries, completed, batch_item_failures)
+        progress.flush(completed, batch_item_failures)
         
         total_failures = len(batch_item_failures)
         total_records = len(event["Records"])
@@ -169,6 +172,10 @@ def lambda_handler(event, context):
         if total_failures > 0:
             logger.warning(f"{total_failures} mensagens não puderam ser processadas")
         
+        logger.info(f"Limitador de taxa: {fipe_api.rate_limiter.stats()}")
+        logger.info(f"Mensagens reagendadas por throttling: {retry_scheduler.scheduled}")
+        logger.info(f"Mensagens reenfileiradas por tempo: {retry_scheduler.requeued}")
+        
         return {
             "statusCode": 200,
             "body": json.dumps("Processamento concluído"),
@@ -2,35 +2,217 @@ import json
 import requests
 import os
 import logging
-import time
+import asyncio
 from fipe_api_service import FipeAPI
+from rate_limiter import parse_retry_after
+from retry_scheduler import RetryScheduler
+from message_packing import PACK_MESSAGES
+from sqs_sender import SqsBatchSender, add_send_failures
+from idempotency_ledger import check_records, mark_completed, STAGE_PRICES
+from crawl_progress import get_crawl_progress, ProgressRecorder, model_unit, price_unit
+from metrics import log_metrics
+from time_budget import (
+    TimeBudget,
+    TimeBudgetExceeded,
+    PENDING_PAIRS_FIELD,
+    build_continuation,
+)
 
 # Configuração do logger
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Habilita o caminho assíncrono (consultas de preço concorrentes)
+ASYNC_ENABLED = os.getenv("FIPE_ASYNC_ENABLED", "false").lower() == "true"
 
+
+def build_price_record(message, year, fuel_type_code, price):
+    """
+    Monta o registro de preço enviado à fila do FipeSomaIngestor.
+
+    Args:
+        message (dict): Mensagem do modelo recebida da fila SQS
+        year (dict): Ano processado ({"yearModel": ..., "Label": ...})
+        fuel_type_code (str): Código do tipo de combustível
+        price (dict): Resposta de ConsultarValorComTodosParametros
+
+    Returns:
+        dict: Registro completo do preço
+    """
+    return {
+        "manufacturer": message.get("manufacturer", "Unknown"),
+        "manufacturer_code": message["manufacturer_code"],
+        "model": message.get("model", "Unknown"),
+        "model_code": message["model_code"],
+        "model_year": year.get("Label", "Unknown"),
+        "model_year_code": year.get("yearModel", "Unknown"),
+        "fipe_value": price.get("Valor", ""),
+        "fipe_code": price.get("CodigoFipe", ""),
+        "fuel_type": fuel_type_code,
+        "vehicle_type": message["vehicle_type"],
+        "mesReferenciaAno": message.get("mesReferenciaAno", "Desconhecido"),
+        "codigoTabelaReferencia": message["codigoTabelaReferencia"],
+    }
+
+
+def expand_year_fuel_pairs(years, available_fuel_types):
+    """
+    Expande os anos de um modelo nos pares (ano, combustível) a consultar.
+
+    Usa o combustível de cada item de ConsultarAnoModelo; somente itens sem
+    combustível identificado recorrem ao produto com todos os combustíveis.
+
+    Args:
+        years (list): Anos retornados por `FipeAPI.get_years`
+        available_fuel_types (set): Tipos de combustível disponíveis
+
+    Returns:
+        tuple: (lista de pares (ano, código do combustível), requisições economizadas
+        em relação ao produto cartesiano ano x combustível)
+    """
+    pairs = []
+    seen = set()
+    for year in years:
+        fuel_type = year.get("fuelType")
+        fuel_types = [fuel_type] if fuel_type else sorted(available_fuel_types)
+        for fuel_type in fuel_types:
+            fuel_type_code = fuel_type.split("-")[-1] if "-" in fuel_type else fuel_type
+            key = (year.get("yearModel"), fuel_type_code)
+            if key not in seen:
+                seen.add(key)
+                pairs.append((year, fuel_type_code))
+
+    saved_requests = len(years) * len(available_fuel_types) - len(pairs)
+    return pairs, max(saved_requests, 0)
+
+
+def pending_year_fuel_pairs(message):
+    """
+    Retorna os pares ano/combustível pendentes de uma mensagem de continuação,
+    ou None se a mensagem é de um modelo ainda não iniciado.
+    """
+    pending = message.get(PENDING_PAIRS_FIELD)
+    if pending is None:
+        return None
+    return [(year, year.get("fuelType")) for year in pending]
+
+
+def requeue_remaining(record, message, pending, throttle_error, retry_scheduler):
+    """
+    Reenfileira o trabalho restante de um modelo, se houver.
+
+    Com throttling (429) a continuação é reagendada com backoff; com o tempo da
+    invocação esgotado ela é reenfileirada imediatamente. Somente os pares
+    ainda não consultados seguem na continuação.
+
+    Returns:
+        bool: True se o registro SQS original pode ser considerado concluído
+    """
+    if throttle_error is not None:
+        retry_after = parse_retry_after(throttle_error.response.headers.get("Retry-After"))
+        continuation = build_continuation(message, pending) if pending else message
+        return retry_scheduler.schedule(record, continuation, retry_after)
+    if pending:
+        return retry_scheduler.requeue(record, build_continuation(message, pending))
+    return True
+
+
+def fetch_model_prices(api, message, time_budget):
+    """
+    Consulta sequencialmente os preços dos pares ano/combustível de um modelo.
+
+    Interrompe as consultas ao receber 429 ou quando o tempo da invocação se
+    esgota, devolvendo os pares restantes para a continuação.
+
+    Args:
+        api (FipeAPI): Cliente da API FIPE
+        message (dict): Mensagem do modelo (ou continuação) recebida da fila SQS
+        time_budget (TimeBudget): Controle do tempo restante da invocação
+
+    Returns:
+        tuple: (registros de preço, pares pendentes, requisições economizadas,
+        erro 429 que interrompeu as consultas ou None)
+    """
+    manufacturer_code = message["manufacturer_code"]
+    model_code = message["model_code"]
+    vehicle_type = message["vehicle_type"]
+    model_name = message.get("model", "Unknown")
+
+    saved = 0
+    year_fuel_pairs = pending_year_fuel_pairs(message)
+    if year_fuel_pairs is None:
+        try:
+            # Obtém os anos e tipos de combustível disponíveis
+            years, available_fuel_types = api.get_years(
+                manufacturer_code, model_code, vehicle_type
+            )
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 429:
+                return [], [], 0, e
+            raise
+        year_fuel_pairs, saved = expand_year_fuel_pairs(years, available_fuel_types)
+    logger.info(
+        f"{len(year_fuel_pairs)} pares ano/combustível para {model_name} ({saved} requisições economizadas)"
+    )
+
+    model_records = []
+    for index, (year, fuel_type_code) in enumerate(year_fuel_pairs):
+        if time_budget.exhausted():
+            return model_records, year_fuel_pairs[index:], saved, None
+
+        year_model = year.get("yearModel", "Unknown")
+        year_name = year.get("Label", "Unknown")
+        logger.info(
+            f"Attempting to get price for fuel type: {fuel_type_code} (Year: {year_model}, Label: {year_name}, Model: {model_name})"
+        )
+        try:
+            price = api.get_price(
+                manufacturer_code,
+                model_code,
+                year_model,
+                vehicle_type,
+                fuel_type_code,
+            )
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 429:
+                return model_records, year_fuel_pairs[index:], saved, e
+            raise
+
+        if price:
+            complete_data = build_price_record(message, year, fuel_type_code, price)
+            logger.info(
+                f"Data to be sent: {json.dumps(complete_data, indent=4, ensure_ascii=False)}"
+            )
+            model_records.append(complete_data)
+
+    return model_records, [], saved, None
+
+
+def record_pair_progress(progress, message_id, message, model_records, pending):
+    """
+    Registra no progresso do crawl os pares ano/combustível consultados
+    (concluídos) e os que seguem pendentes na continuação do modelo.
+    """
+    for complete_data in model_records:
+        year = {"yearModel": complete_data["model_year_code"], "Label": complete_data["model_year"]}
+        progress.child_done(message_id, price_unit, message, year, complete_data["fuel_type"])
+    for year, fuel_type_code in pending:
+        progress.child_pending(message_id, price_unit, message, year, fuel_type_code)
+
+
+@log_metrics
 def lambda_handler(event, context):
 
+    if ASYNC_ENABLED:
+        return asyncio.run(async_lambda_handler(event, context))
+
     fipe_api = FipeAPI()
+    retry_scheduler = RetryScheduler(fipe_api.sqs_client)
+    time_budget = TimeBudget(context)
     logger.info("Processing SQS messages...")
     output_queue_url = os.getenv("SQS_OUTPUT_URL")
     batch_item_failures = []
 
-    # Função para enviar um lote de mensagens    
-    def send_batch(batch):
-        try:
-            logger.info(f"Enviando lote com {len(batch)} mensagens para {output_queue_url}")
-            failures = fipe_api.send_sqs_messages(output_queue_url, batch)  # Captura as falhas
-            batch_item_failures.extend(failures)  # Adiciona as falhas à lista de falhas
-            logger.info(f"Batch sent successfully.")
-        except Exception as e:
-            logger.error(f"Error sending batch to SQS: {e}")
-            # Se falhar ao enviar o lote, marcar todas as mensagens do lote como falhas
-            for record in event["Records"]:
-                batch_item_failures.append({"itemIdentifier": record["messageId"]})
-    
-    
     if not output_queue_url:
         logger.error("Variável de ambiente SQS_OUTPUT_URL não definida")
         return {
@@ -41,99 +223,54 @@ def lambda_handler(event, context):
     
     logger.info(f"Usando fila de saída: {output_queue_url}")
 
-    batch = []
+    # Os preços são enviados à medida que são obtidos; o envio bloqueia a
+    # coleta quando há lotes demais pendentes
+    sender = SqsBatchSender(fipe_api.sqs_client, output_queue_url, pack=PACK_MESSAGES)
+    saved_requests = 0
 
-    for index, record in enumerate(event["Records"], start=1):
+    # Modelos já processados (entregas duplicadas) não consultam a API
+    ledger, entries, done = check_records(STAGE_PRICES, event["Records"])
+    completed = []
+    progress = ProgressRecorder(get_crawl_progress())
+
+    for record in event["Records"]:
         message_id = record["messageId"]
         try:
             message = json.loads(record["body"])
             logger.info(f"Message received: {message} (Message ID: {message_id})")
 
-            # Ajuste das chaves
-            reference_table_code = message["codigoTabelaReferencia"]
-            vehicle_type = message["vehicle_type"]
-            manufacturer_code = message["manufacturer_code"]
-            model_code = message["model_code"]
-            year_model = message.get("anoModelo", "Unknown")
-            manufacturer_name = message.get("manufacturer", "Unknown")
-            model_name = message.get("model", "Unknown")
-            reference_month_name = message.get("mesReferenciaAno", "Desconhecido")
-
-            retries = 2
-            delay = 5
-            success = False
-            while retries > 0 and not success:
-                try:
-                    # Obtém os anos e tipos de combustível disponíveis
-                    years, available_fuel_types = fipe_api.get_years(
-                        manufacturer_code, model_code, vehicle_type
-                    )
-
-                    for year in years:
-                        year_model = year.get("yearModel", "Unknown")
-                        year_name = year.get("Label", "Unknown")
-                        logger.info(f"Processing year: {year_model}, Label: {year_name}")
-
-                        for fuel_type in available_fuel_types:
-                            fuel_type_code = fuel_type.split("-")[-1] if "-" in fuel_type else fuel_type
-
-                            logger.info(
-                                f"Attempting to get price for fuel type: {fuel_type_code} (Year: {year_model}, Model: {model_name})"
-                            )
-
-                            price = fipe_api.get_price(
-                                manufacturer_code,
-                                model_code,
-                                year_model,
-                                vehicle_type,
-                                fuel_type_code,
-                            )
-
-                            if price:
-                                complete_data = {
-                                    "manufacturer": manufacturer_name,
-                                    "manufacturer_code": manufacturer_code,
-                                    "model": model_name,
-                                    "model_code": model_code,
-                                    "model_year": year_name,
-                                    "model_year_code": year_model,
-                                    "fipe_value": price.get("Valor", ""),
-                                    "fipe_code": price.get("CodigoFipe", ""),
-                                    "fuel_type": fuel_type_code,
-                                    "vehicle_type": vehicle_type,
-                                    "mesReferenciaAno": reference_month_name,
-                                    "codigoTabelaReferencia": reference_table_code,
-                                }
-                                logger.info(
-                                    f"Data to be sent: {json.dumps(complete_data, indent=4, ensure_ascii=False)}"
-                                )
-                                batch.append(complete_data)
-                    success = True
-                    break
-
-                except requests.HTTPError as e:
-                    if hasattr(e, 'response') and e.response.status_code == 429:
-                        logger.warning(
-                            f"[429] - Rate limit exceeded. Waiting for {delay} seconds..."
-                        )
-                        time.sleep(delay)
-                        retries -= 1
-                        delay *= 2  # Exponential backoff
-                    else:
-                        logger.error(f"HTTP Error: {e}")
-                        batch_item_failures.append({"itemIdentifier": message_id})
-                        break
-
-                except Exception as e:
-                    logger.error(f"Error processing message: {e}")
+            if entries[message_id] in done:
+                logger.info(f"Modelo já processado, mensagem duplicada ignorada: {message_id}")
+                progress.track(message_id, model_unit, message)
+                completed.append(message_id)
+            elif time_budget.exhausted():
+                # Nenhuma consulta feita para esta mensagem: reenfileira como está
+                if not retry_scheduler.requeue(record, message):
                     batch_item_failures.append({"itemIdentifier": message_id})
-                    break
-            
-            # Se esgotou as tentativas e ainda não teve sucesso
-            if retries == 0 and not success:
-                logger.error(f"Esgotadas as tentativas para a mensagem {message_id}")
-                batch_item_failures.append({"itemIdentifier": message_id})
-                
+            else:
+                progress.track(message_id, model_unit, message)
+                # Usa a tabela de referência da própria mensagem (sem consultar a API)
+                record_api = FipeAPI.from_message(message)
+
+                model_records, pending, saved, throttle_error = fetch_model_prices(
+                    record_api, message, time_budget
+                )
+                for complete_data in model_records:
+                    sender.add(complete_data, tag=message_id)
+                saved_requests += saved
+                record_pair_progress(progress, message_id, message, model_records, pending)
+
+                if not requeue_remaining(
+                    record, message, pending, throttle_error, retry_scheduler
+                ):
+                    batch_item_failures.append({"itemIdentifier": message_id})
+                elif not pending and throttle_error is None:
+                    completed.append(message_id)
+
+        except requests.HTTPError as e:
+            logger.error(f"HTTP Error: {e}")
+            batch_item_failures.append({"itemIdentifier": message_id})
+
         except json.JSONDecodeError as e:
             logger.error(f"Erro ao decodificar mensagem JSON: {str(e)}")
             batch_item_failures.append({"itemIdentifier": message_id})
@@ -141,15 +278,10 @@ def lambda_handler(event, context):
         except Exception as e:
             logger.error(f"Erro não tratado ao processar mensagem {message_id}: {str(e)}")
             batch_item_failures.append({"itemIdentifier": message_id})
-            
-        if index % 10 == 0:
-            send_batch(batch)
-            batch.clear()
-            time.sleep(0.5)
 
-    if batch:
-        send_batch(batch)
-        
+    add_send_failures(sender, event["Records"], batch_item_failures)
+    mark_completed(ledger, entries, completed, batch_item_failures)
+    progress.flush(completed, batch_item_failures)
 
     total_failures = len(batch_item_failures)
     total_records = len(event["Records"])
@@ -160,8 +292,200 @@ def lambda_handler(event, context):
     if total_failures > 0:
         logger.warning(f"{total_failures} mensagens não puderam ser processadas")
 
+    logger.info(f"Requisições de preço economizadas (pares ano/combustível): {saved_requests}")
+    logger.info(f"Limitador de taxa: {fipe_api.rate_limiter.stats()}")
+    logger.info(f"Mensagens reagendadas por throttling: {retry_scheduler.scheduled}")
+    logger.info(f"Continuações reenfileiradas por tempo: {retry_scheduler.requeued}")
+
+    return {
+        "statusCode": 200,
+        "body": json.dumps("Processing completed successfully"),
+        "batchItemFailures": batch_item_failures,
+        "savedRequests": saved_requests,
+    }
+
+
+async def fetch_model_prices_async(api, message):
+    """
+    Consulta concorrentemente os preços de todos os pares ano/combustível de um modelo.
+
+    A ordem dos registros retornados é a mesma do caminho síncrono. Pares que
+    receberam 429 ou que não chegaram a ser consultados antes do fim do tempo
+    da invocação são devolvidos como pendentes.
+
+    Args:
+        api (AsyncFipeAPI): Cliente assíncrono da API FIPE
+        message (dict): Mensagem do modelo (ou continuação) recebida da fila SQS
+
+    Returns:
+        tuple: (registros de preço no formato de `build_price_record`, pares
+        pendentes, requisições economizadas, erro 429 ou None)
+    """
+    from async_fipe_api_service import is_throttled
+
+    manufacturer_code = message["manufacturer_code"]
+    model_code = message["model_code"]
+    vehicle_type = message["vehicle_type"]
+
+    saved_requests = 0
+    combinations = pending_year_fuel_pairs(message)
+    if combinations is None:
+        try:
+            years, available_fuel_types = await api.get_years(
+                manufacturer_code, model_code, vehicle_type
+            )
+        except Exception as e:
+            if is_throttled(e):
+                return [], [], 0, e
+            raise
+        combinations, saved_requests = expand_year_fuel_pairs(years, available_fuel_types)
+
+    prices = await asyncio.gather(
+        *(
+            api.get_price(
+                manufacturer_code,
+                model_code,
+                year.get("yearModel", "Unknown"),
+                vehicle_type,
+                fuel_type_code,
+            )
+            for year, fuel_type_code in combinations
+        ),
+        return_exceptions=True,
+    )
+
+    records = []
+    pending = []
+    throttle_error = None
+    for (year, fuel_type_code), price in zip(combinations, prices):
+        if isinstance(price, TimeBudgetExceeded):
+            pending.append((year, fuel_type_code))
+        elif isinstance(price, Exception):
+            if not is_throttled(price):
+                raise price
+            pending.append((year, fuel_type_code))
+            throttle_error = throttle_error or price
+        elif price:
+            records.append(build_price_record(message, year, fuel_type_code, price))
+    return records, pending, saved_requests, throttle_error
+
+
+async def process_record_async(api, record, retry_scheduler, progress):
+    """
+    Processa uma mensagem de modelo no caminho assíncrono, registrando os
+    pares ano/combustível consultados em `progress` (ProgressRecorder).
+
+    Returns:
+        tuple: (registros de preço, requisições economizadas, True se o registro
+        SQS foi concluído ou False se deve ser reportado como falha, True se
+        todos os preços do modelo foram obtidos)
+    """
+    message_id = record["messageId"]
+    try:
+        message = json.loads(record["body"])
+        logger.info(f"Message received: {message} (Message ID: {message_id})")
+        # Usa a tabela de referência da própria mensagem (sem consultar a API)
+        api = api.for_reference(
+            message["codigoTabelaReferencia"], message.get("mesReferenciaAno")
+        )
+    except (KeyError, json.JSONDecodeError) as e:
+        logger.error(f"Erro ao decodificar mensagem JSON: {str(e)}")
+        return [], 0, False, False
+
+    try:
+        if api.time_budget.exhausted():
+            raise TimeBudgetExceeded()
+        records, pending, saved, throttle_error = await fetch_model_prices_async(
+            api, message
+        )
+    except TimeBudgetExceeded:
+        # Nenhuma consulta de preço feita para esta mensagem: reenfileira como está
+        return [], 0, retry_scheduler.requeue(record, message), False
+    except Exception as e:
+        logger.error(f"Error processing message {message_id}: {e}")
+        progress.track(message_id, model_unit, message)
+        return [], 0, False, False
+
+    progress.track(message_id, model_unit, message)
+    record_pair_progress(progress, message_id, message, records, pending)
+    succeeded = requeue_remaining(record, message, pending, throttle_error, retry_scheduler)
+    return records, saved, succeeded, not pending and throttle_error is None
+
+
+async def async_lambda_handler(event, context):
+    """
+    Caminho assíncrono do FipePriceLoader.
+
+    Todas as mensagens do lote são processadas concorrentemente e as consultas
+    de preço compartilham o semáforo e o limitador de taxa do AsyncFipeAPI.
+    """
+    from async_fipe_api_service import AsyncFipeAPI
+
+    logger.info("Processing SQS messages (async)...")
+    output_queue_url = os.getenv("SQS_OUTPUT_URL")
+    records = event["Records"]
+
+    if not output_queue_url:
+        logger.error("Variável de ambiente SQS_OUTPUT_URL não definida")
+        return {
+            "statusCode": 500,
+            "body": json.dumps("Erro: SQS_OUTPUT_URL não definida"),
+            "batchItemFailures": [{"itemIdentifier": record["messageId"]} for record in records]
+        }
+
+    fipe_api = FipeAPI()
+    retry_scheduler = RetryScheduler(fipe_api.sqs_client)
+    time_budget = TimeBudget(context)
+    batch_item_failures = []
+    saved_requests = 0
+
+    # Modelos já processados (entregas duplicadas) não consultam a API
+    ledger, entries, done = check_records(STAGE_PRICES, records)
+    progress = ProgressRecorder(get_crawl_progress())
+    completed = []
+    pending_records = []
+    for record in records:
+        if entries[record["messageId"]] in done:
+            progress.track(record["messageId"], model_unit, json.loads(record["body"]))
+            completed.append(record["messageId"])
+        else:
+            pending_records.append(record)
+    if completed:
+        logger.info(f"{len(completed)} mensagens duplicadas ignoradas")
+
+    async with AsyncFipeAPI(
+        rate_limiter=fipe_api.rate_limiter, time_budget=time_budget
+    ) as api:
+        results = await asyncio.gather(
+            *(process_record_async(api, record, retry_scheduler, progress) for record in pending_records)
+        )
+
+    sender = SqsBatchSender(fipe_api.sqs_client, output_queue_url, pack=PACK_MESSAGES)
+    for record, (records_to_send, saved, succeeded, complete) in zip(pending_records, results):
+        for complete_data in records_to_send:
+            sender.add(complete_data, tag=record["messageId"])
+        saved_requests += saved
+        if not succeeded:
+            batch_item_failures.append({"itemIdentifier": record["messageId"]})
+        elif complete:
+            completed.append(record["messageId"])
+
+    add_send_failures(sender, records, batch_item_failures)
+    mark_completed(ledger, entries, completed, batch_item_failures)
+    progress.flush(completed, batch_item_failures)
+
+    total_failures = len(batch_item_failures)
+    logger.info(
+        f"Processamento concluído: {len(records) - total_failures}/{len(records)} mensagens processadas com sucesso"
+    )
+    logger.info(f"Requisições de preço economizadas (pares ano/combustível): {saved_requests}")
+    logger.info(f"Limitador de taxa: {fipe_api.rate_limiter.stats()}")
+    logger.info(f"Mensagens reagendadas por throttling: {retry_scheduler.scheduled}")
+    logger.info(f"Continuações reenfileiradas por tempo: {retry_scheduler.requeued}")
+
     return {
         "statusCode": 200,
         "body": json.dumps("Processing completed successfully"),
         "batchItemFailures": batch_item_failures,
-    }
\ No newline at end of file
+        "savedRequests": saved_requests,
+    }
@@ -2,14 +2,23 @@ import json
 import os
 import logging
 import time
+import threading
+from decimal import Decimal
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 from get_db_password import get_db_password
+from dimension_cache import get_dimension_cache
+from message_packing import unpack_body
+from metrics import get_metrics, log_metrics, record_rows, STAGE_INGEST
 
 # Configure logger
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Número de linhas por comando INSERT na escrita em lote
+BULK_PAGE_SIZE = 1000
+
 def get_db_connection():
     """
     Estabelece uma conexão com o banco de dados PostgreSQL.
@@ -51,61 +60,113 @@ def get_db_connection():
             conn.autocommit = False
         except Exception as e:
             logger.error(f"Erro de conexão com o banco de dados na tentativa {attempts}: {str(e)}")
+            if "authentication" in str(e).lower():
+                # Senha possivelmente rotacionada: ignora a senha em cache
+                password = get_db_password(force_refresh=True)
             time.sleep(1)
         attempts += 1
     return conn
 
-def get_or_create_manufacturer(conn, manufacturer, manufacturer_code, vehicle_type):
+# Conexão mantida no escopo do módulo, reaproveitada entre invocações "quentes"
+# (uma por thread: o runner local executa vários workers no mesmo processo)
+_shared_connection = threading.local()
+
+def get_shared_connection():
+    """
+    Retorna a conexão compartilhada com o banco, validando-a antes do reuso.
+    
+    A Lambda processa um evento por vez, então uma única conexão por instância
+    é suficiente; fora da Lambda, cada thread mantém a sua. Se a conexão
+    estiver fechada ou não responder a um `SELECT 1`, uma nova conexão é aberta.
+    
+    Returns:
+        Connection: Conexão com o banco de dados PostgreSQL (ou None em caso de falha)
+    """
+    conn = getattr(_shared_connection, "conn", None)
+    if conn is not None and not conn.closed:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            logger.info("Reutilizando conexão existente com o banco de dados")
+            return conn
+        except Exception as e:
+            logger.warning(f"Conexão existente inválida, reconectando: {str(e)}")
+            try:
+                conn.close()
+            except Exception:
+                pass
+    
+    _shared_connection.conn = get_db_connection()
+    return _shared_connection.conn
+
+# Upserts idempotentes das dimensões: o DO UPDATE (sem alteração efetiva) garante
+# que o RETURNING devolva o ID também quando outra instância já criou o registro
+UPSERT_MANUFACTURERS_SQL = """
+    INSERT INTO public.fipe_vehicle_manufacturer (name, code, vehicle_type, create_date)
+    VALUES %s
+    ON CONFLICT (name, code, vehicle_type) DO UPDATE SET name = EXCLUDED.name
+    RETURNING id, name, code, vehicle_type
+"""
+
+UPSERT_MODELS_SQL = """
+    INSERT INTO public.fipe_vehicle_model (name, code, manufacturer_id, create_date)
+    VALUES %s
+    ON CONFLICT (name, manufacturer_id, code) DO UPDATE SET name = EXCLUDED.name
+    RETURNING id, name, code, manufacturer_id
+"""
+
+def get_or_create_dimensions(conn, upsert_sql, keys):
     """
-    Verifica se o fabricante existe, cria se não existir, e retorna o ID do fabricante.
+    Obtém ou cria, em um único comando, os registros de uma dimensão.
+    
+    As chaves são ordenadas antes do INSERT para que instâncias concorrentes
+    bloqueiem os registros sempre na mesma ordem (evitando deadlocks).
     
     Args:
         conn: Conexão com o banco de dados
-        manufacturer: Nome do fabricante
-        manufacturer_code: Código do fabricante
-        vehicle_type: Tipo de veículo
+        upsert_sql: UPSERT_MANUFACTURERS_SQL ou UPSERT_MODELS_SQL
+        keys: Chaves (nome, código, tipo de veículo/ID do fabricante)
         
     Returns:
-        int: ID do fabricante
+        dict: Chave normalizada (nome, código, pai) -> ID
     """
+    values = sorted({(str(name), str(code), int(parent)) for name, code, parent in keys})
     with conn.cursor() as cur:
         try:
-            # Verificar se o fabricante existe
-            logger.info(f"Verificando fabricante: {manufacturer}, código: {manufacturer_code}, tipo: {vehicle_type}")
-            cur.execute("""
-                SELECT id FROM public.fipe_vehicle_manufacturer 
-                WHERE name = %s AND code = %s AND vehicle_type = %s
-            """, (manufacturer, manufacturer_code, vehicle_type))
-            
-            result = cur.fetchone()
-            
-            if result:
-                # Fabricante existe, retornar o ID
-                logger.info(f"Fabricante encontrado com ID: {result[0]}")
-                return result[0]
-            
-            # Fabricante não existe, inserir novo registro
-            logger.info(f"Criando novo fabricante: {manufacturer}")
-            cur.execute("""
-                INSERT INTO public.fipe_vehicle_manufacturer 
-                (name, code, vehicle_type, create_date) 
-                VALUES (%s, %s, %s, NOW()) 
-                RETURNING id
-            """, (manufacturer, manufacturer_code, vehicle_type))
-            
-            manufacturer_id = cur.fetchone()[0]
+            rows = execute_values(
+                cur, upsert_sql, values,
+                template="(%s, %s, %s, NOW())", page_size=BULK_PAGE_SIZE, fetch=True,
+            )
             conn.commit()
-            logger.info(f"Novo fabricante criado com ID: {manufacturer_id}")
-            
-            return manufacturer_id
         except Exception as e:
             conn.rollback()
-            logger.error(f"Erro ao processar fabricante: {str(e)}")
+            logger.error(f"Erro ao obter/criar dimensões: {str(e)}")
             raise
+    return {(name, code, parent): dimension_id for dimension_id, name, code, parent in rows}
+
+def get_or_create_manufacturer(conn, manufacturer, manufacturer_code, vehicle_type):
+    """
+    Obtém ou cria o fabricante e retorna o seu ID.
+    
+    Args:
+        conn: Conexão com o banco de dados
+        manufacturer: Nome do fabricante
+        manufacturer_code: Código do fabricante
+        vehicle_type: Tipo de veículo
+        
+    Returns:
+        int: ID do fabricante
+    """
+    logger.info(f"Verificando fabricante: {manufacturer}, código: {manufacturer_code}, tipo: {vehicle_type}")
+    ids = get_or_create_dimensions(
+        conn, UPSERT_MANUFACTURERS_SQL, [(manufacturer, manufacturer_code, vehicle_type)]
+    )
+    return next(iter(ids.values()))
 
 def get_or_create_model(conn, model, model_code, manufacturer_id):
     """
-    Verifica se o modelo existe, cria se não existir, e retorna o ID do modelo.
+    Obtém ou cria o modelo e retorna o seu ID.
     
     Args:
         conn: Conexão com o banco de dados
@@ -116,44 +177,53 @@ def get_or_create_model(conn, model, model_code, manufacturer_id):
     Returns:
         int: ID do modelo
     """
-    with conn.cursor() as cur:
-        try:
-            # Verificar se o modelo existe
-            logger.info(f"Verificando modelo: {model}, código: {model_code}, fabricante ID: {manufacturer_id}")
-            cur.execute("""
-                SELECT id FROM public.fipe_vehicle_model 
-                WHERE name = %s AND code = %s AND manufacturer_id = %s
-            """, (str(model), str(model_code), manufacturer_id))
-            
-            result = cur.fetchone()
-            
-            if result:
-                # Modelo existe, retornar o ID
-                logger.info(f"Modelo encontrado com ID: {result[0]}")
-                return result[0]
-            
-            # Modelo não existe, inserir novo registro
-            logger.info(f"Criando novo modelo: {model}")
-            cur.execute("""
-                INSERT INTO public.fipe_vehicle_model 
-                (name, code, manufacturer_id, create_date) 
-                VALUES (%s, %s, %s, NOW()) 
-                RETURNING id
-            """, (str(model), str(model_code), manufacturer_id))
-            
-            model_id = cur.fetchone()[0]
-            conn.commit()
-            logger.info(f"Novo modelo criado com ID: {model_id}")
-            
-            return model_id
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"Erro ao processar modelo: {str(e)}")
-            raise
+    logger.info(f"Verificando modelo: {model}, código: {model_code}, fabricante ID: {manufacturer_id}")
+    ids = get_or_create_dimensions(conn, UPSERT_MODELS_SQL, [(model, model_code, manufacturer_id)])
+    return next(iter(ids.values()))
+
+def parse_fipe_value_cents(value):
+    """
+    Converte o valor FIPE retornado pela API ("R$ 12.345,67") para centavos.
+    
+    Args:
+        value: Valor FIPE formatado
+        
+    Returns:
+        int: Valor em centavos (0 se vazio)
+    """
+    fipe_value_str = str(value).replace("R$ ", "").replace(".", "").replace(",", ".").strip()
+    return int((Decimal(fipe_value_str) * 100).to_integral_value()) if fipe_value_str else 0
+
+# Upsert pela chave natural de fipe_vehicle_model_value (índice único da migração 001)
+UPSERT_MODEL_VALUE_SQL = """
+    INSERT INTO public.fipe_vehicle_model_value (
+        name, code, model_id, fipe_code, manufacturer_id, 
+        manufacture_year, reference_month_code, 
+        fipe_value_cents, fuel_type, vehicle_type, active, create_date
+    ) VALUES %s
+    ON CONFLICT (model_id, fipe_code, manufacture_year, reference_month_code, fuel_type)
+    DO UPDATE SET fipe_value_cents = EXCLUDED.fipe_value_cents, write_date = NOW()
+"""
+UPSERT_MODEL_VALUE_TEMPLATE = "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, TRUE, NOW())"
+
+def model_value_row(data):
+    """Monta a linha de fipe_vehicle_model_value a partir dos dados de um registro."""
+    return (
+        f"{data['model']} {data['model_year_code']}",
+        str(data['model_code']),
+        int(data['model_id']),
+        str(data['fipe_code']),
+        int(data['manufacturer_id']),
+        int(data['model_year_code']),
+        int(data['reference_month_code']),
+        parse_fipe_value_cents(data['fipe_value']),
+        str(data['fuel_type']),
+        int(data['vehicle_type']),
+    )
 
 def insert_model_value(conn, data):
     """
-    Insere um valor de modelo no banco de dados.
+    Insere (ou atualiza, se já existir) um valor de modelo no banco de dados.
     
     Args:
         conn: Conexão com o banco de dados
@@ -162,84 +232,31 @@ def insert_model_value(conn, data):
     with conn.cursor() as cur:
         try:
             logger.info(f"Inserindo valor do modelo: {data['model']} {data['model_year_code']}")
-            
-            # Processar o valor FIPE para float
-            fipe_value_str = str(data['fipe_value']).replace("R$ ", "").replace(".", "").replace(",", ".")
-            fipe_value = float(fipe_value_str) if fipe_value_str else 0
-            
-            # Verificar se o valor já existe no banco de dados
-            cur.execute("""
-                SELECT id FROM public.fipe_vehicle_model_value
-                WHERE model_id = %s AND fipe_code = %s AND 
-                      manufacture_year = %s AND reference_month_code = %s
-            """, (
-                int(data['model_id']), 
-                str(data['fipe_code']), 
-                str(data['model_year_code']), 
-                str(data['reference_month_code']),
-            ))
-            
-            existing_value = cur.fetchone()
-            
-            if existing_value:
-                # Valor já existe, atualizar
-                logger.info(f"Atualizando valor existente para: {data['model']} {data['model_year_code']}")
-                cur.execute("""
-                    UPDATE public.fipe_vehicle_model_value
-                    SET fipe_value = %s, write_date = NOW()
-                    WHERE id = %s
-                """, (fipe_value, existing_value[0]))
-            else:
-                # Valor não existe, inserir novo
-                logger.info(f"Inserindo novo valor para: {data['model']} {data['model_year_code']}")
-                cur.execute("""
-                    INSERT INTO public.fipe_vehicle_model_value (
-                        name, code, model_id, fipe_code, manufacturer_id, 
-                        manufacture_year, reference_month, reference_month_code, 
-                        fipe_value, fuel_type, vehicle_type, active, create_date
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW()
-                    )
-                """, (
-                    f"{data['model']} {data['model_year_code']}",
-                    str(data['model_code']),
-                    int(data['model_id']),
-                    str(data['fipe_code']),
-                    int(data['manufacturer_id']),
-                    str(data['model_year_code']),
-                    str(data['reference_month']),
-                    str(data['reference_month_code']),
-                    fipe_value,
-                    str(data['fuel_type']),
-                    int(data['vehicle_type']),
-                    True
-                ))
-            
+            start = time.monotonic()
+            execute_values(
+                cur, UPSERT_MODEL_VALUE_SQL, [model_value_row(data)],
+                template=UPSERT_MODEL_VALUE_TEMPLATE,
+            )
             conn.commit()
+            record_rows(get_metrics(), "insert_row", 1, start, [data['vehicle_type']])
             logger.info(f"Valor do modelo processado com sucesso: {data['model']} {data['model_year_code']}")
         except Exception as e:
             conn.rollback()
             logger.error(f"Erro ao inserir/atualizar valor do modelo: {str(e)}")
             raise
 
-def process_message(conn, record):
+def parse_values(message_id, message_body):
     """
-    Processa uma única mensagem SQS.
+    Valida um único registro de preço.
     
     Args:
-        conn: Conexão com o banco de dados
-        record: Registro da mensagem SQS
+        message_id: ID da mensagem SQS que contém o registro
+        message_body: Registro de preço decodificado
         
     Returns:
-        bool: True se a mensagem foi processada com sucesso, False caso contrário
+        dict: Dados do valor do modelo, ou None se o registro for inválido
     """
-    message_id = record["messageId"]
     try:
-        logger.info(f"Processando mensagem: {message_id}")
-        
-        message_body = json.loads(record["body"])
-        logger.info(f"Conteúdo da mensagem: {json.dumps(message_body, ensure_ascii=False)[:500]}...")
-
         # Preparar dados para processamento
         data = {
             "manufacturer": message_body.get("manufacturer", False),
@@ -255,63 +272,277 @@ def process_message(conn, record):
             "vehicle_type": message_body.get("vehicle_type", False),
         }
         
-        # Validar dados obrigatórios]
-        not_included = [] 
-        if data.get('manufacturer', False) == False:
-            not_included.append('manufacturer')
+        # Validar dados obrigatórios
+        not_included = [
+            field for field in (
+                'manufacturer', 'manufacturer_code', 'model',
+                'model_code', 'fipe_code', 'vehicle_type',
+                'reference_month_code', 'model_year_code',
+            )
+            if data.get(field, False) == False
+        ]
 
-        if data.get('manufacturer_code', False) == False:
-            not_included.append('manufacturer_code')
+        if not_included:
+            logger.error(f"Dados obrigatórios ausentes na mensagem {message_id}: {not_included}")
+            return None
 
-        if data.get('model', False) == False:
-            not_included.append('model')
+        # Validar os campos numéricos (valor FIPE, ano e código da tabela de
+        # referência, chave da partição) antes de entrar na escrita em lote
+        parse_fipe_value_cents(data['fipe_value'])
+        int(data['model_year_code'])
+        int(data['reference_month_code'])
+        return data
+        
+    except (AttributeError, KeyError, TypeError, ValueError, ArithmeticError) as e:
+        logger.error(f"Erro de validação de registro da mensagem {message_id}: {str(e)}")
+        return None
 
-        if data.get('model_code', False) == False:
-            not_included.append('model_code')
+def parse_record(record):
+    """
+    Decodifica uma mensagem SQS, no formato de um registro por mensagem ou
+    no formato empacotado (vários registros, opcionalmente comprimidos).
+    
+    Args:
+        record: Registro da mensagem SQS
+        
+    Returns:
+        tuple: (dados dos registros válidos, True se todos os registros da
+        mensagem são válidos)
+    """
+    message_id = record["messageId"]
+    try:
+        logger.info(f"Conteúdo da mensagem {message_id}: {record['body'][:500]}...")
+        message_bodies = unpack_body(record["body"])
+    except (KeyError, ValueError, OSError, EOFError) as e:
+        logger.error(f"Erro de decodificação da mensagem {message_id}: {str(e)}")
+        return [], False
 
-        if data.get('fipe_code', False) == False:
-            not_included.append('fipe_code')
+    values = [parse_values(message_id, message_body) for message_body in message_bodies]
+    valid = [data for data in values if data is not None]
+    if len(message_bodies) > 1:
+        logger.info(f"Mensagem {message_id}: {len(valid)}/{len(message_bodies)} registros válidos")
+    return valid, len(valid) == len(values)
 
-        if data.get('vehicle_type', False) == False:
-            not_included.append('vehicle_type')
+def resolve_missing(conn, upsert_sql, keys, get_or_create_one):
+    """
+    Obtém ou cria em lote os registros de dimensão ausentes do cache. Se o
+    comando em lote falhar, cada chave é resolvida individualmente para que
+    apenas as chaves com problema fiquem sem ID.
+    
+    Returns:
+        dict: Chave normalizada -> ID das chaves resolvidas
+    """
+    if not keys:
+        return {}
+    try:
+        return get_or_create_dimensions(conn, upsert_sql, keys)
+    except Exception:
+        ids = {}
+        for key in keys:
+            try:
+                ids[(str(key[0]), str(key[1]), int(key[2]))] = get_or_create_one(conn, *key)
+            except Exception:
+                pass
+        return ids
 
-        if not_included:
-            logger.error(f"Dados obrigatórios ausentes na mensagem {message_id}: {not_included}")
-            return False
-
-        if not bool(conn):
-            logger.error(f"Não foi possível processar a mensagem {message_id}: Conexão com o banco de dados inválida.")
-            return False
-
-        # Obter ou criar fabricante - usando uma conexão nova para cada operação
-        data['manufacturer_id'] = get_or_create_manufacturer(
-            conn, 
-            data['manufacturer'], 
-            data['manufacturer_code'], 
-            data['vehicle_type']
-        )
-
-        # Obter ou criar modelo - usando uma conexão nova para cada operação
-        data['model_id'] = get_or_create_model(
-            conn, 
-            data['model'], 
-            data['model_code'], 
-            data['manufacturer_id']
-        )
-
-        # Inserir valor do modelo - usando uma conexão nova para cada operação
-        insert_model_value(conn, data)
+def resolve_dimensions(conn, items, dimension_cache):
+    """
+    Resolve os IDs de fabricante e modelo dos registros do lote. Os IDs vêm do
+    cache de dimensões; fabricantes e modelos ainda não vistos são obtidos ou
+    criados com um único upsert por dimensão para o lote inteiro.
+    
+    Args:
+        conn: Conexão com o banco de dados
+        items: Lista de tuplas (message_id, data)
+        dimension_cache: Cache de IDs de fabricantes e modelos
         
-        logger.info(f"Mensagem {message_id} processada com sucesso")
-        return True
+    Returns:
+        tuple: (itens resolvidos, IDs das mensagens com falha)
+    """
+    failed = []
+
+    # Fabricantes
+    pending = []
+    missing = set()
+    for message_id, data in items:
+        try:
+            key = (str(data['manufacturer']), str(data['manufacturer_code']), int(data['vehicle_type']))
+        except (TypeError, ValueError) as e:
+            logger.error(f"Fabricante inválido na mensagem {message_id}: {str(e)}")
+            failed.append(message_id)
+            continue
+        data['manufacturer_id'] = dimension_cache.get_manufacturer(*key)
+        if data['manufacturer_id'] is None:
+            missing.add(key)
+        pending.append((message_id, data, key))
+
+    created = resolve_missing(conn, UPSERT_MANUFACTURERS_SQL, missing, get_or_create_manufacturer)
+    for key, manufacturer_id in created.items():
+        dimension_cache.put_manufacturer(*key, manufacturer_id)
+
+    # Modelos
+    items = []
+    missing = set()
+    for message_id, data, manufacturer_key in pending:
+        if data['manufacturer_id'] is None:
+            data['manufacturer_id'] = created.get(manufacturer_key)
+        if data['manufacturer_id'] is None:
+            logger.error(f"Erro ao resolver fabricante da mensagem {message_id}")
+            failed.append(message_id)
+            continue
+        key = (str(data['model']), str(data['model_code']), int(data['manufacturer_id']))
+        data['model_id'] = dimension_cache.get_model(*key)
+        if data['model_id'] is None:
+            missing.add(key)
+        items.append((message_id, data, key))
+
+    created = resolve_missing(conn, UPSERT_MODELS_SQL, missing, get_or_create_model)
+    for key, model_id in created.items():
+        dimension_cache.put_model(*key, model_id)
+
+    resolved = []
+    for message_id, data, model_key in items:
+        if data['model_id'] is None:
+            data['model_id'] = created.get(model_key)
+        if data['model_id'] is None:
+            logger.error(f"Erro ao resolver modelo da mensagem {message_id}")
+            failed.append(message_id)
+            continue
+        resolved.append((message_id, data))
+
+    return resolved, failed
+
+# Tabelas de referência já registradas (dimensão e partição) por esta instância
+_known_reference_tables = set()
+
+def ensure_reference_tables(conn, reference_tables):
+    """
+    Registra as tabelas de referência do lote em public.fipe_reference_table e
+    garante a existência das suas partições em fipe_vehicle_model_value. Cada
+    código é verificado no banco uma única vez por instância da Lambda.
+    
+    Args:
+        conn: Conexão com o banco de dados
+        reference_tables: Dicionário código da tabela de referência -> nome do mês
+    """
+    missing = sorted(set(reference_tables) - _known_reference_tables)
+    if not missing:
+        return
+    with conn.cursor() as cur:
+        try:
+            execute_values(cur, """
+                INSERT INTO public.fipe_reference_table (code, month_name, create_date)
+                VALUES %s
+                ON CONFLICT (code) DO NOTHING
+            """, [(code, reference_tables[code]) for code in missing], template="(%s, %s, NOW())")
+            for reference_month_code in missing:
+                logger.info(f"Verificando partição da tabela de referência {reference_month_code}")
+                cur.execute("SELECT public.fipe_ensure_value_partition(%s)", (reference_month_code,))
+            conn.commit()
+            _known_reference_tables.update(missing)
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Erro ao registrar tabela de referência: {str(e)}")
+            raise
+
+def bulk_upsert_model_values(conn, items):
+    """
+    Grava os valores de um lote inteiro em uma única transação, com um
+    INSERT ... ON CONFLICT DO UPDATE de várias linhas (`execute_values`) sobre
+    a chave natural da tabela. Registros repetidos no lote (mesma chave)
+    mantêm o último valor.
+    
+    Args:
+        conn: Conexão com o banco de dados
+        items: Lista de tuplas (message_id, data) com fabricante e modelo resolvidos
+    """
+    # Remover duplicidades do lote: o ON CONFLICT não aceita a mesma chave duas vezes
+    rows = {}
+    for _, data in items:
+        row = model_value_row(data)
+        rows[(row[2], row[3], row[5], row[6], row[8])] = row
+
+    with conn.cursor() as cur:
+        try:
+            start = time.monotonic()
+            execute_values(
+                cur, UPSERT_MODEL_VALUE_SQL, list(rows.values()),
+                template=UPSERT_MODEL_VALUE_TEMPLATE, page_size=BULK_PAGE_SIZE,
+            )
+            conn.commit()
+            record_rows(get_metrics(), "bulk_upsert", len(rows), start, [row[9] for row in rows.values()])
+            logger.info(f"Escrita em lote concluída: {len(rows)} valores gravados")
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Erro na escrita em lote dos valores: {str(e)}")
+            raise
+
+def process_batch(conn, records):
+    """
+    Processa um lote de mensagens SQS com uma única escrita em lote.
+    
+    Cada mensagem pode conter um ou vários registros (formato empacotado);
+    uma falha em qualquer registro reporta a mensagem inteira. Mensagens inválidas ou cujo fabricante/modelo não puderam ser resolvidos
+    são isoladas antes da escrita. Se a escrita em lote falhar, os registros
+    são gravados um a um para identificar as mensagens com problema.
+    
+    Args:
+        conn: Conexão com o banco de dados
+        records: Registros das mensagens SQS
         
-    except (KeyError, json.JSONDecodeError) as e:
-        logger.error(f"Erro de decodificação da mensagem {message_id}: {str(e)}")
-        return False
-    except Exception as e:
-        logger.error(f"Erro ao processar mensagem {message_id}: {str(e)}")
-        return False
+    Returns:
+        list: IDs das mensagens que não puderam ser processadas
+    """
+    metrics = get_metrics()
+    start = time.monotonic()
+    failed = []
+    items = []
+    for record in records:
+        values, all_valid = parse_record(record)
+        # Registros válidos de uma mensagem empacotada são gravados mesmo que
+        # outros sejam inválidos; a mensagem é reportada como falha e, ao ser
+        # reprocessada, o upsert torna a regravação idempotente
+        if not all_valid:
+            failed.append(record["messageId"])
+        items.extend((record["messageId"], data) for data in values)
+
+    dimension_cache = get_dimension_cache(conn)
+    with metrics.timer("Latency", stage=STAGE_INGEST, endpoint="resolve_dimensions"):
+        items, dimension_failures = resolve_dimensions(conn, items, dimension_cache)
+    failed.extend(dimension_failures)
+    logger.info(f"Cache de dimensões: {dimension_cache.stats()}")
+
+    if not items:
+        return record_batch(metrics, records, failed, start)
 
+    try:
+        ensure_reference_tables(conn, {
+            int(data['reference_month_code']): str(data['reference_month'] or "Desconhecido").strip()
+            for _, data in items
+        })
+        bulk_upsert_model_values(conn, items)
+    except Exception:
+        logger.warning("Escrita em lote falhou; gravando os registros individualmente")
+        # Um ID em cache pode ter sido removido do banco: recarrega na próxima invocação
+        dimension_cache.clear()
+        for message_id, data in items:
+            try:
+                insert_model_value(conn, data)
+            except Exception:
+                failed.append(message_id)
+
+    # Uma mensagem empacotada pode falhar por mais de um registro
+    return record_batch(metrics, records, list(dict.fromkeys(failed)), start)
+
+def record_batch(metrics, records, failed, start):
+    """Registra a latência e as mensagens (e falhas) de um lote; retorna `failed`."""
+    dimensions = {"stage": STAGE_INGEST, "endpoint": "process_batch"}
+    metrics.observe("Latency", (time.monotonic() - start) * 1000, **dimensions)
+    metrics.increment("Messages", len(records), **dimensions)
+    metrics.increment("FailedMessages", len(failed), **dimensions)
+    return failed
+
+@log_metrics
 def lambda_handler(event, context):
     """
     Manipulador AWS Lambda para processar mensagens SQS e inserir dados no PostgreSQL.
@@ -339,32 +570,19 @@ def lambda_handler(event, context):
     logger.info(f"Processando {len(event['Records'])} mensagens da fila SQS...")
     
     batch_item_failures = []
-    total_processed = 0
 
-    for record in event["Records"]:
-        # Para cada mensagem, estabelecemos uma nova conexão
-        # Isso evita problemas de transações abortadas afetando mensagens subsequentes
+    # Uma única conexão (reaproveitada entre invocações) para todo o lote
+    conn = get_shared_connection()
+    if bool(conn):
+        failed_message_ids = process_batch(conn, event["Records"])
+    else:
+        logger.error("Erro fatal ao estabelecer conexão com o banco de dados")
+        failed_message_ids = [record["messageId"] for record in event["Records"]]
 
-        conn = get_db_connection()
-        success = False
-        
-        if bool(conn):
-            # Processar a mensagem
-            success = process_message(conn, record)
-            try:
-                # Fechar a conexão, garantindo que todas as transações sejam finalizadas
-                conn.close()
-            except Exception as e:
-                logger.error(f"Erro ao fechar conexão: {str(e)}")
-        else:
-            logger.error("Erro fatal ao estabelecer conexão com o banco de dados")
-            
-        if success:
-            total_processed += 1
-        else:
-            batch_item_failures.append({"itemIdentifier": record["messageId"]})
-            logger.error(f"Erro ao processar mensagem {record['messageId']}: {str(e)}")
-            batch_item_failures.append({"itemIdentifier": record["messageId"]})
+    for message_id in failed_message_ids:
+        logger.error(f"Erro ao processar mensagem {message_id}")
+        batch_item_failures.append({"itemIdentifier": message_id})
+    total_processed = len(event["Records"]) - len(failed_message_ids)
 
     total_failures = len(batch_item_failures)
     total_records = len(event["Records"])
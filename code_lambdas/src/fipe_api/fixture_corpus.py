@@ -0,0 +1,266 @@
+import os
+import gzip
+import json
+import time
+import atexit
+import asyncio
+import logging
+import threading
+from rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Gravação/reprodução das respostas da API FIPE: "off" (padrão), "record" ou "replay"
+FIXTURE_MODE = os.getenv("FIPE_FIXTURE_MODE", "off")
+# Arquivo do corpus (JSON Lines comprimido com gzip)
+FIXTURE_PATH = os.getenv("FIPE_FIXTURE_PATH", "fipe_fixtures.jsonl.gz")
+# Na reprodução: "fast" (sem espera) ou "original" (latência gravada de cada resposta)
+FIXTURE_TIMING = os.getenv("FIPE_FIXTURE_TIMING", "fast")
+
+MODE_OFF = "off"
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+TIMING_ORIGINAL = "original"
+
+# Entradas gravadas acumuladas antes de cada escrita no arquivo
+RECORD_FLUSH_EVERY = 100
+
+
+class FixtureMissError(LookupError):
+    """Requisição sem resposta gravada no corpus."""
+
+
+def fixture_key(endpoint, payload):
+    """Chave de uma requisição: endpoint e payload em JSON canônico."""
+    return f"{endpoint} {json.dumps(payload, sort_keys=True, separators=(',', ':'))}"
+
+
+def _endpoint(url):
+    return url.rstrip("/").rsplit("/", 1)[-1]
+
+
+class FixtureCorpus:
+    """
+    Corpus de pares requisição/resposta da API FIPE.
+
+    Cada linha do arquivo (JSON Lines + gzip) é uma resposta:
+    `{"endpoint", "payload", "status", "body", "elapsed", "retry_after"}`,
+    com o corpo exatamente como recebido. Na gravação, as entradas são
+    acrescentadas ao arquivo em blocos (membros gzip concatenados). Na
+    reprodução, respostas gravadas para a mesma requisição (ex.: um 429
+    seguido de um 200) são devolvidas em ordem, repetindo a última.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._cursors = {}
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        corpus = cls(path)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                corpus.entries.setdefault(fixture_key(entry["endpoint"], entry["payload"]), []).append(entry)
+        logger.info(f"Corpus {path}: {sum(len(e) for e in corpus.entries.values())} respostas carregadas")
+        return corpus
+
+    def record(self, endpoint, payload, status, body, elapsed, retry_after=None):
+        entry = {
+            "endpoint": endpoint,
+            "payload": payload,
+            "status": status,
+            "body": body,
+            "elapsed": round(elapsed, 4),
+            "retry_after": retry_after,
+        }
+        with self._lock:
+            self.entries.setdefault(fixture_key(endpoint, payload), []).append(entry)
+            self._pending.append(entry)
+            if len(self._pending) >= RECORD_FLUSH_EVERY:
+                self._flush()
+
+    def flush(self):
+        """Grava no arquivo as entradas ainda não persistidas."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            for entry in self._pending:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._pending = []
+
+    def lookup(self, endpoint, payload):
+        """Próxima resposta gravada para a requisição."""
+        key = fixture_key(endpoint, payload)
+        with self._lock:
+            responses = self.entries.get(key)
+            if not responses:
+                self.misses += 1
+                raise FixtureMissError(f"Requisição sem resposta no corpus {self.path}: {key}")
+            index = self._cursors.get(key, 0)
+            self._cursors[key] = min(index + 1, len(responses) - 1)
+            self.hits += 1
+            return responses[index]
+
+    def stats(self):
+        return {"requests": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+def _replay_wait(entry):
+    return entry["elapsed"] if FIXTURE_TIMING == TIMING_ORIGINAL else 0.0
+
+
+def _response_headers(entry):
+    retry_after = entry.get("retry_after")
+    return {"Retry-After": retry_after} if retry_after is not None else {}
+
+
+def _requests_response(url, entry):
+    import requests
+
+    response = requests.Response()
+    response.status_code = entry["status"]
+    response._content = entry["body"].encode("utf-8")
+    response.encoding = "utf-8"
+    response.headers.update(_response_headers(entry))
+    response.url = url
+    return response
+
+
+class RecordingSession:
+    """Sessão HTTP que grava no corpus cada resposta da sessão real."""
+
+    def __init__(self, session, corpus):
+        self.session = session
+        self.corpus = corpus
+
+    def post(self, url, json=None, **kwargs):
+        start = time.monotonic()
+        response = self.session.post(url, json=json, **kwargs)
+        self.corpus.record(
+            _endpoint(url), json, response.status_code, response.text,
+            time.monotonic() - start, response.headers.get("Retry-After"),
+        )
+        return response
+
+
+class ReplaySession:
+    """Sessão HTTP que responde a partir do corpus, sem acessar a rede."""
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    def post(self, url, json=None, **kwargs):
+        entry = self.corpus.lookup(_endpoint(url), json)
+        wait = _replay_wait(entry)
+        if wait:
+            time.sleep(wait)
+        return _requests_response(url, entry)
+
+
+class AsyncRecordingClient:
+    """Equivalente de RecordingSession para o httpx.AsyncClient."""
+
+    def __init__(self, client, corpus):
+        self.client = client
+        self.corpus = corpus
+
+    async def post(self, url, json=None, **kwargs):
+        start = time.monotonic()
+        response = await self.client.post(url, json=json, **kwargs)
+        self.corpus.record(
+            _endpoint(url), json, response.status_code, response.text,
+            time.monotonic() - start, response.headers.get("Retry-After"),
+        )
+        return response
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class AsyncReplayClient:
+    """Equivalente de ReplaySession para o httpx.AsyncClient."""
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    async def post(self, url, json=None, **kwargs):
+        import httpx
+
+        entry = self.corpus.lookup(_endpoint(url), json)
+        wait = _replay_wait(entry)
+        if wait:
+            await asyncio.sleep(wait)
+        return httpx.Response(
+            entry["status"],
+            content=entry["body"].encode("utf-8"),
+            headers=_response_headers(entry),
+            request=httpx.Request("POST", url, json=json),
+        )
+
+    async def aclose(self):
+        pass
+
+
+# Corpus compartilhado no escopo do módulo por todos os clientes do processo
+_fixture_corpus = None
+_fixture_lock = threading.Lock()
+
+
+def get_fixture_corpus():
+    """
+    Retorna o corpus configurado por FIPE_FIXTURE_MODE/FIPE_FIXTURE_PATH, ou
+    None fora dos modos de gravação e reprodução.
+    """
+    global _fixture_corpus
+    if FIXTURE_MODE not in (MODE_RECORD, MODE_REPLAY):
+        return None
+    with _fixture_lock:
+        if _fixture_corpus is None:
+            if FIXTURE_MODE == MODE_REPLAY:
+                _fixture_corpus = FixtureCorpus.load(FIXTURE_PATH)
+            else:
+                _fixture_corpus = FixtureCorpus(FIXTURE_PATH)
+                atexit.register(_fixture_corpus.flush)
+                logger.info(f"Gravando as respostas da API FIPE em {FIXTURE_PATH}")
+    return _fixture_corpus
+
+
+def fixture_session(session):
+    """Sessão HTTP do FipeAPI de acordo com o modo de gravação/reprodução."""
+    corpus = get_fixture_corpus()
+    if corpus is None:
+        return session
+    if FIXTURE_MODE == MODE_REPLAY:
+        return ReplaySession(corpus)
+    return RecordingSession(session, corpus)
+
+
+def fixture_async_client(client_factory):
+    """
+    Cliente httpx do AsyncFipeAPI de acordo com o modo de gravação/reprodução;
+    na reprodução, `client_factory` não é chamada (nenhuma conexão é aberta).
+    """
+    corpus = get_fixture_corpus()
+    if corpus is None:
+        return client_factory()
+    if FIXTURE_MODE == MODE_REPLAY:
+        return AsyncReplayClient(corpus)
+    return AsyncRecordingClient(client_factory(), corpus)
+
+
+def fixture_rate_limiter():
+    """
+    Na reprodução não há API a proteger: retorna um limitador sem limite (a
+    latência gravada já é reproduzida com FIPE_FIXTURE_TIMING=original).
+    """
+    return RateLimiter() if FIXTURE_MODE == MODE_REPLAY else None
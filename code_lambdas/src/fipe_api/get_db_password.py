@@ -1,22 +1,49 @@
 import json
+import time
 import boto3
 import os
 
-def get_db_password():
+# Tempo (segundos) de validade da senha em cache no processo
+SECRET_CACHE_TTL = int(os.environ.get('DB_SECRET_CACHE_TTL', '900'))
+
+# Cliente do Secrets Manager e cache da senha no escopo do módulo, reaproveitados
+# entre invocações "quentes" da Lambda
+_secrets_client = None
+_password_cache = {}
+
+def get_db_password(force_refresh=False):
     """
     Recupera a senha do banco de dados do AWS Secrets Manager.
     Usado pelo fipe_soma_ingestor.py para estabelecer conexão com o RDS.
     
+    A senha fica em cache no processo por DB_SECRET_CACHE_TTL segundos. Em
+    execução local (PostgreSQL sem Secrets Manager), DB_PASSWORD informa a
+    senha diretamente.
+    
+    Args:
+        force_refresh (bool): Ignora o cache (ex.: após falha de autenticação)
+    
     Returns:
         str: A senha do banco de dados
     """
+    global _secrets_client
+    password = os.environ.get('DB_PASSWORD')
+    if password:
+        return password
+    
     secret_arn = os.environ.get('DB_SECRET_ARN')
     
     if not secret_arn:
         raise ValueError("DB_SECRET_ARN não está definido nas variáveis de ambiente")
     
-    secrets_client = boto3.client('secretsmanager')
-    secret_value = secrets_client.get_secret_value(SecretId=secret_arn)
+    cached = _password_cache.get(secret_arn)
+    if cached and not force_refresh and cached[0] > time.monotonic():
+        return cached[1]
+    
+    if _secrets_client is None:
+        _secrets_client = boto3.client('secretsmanager')
+    secret_value = _secrets_client.get_secret_value(SecretId=secret_arn)
     secret = json.loads(secret_value['SecretString'])
     
+    _password_cache[secret_arn] = (time.monotonic() + SECRET_CACHE_TTL, secret['password'])
     return secret['password']
@@ -0,0 +1,232 @@
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Backend do registro de idempotência: "postgres" (padrão), "memory" ou "off"
+IDEMPOTENCY_LEDGER_BACKEND = os.getenv("FIPE_IDEMPOTENCY_LEDGER", "postgres")
+
+BACKEND_POSTGRES = "postgres"
+BACKEND_MEMORY = "memory"
+BACKEND_OFF = "off"
+
+# Etapas do pipeline: mensagens de fabricante processadas pelo FipeModelLoader
+# e mensagens de modelo processadas pelo FipePriceLoader
+STAGE_MODELS = "models"
+STAGE_PRICES = "prices"
+
+# Campos da mensagem SQS que formam a chave natural de cada etapa
+NATURAL_KEY_FIELDS = {
+    STAGE_MODELS: ("codigoTipoVeiculo", "codigoMarca"),
+    STAGE_PRICES: ("vehicle_type", "manufacturer_code", "model_code"),
+}
+
+
+def ledger_entry(stage, message):
+    """
+    Monta a entrada (tabela de referência, etapa, chave natural) de uma
+    mensagem SQS, ou None se a mensagem não tiver os campos necessários.
+    """
+    if not isinstance(message, dict):
+        return None
+    values = [message.get(field) for field in NATURAL_KEY_FIELDS[stage]]
+    reference_table_code = message.get("codigoTabelaReferencia")
+    if reference_table_code in (None, "") or any(value in (None, "") for value in values):
+        return None
+    return int(reference_table_code), stage, ":".join(str(value) for value in values)
+
+
+def record_entry(stage, record):
+    """Entrada do registro para um record SQS (None se o corpo for inválido)."""
+    try:
+        return ledger_entry(stage, json.loads(record["body"]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class IdempotencyLedger:
+    """
+    Registro das unidades de trabalho já concluídas no pipeline.
+
+    Cada entrada é indexada por (código da tabela de referência, etapa, chave
+    natural). Os handlers consultam o registro antes de processar uma
+    mensagem: uma entrega duplicada do SQS custa uma consulta em vez de
+    refazer todas as chamadas à API FIPE e mensagens dela derivadas.
+
+    Falhas do registro nunca interrompem o processamento: sem resposta, a
+    mensagem é processada normalmente. A implementação base não registra
+    nada (toda mensagem é processada); subclasses sobrescrevem `read_done` e
+    `write_done`.
+    """
+
+    def __init__(self):
+        self.skipped = 0
+        self.marked = 0
+        self._lock = threading.Lock()
+
+    def read_done(self, entries):
+        """Retorna o subconjunto de `entries` já registrado como concluído."""
+        return []
+
+    def write_done(self, entries):
+        """Registra `entries` como concluídas."""
+
+    def done(self, entries):
+        """
+        Consulta, de uma só vez, quais entradas já foram concluídas.
+
+        Args:
+            entries (iterable): Entradas (tabela de referência, etapa, chave natural)
+
+        Returns:
+            set: Entradas concluídas
+        """
+        entries = {entry for entry in entries if entry is not None}
+        if not entries:
+            return set()
+        with self._lock:
+            try:
+                done = set(self.read_done(sorted(entries)))
+            except Exception as e:
+                logger.warning(f"Erro ao consultar o registro de idempotência: {e}")
+                return set()
+            self.skipped += len(done)
+        return done
+
+    def mark_done(self, entries):
+        """Registra as entradas como concluídas; falhas apenas são logadas."""
+        entries = {entry for entry in entries if entry is not None}
+        if not entries:
+            return
+        with self._lock:
+            try:
+                self.write_done(sorted(entries))
+                self.marked += len(entries)
+            except Exception as e:
+                logger.warning(f"Erro ao gravar o registro de idempotência: {e}")
+
+    def stats(self):
+        return {"skipped": self.skipped, "marked": self.marked}
+
+
+class MemoryIdempotencyLedger(IdempotencyLedger):
+    """Registro em memória (testes e execução local)."""
+
+    def __init__(self):
+        super().__init__()
+        self.entries = set()
+
+    def read_done(self, entries):
+        return [entry for entry in entries if entry in self.entries]
+
+    def write_done(self, entries):
+        self.entries.update(entries)
+
+
+class PostgresIdempotencyLedger(IdempotencyLedger):
+    """Registro na tabela public.fipe_idempotency_ledger do PostgreSQL."""
+
+    def __init__(self, connection_factory=None):
+        super().__init__()
+        self.connection_factory = connection_factory or _default_connection_factory
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = self.connection_factory()
+        return self._conn
+
+    def read_done(self, entries):
+        from psycopg2.extras import execute_values
+
+        try:
+            with self.conn.cursor() as cur:
+                rows = execute_values(cur, """
+                    SELECT l.reference_table_code, l.stage, l.natural_key
+                    FROM public.fipe_idempotency_ledger l
+                    JOIN (VALUES %s) AS k (reference_table_code, stage, natural_key)
+                      ON l.reference_table_code = k.reference_table_code
+                     AND l.stage = k.stage
+                     AND l.natural_key = k.natural_key
+                """, entries, template="(%s::integer, %s, %s)", fetch=True)
+        finally:
+            self.conn.rollback()
+        return [tuple(row) for row in rows]
+
+    def write_done(self, entries):
+        from psycopg2.extras import execute_values
+
+        try:
+            with self.conn.cursor() as cur:
+                execute_values(cur, """
+                    INSERT INTO public.fipe_idempotency_ledger
+                    (reference_table_code, stage, natural_key, create_date)
+                    VALUES %s
+                    ON CONFLICT (reference_table_code, stage, natural_key) DO NOTHING
+                """, entries, template="(%s, %s, %s, NOW())")
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+
+def _default_connection_factory():
+    from fipe_soma_ingestor import get_db_connection
+
+    return get_db_connection()
+
+
+# Instância compartilhada no escopo do módulo (reaproveitada entre invocações)
+_idempotency_ledger = None
+
+
+def get_idempotency_ledger():
+    """
+    Retorna o registro de idempotência configurado por FIPE_IDEMPOTENCY_LEDGER,
+    ou None se estiver desabilitado.
+
+    O backend PostgreSQL requer acesso ao banco (RDS_HOST); sem ele o registro
+    fica desabilitado, com um aviso no log, e todas as mensagens são
+    processadas. Para desabilitá-lo sem aviso, use FIPE_IDEMPOTENCY_LEDGER=off.
+    """
+    global _idempotency_ledger
+    if _idempotency_ledger is None:
+        if IDEMPOTENCY_LEDGER_BACKEND == BACKEND_MEMORY:
+            _idempotency_ledger = MemoryIdempotencyLedger()
+        elif IDEMPOTENCY_LEDGER_BACKEND == BACKEND_POSTGRES:
+            if not os.getenv("RDS_HOST"):
+                logger.warning(
+                    "RDS_HOST não definido: registro de idempotência desabilitado"
+                    " (use FIPE_IDEMPOTENCY_LEDGER=off se for intencional)"
+                )
+                return None
+            _idempotency_ledger = PostgresIdempotencyLedger()
+    return _idempotency_ledger
+
+
+def check_records(stage, records):
+    """
+    Consulta o registro de idempotência para as mensagens de um lote SQS.
+
+    Returns:
+        tuple: (registro ou None, entradas por messageId, entradas já concluídas)
+    """
+    ledger = get_idempotency_ledger()
+    entries = {record["messageId"]: record_entry(stage, record) for record in records}
+    done = ledger.done(entries.values()) if ledger else set()
+    return ledger, entries, done
+
+
+def mark_completed(ledger, entries, completed, batch_item_failures):
+    """
+    Registra como concluídas as mensagens de `completed` (messageIds) que não
+    foram reportadas como falha.
+    """
+    if not ledger:
+        return
+    failed = {failure["itemIdentifier"] for failure in batch_item_failures}
+    ledger.mark_done(entries[message_id] for message_id in completed if message_id not in failed)
+    logger.info(f"Registro de idempotência: {ledger.stats()}")
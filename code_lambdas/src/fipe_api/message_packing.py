@@ -0,0 +1,137 @@
+import os
+import gzip
+import json
+import base64
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Empacotamento de vários registros por mensagem SQS (habilitado por Lambda)
+PACK_MESSAGES = os.getenv("FIPE_PACK_MESSAGES", "false").lower() == "true"
+# Codificação dos registros empacotados: "gzip" (gzip + base64) ou "none" (JSON puro)
+PACK_COMPRESSION = os.getenv("FIPE_PACK_COMPRESSION", "gzip")
+# Tamanho máximo de cada mensagem empacotada (o limite do SQS é 262.144 bytes)
+PACK_MAX_BYTES = int(os.getenv("FIPE_PACK_MAX_BYTES", "256000"))
+
+PACKED_FORMAT = "fipe-packed/v1"
+ENCODING_JSON = "json"
+ENCODING_GZIP = "gzip+base64"
+
+# Taxa de compressão inicial usada para estimar quantos registros cabem em uma
+# mensagem comprimida; a estimativa é corrigida a cada mensagem gerada
+INITIAL_COMPRESSION_RATIO = 4.0
+
+
+def _envelope(encoding, count, records):
+    return (
+        f'{{"format":"{PACKED_FORMAT}","encoding":"{encoding}",'
+        f'"count":{count},"records":{records}}}'
+    )
+
+
+def _encode_group(encoded_records, compress):
+    """Monta o corpo de uma mensagem a partir de registros já serializados."""
+    records = "[" + ",".join(encoded_records) + "]"
+    if not compress:
+        return _envelope(ENCODING_JSON, len(encoded_records), records)
+    payload = base64.b64encode(gzip.compress(records.encode("utf-8"))).decode("ascii")
+    return _envelope(ENCODING_GZIP, len(encoded_records), f'"{payload}"')
+
+
+def _encode_within_limit(encoded_records, compress, max_bytes):
+    """
+    Codifica um grupo de registros, dividindo-o ao meio enquanto a mensagem
+    resultante exceder `max_bytes`. Retorna tuplas (corpo, quantidade).
+    """
+    body = _encode_group(encoded_records, compress)
+    if len(body.encode("utf-8")) <= max_bytes:
+        return [(body, len(encoded_records))]
+    if len(encoded_records) == 1:
+        raise ValueError(f"Registro excede o tamanho máximo de mensagem ({max_bytes} bytes)")
+    middle = len(encoded_records) // 2
+    return (
+        _encode_within_limit(encoded_records[:middle], compress, max_bytes)
+        + _encode_within_limit(encoded_records[middle:], compress, max_bytes)
+    )
+
+
+def pack_records(records, max_bytes=None, compression=None):
+    """
+    Agrupa registros em corpos de mensagem SQS de até `max_bytes` bytes.
+
+    Cada corpo é um envelope `{"format": "fipe-packed/v1", "encoding": ...,
+    "count": N, "records": ...}`, em que `records` é a lista JSON dos
+    registros ou, com compressão, a mesma lista em gzip + base64.
+
+    Args:
+        records (list): Registros (dicts) a enviar
+        max_bytes (int): Tamanho máximo de cada corpo
+        compression (str): "gzip" ou "none"
+
+    Returns:
+        list: Corpos de mensagem (str)
+    """
+    return [body for body, _ in pack_record_groups(records, max_bytes, compression)]
+
+
+def pack_record_groups(records, max_bytes=None, compression=None):
+    """
+    Como `pack_records`, mas retorna tuplas (corpo, quantidade de registros).
+    A ordem dos registros é mantida: cada corpo contém os registros seguintes
+    aos dos corpos anteriores.
+    """
+    max_bytes = int(max_bytes or PACK_MAX_BYTES)
+    compress = (compression or PACK_COMPRESSION) == "gzip"
+    ratio = INITIAL_COMPRESSION_RATIO if compress else 1.0
+    # Reserva para o envelope (campos fixos e contagem)
+    budget = max_bytes - 128
+
+    bodies = []
+    group = []
+    group_size = 0
+
+    def flush():
+        nonlocal ratio
+        encoded = _encode_within_limit(group, compress, max_bytes)
+        if compress:
+            # Ajusta a estimativa com a compressão observada
+            ratio = max(1.0, group_size / sum(len(body) for body, _ in encoded))
+        bodies.extend(encoded)
+
+    for record in records:
+        encoded_record = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        size = len(encoded_record.encode("utf-8")) + 1
+        if group and group_size + size > budget * ratio:
+            flush()
+            group, group_size = [], 0
+        group.append(encoded_record)
+        group_size += size
+
+    if group:
+        flush()
+
+    logger.info(f"{len(records)} registros empacotados em {len(bodies)} mensagens")
+    return bodies
+
+
+def unpack_body(body):
+    """
+    Decodifica o corpo de uma mensagem SQS nos registros que ela contém.
+
+    Aceita tanto o formato empacotado (`fipe-packed/v1`) quanto o formato
+    anterior, de um registro por mensagem.
+
+    Args:
+        body (str | dict): Corpo da mensagem
+
+    Returns:
+        list: Registros (dicts) da mensagem
+    """
+    message = json.loads(body) if isinstance(body, (str, bytes)) else body
+    if not isinstance(message, dict) or message.get("format") != PACKED_FORMAT:
+        return [message]
+
+    records = message["records"]
+    if message.get("encoding") == ENCODING_GZIP:
+        records = json.loads(gzip.decompress(base64.b64decode(records)).decode("utf-8"))
+    return records
@@ -0,0 +1,321 @@
+import os
+import sys
+import json
+import time
+import random
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+# Destino das métricas: "emf" (CloudWatch Embedded Metric Format no stdout),
+# "local" (apenas em memória, para testes e benchmarks) ou "off". O padrão é
+# "emf" dentro da Lambda e "local" fora dela
+METRICS_MODE = os.getenv(
+    "FIPE_METRICS", "emf" if os.getenv("AWS_LAMBDA_FUNCTION_NAME") else "local"
+)
+METRICS_NAMESPACE = os.getenv("FIPE_METRICS_NAMESPACE", "FipeApi")
+# Dimensão "service" de todas as métricas (por padrão, o nome da função Lambda)
+METRICS_SERVICE = os.getenv("FIPE_METRICS_SERVICE") or os.getenv("AWS_LAMBDA_FUNCTION_NAME")
+
+MODE_EMF = "emf"
+MODE_LOCAL = "local"
+
+# Etapas instrumentadas (dimensão "stage")
+STAGE_API = "fipe_api"
+STAGE_SQS = "sqs"
+STAGE_INGEST = "ingest"
+
+UNIT_COUNT = "Count"
+UNIT_MILLISECONDS = "Milliseconds"
+UNIT_RATE = "Count/Second"
+
+# Limite do EMF de valores por métrica em um mesmo documento
+EMF_MAX_VALUES = 100
+# Valores guardados por histograma: acima do limite, uma amostra uniforme
+# (reservoir sampling) mantém a memória constante em execuções longas
+HISTOGRAM_MAX_VALUES = int(os.getenv("FIPE_METRICS_MAX_VALUES", "1000"))
+
+
+def _dimension_key(dimensions):
+    """Dimensões sem valor são omitidas; os valores são sempre strings."""
+    return tuple(sorted((name, str(value)) for name, value in dimensions.items() if value is not None))
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Histogram:
+    """
+    Valores de um histograma: contagem, soma e máximo exatos e até
+    `max_values` valores, uma amostra uniforme quando há mais observações.
+    """
+
+    __slots__ = ("count", "sum", "max", "values", "max_values")
+
+    def __init__(self, max_values=None):
+        self.count = 0
+        self.sum = 0.0
+        self.max = None
+        self.values = []
+        self.max_values = HISTOGRAM_MAX_VALUES if max_values is None else int(max_values)
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self.values) < self.max_values:
+            self.values.append(value)
+        else:
+            index = random.randrange(self.count)
+            if index < self.max_values:
+                self.values[index] = value
+
+
+class Metrics:
+    """
+    Interface das métricas das etapas do pipeline (chamadas à API FIPE,
+    envios ao SQS e escritas do ingestor).
+
+    Contadores (`increment`) são somados e histogramas (`observe`, `timer`)
+    guardam os valores (ver `Histogram`), ambos por nome e conjunto de
+    dimensões (`stage`, `endpoint`, `vehicle_type`, ...). A implementação
+    base descarta tudo; subclasses sobrescrevem `_record`.
+    """
+
+    def increment(self, name, value=1, **dimensions):
+        """Soma `value` ao contador `name`."""
+        self._record(name, UNIT_COUNT, value, dimensions, counter=True)
+
+    def observe(self, name, value, unit=UNIT_MILLISECONDS, **dimensions):
+        """Registra um valor no histograma `name`."""
+        self._record(name, unit, value, dimensions, counter=False)
+
+    @contextmanager
+    def timer(self, name, **dimensions):
+        """Registra no histograma `name` a duração (ms) do bloco."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.monotonic() - start) * 1000, **dimensions)
+
+    def _record(self, name, unit, value, dimensions, counter):
+        pass
+
+    def flush(self):
+        """Publica as métricas acumuladas (ao final de cada invocação)."""
+
+    def snapshot(self):
+        return []
+
+
+class LocalMetrics(Metrics):
+    """Métricas acumuladas em memória, consultadas com `snapshot` e `total`."""
+
+    def __init__(self, max_values=None):
+        self.max_values = max_values
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def _record(self, name, unit, value, dimensions, counter):
+        key = (name, unit, _dimension_key(dimensions))
+        with self._lock:
+            if counter:
+                self._counters[key] = self._counters.get(key, 0) + value
+            else:
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(self.max_values)
+                histogram.add(value)
+
+    def _drain(self):
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            histograms, self._histograms = self._histograms, {}
+        return counters, histograms
+
+    def reset(self):
+        self._drain()
+
+    def snapshot(self):
+        """
+        Resumo das métricas: o total de cada contador e contagem, soma e
+        percentis de cada histograma, por nome e dimensões.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                key: (histogram.count, histogram.sum, histogram.max, list(histogram.values))
+                for key, histogram in self._histograms.items()
+            }
+        series = [
+            {"name": name, "unit": unit, "dimensions": dict(dims), "value": value}
+            for (name, unit, dims), value in counters.items()
+        ]
+        series.extend(
+            {
+                "name": name,
+                "unit": unit,
+                "dimensions": dict(dims),
+                "count": count,
+                "sum": round(total, 3),
+                "p50": round(_percentile(values, 0.5), 3),
+                "p99": round(_percentile(values, 0.99), 3),
+                "max": round(maximum, 3),
+            }
+            for (name, unit, dims), (count, total, maximum, values) in histograms.items()
+        )
+        return sorted(series, key=lambda s: (s["name"], sorted(s["dimensions"].items())))
+
+    def total(self, name, **dimensions):
+        """
+        Soma de um contador (ou quantidade de valores de um histograma) em
+        todas as séries que contêm as dimensões informadas.
+        """
+        wanted = set(_dimension_key(dimensions))
+        with self._lock:
+            total = sum(
+                value for (metric, _, dims), value in self._counters.items()
+                if metric == name and wanted.issubset(dims)
+            )
+            total += sum(
+                histogram.count for (metric, _, dims), histogram in self._histograms.items()
+                if metric == name and wanted.issubset(dims)
+            )
+        return total
+
+
+class EmfMetrics(LocalMetrics):
+    """
+    Métricas publicadas no CloudWatch pelo Embedded Metric Format: a cada
+    `flush`, um documento JSON por conjunto de dimensões é escrito no stdout
+    (o log da Lambda), com os contadores somados e até 100 valores por
+    histograma em cada documento. Como o `flush` ocorre a cada invocação, a
+    amostragem dos histogramas só atua acima de FIPE_METRICS_MAX_VALUES
+    observações em uma mesma invocação.
+    """
+
+    def __init__(self, namespace=None, service=None, stream=None, max_values=None):
+        super().__init__(max_values=max_values)
+        self.namespace = namespace or METRICS_NAMESPACE
+        self.service = service or METRICS_SERVICE
+        self.stream = stream
+
+    def flush(self):
+        counters, histograms = self._drain()
+        groups = {}
+        for (name, unit, dims), value in counters.items():
+            groups.setdefault(dims, {})[name] = (unit, [value])
+        for (name, unit, dims), histogram in histograms.items():
+            groups.setdefault(dims, {})[name] = (unit, histogram.values)
+
+        stream = self.stream or sys.stdout
+        timestamp = int(time.time() * 1000)
+        for dims, metrics in groups.items():
+            for document in self._documents(dict(dims), metrics, timestamp):
+                stream.write(json.dumps(document, separators=(",", ":")) + "\n")
+        stream.flush()
+
+    def _documents(self, dimensions, metrics, timestamp):
+        if self.service:
+            dimensions = {"service": self.service, **dimensions}
+        chunks = max(
+            (len(values) + EMF_MAX_VALUES - 1) // EMF_MAX_VALUES for _, values in metrics.values()
+        )
+        for chunk in range(chunks):
+            document = dict(dimensions)
+            definitions = []
+            for name, (unit, values) in metrics.items():
+                part = values[chunk * EMF_MAX_VALUES:(chunk + 1) * EMF_MAX_VALUES]
+                if not part:
+                    continue
+                document[name] = part[0] if len(part) == 1 else [round(v, 3) for v in part]
+                definitions.append({"Name": name, "Unit": unit})
+            document["_aws"] = {
+                "Timestamp": timestamp,
+                "CloudWatchMetrics": [{
+                    "Namespace": self.namespace,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": definitions,
+                }],
+            }
+            yield document
+
+
+# Métricas compartilhadas no escopo do módulo por todas as etapas do processo
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Retorna as métricas do processo, de acordo com FIPE_METRICS."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            if METRICS_MODE == MODE_EMF:
+                _metrics = EmfMetrics()
+                atexit.register(_metrics.flush)
+            elif METRICS_MODE == MODE_LOCAL:
+                _metrics = LocalMetrics()
+            else:
+                _metrics = Metrics()
+    return _metrics
+
+
+def log_metrics(handler):
+    """Decorador de `lambda_handler`: publica as métricas ao final de cada invocação."""
+
+    @wraps(handler)
+    def wrapper(event, context):
+        try:
+            return handler(event, context)
+        finally:
+            try:
+                get_metrics().flush()
+            except Exception as e:
+                logger.warning(f"Erro ao publicar as métricas: {e}")
+
+    return wrapper
+
+
+def record_api_call(metrics, endpoint, payload, status_code, start):
+    """
+    Registra uma chamada à API FIPE iniciada em `start` (time.monotonic):
+    latência, requisições e respostas 429 ou com erro (`status_code` None
+    para falhas sem resposta), por endpoint e tipo de veículo.
+    """
+    dimensions = {
+        "stage": STAGE_API,
+        "endpoint": endpoint,
+        "vehicle_type": (payload or {}).get("codigoTipoVeiculo"),
+    }
+    metrics.observe("Latency", (time.monotonic() - start) * 1000, **dimensions)
+    metrics.increment("Requests", **dimensions)
+    if status_code == 429:
+        metrics.increment("Throttles", **dimensions)
+    elif status_code is None or status_code >= 400:
+        metrics.increment("Errors", **dimensions)
+
+
+def record_rows(metrics, endpoint, rows, start, vehicle_types=()):
+    """
+    Registra uma escrita de `rows` linhas iniciada em `start`: latência,
+    linhas por segundo e linhas por tipo de veículo (`vehicle_types`, um
+    valor por linha, quando conhecido).
+    """
+    elapsed = time.monotonic() - start
+    metrics.observe("Latency", elapsed * 1000, stage=STAGE_INGEST, endpoint=endpoint)
+    if elapsed > 0:
+        metrics.observe("RowsPerSecond", rows / elapsed, unit=UNIT_RATE, stage=STAGE_INGEST, endpoint=endpoint)
+    per_type = {}
+    for vehicle_type in vehicle_types:
+        per_type[vehicle_type] = per_type.get(vehicle_type, 0) + 1
+    for vehicle_type, count in (per_type or {None: rows}).items():
+        metrics.increment("Rows", count, stage=STAGE_INGEST, endpoint=endpoint, vehicle_type=vehicle_type)
@@ -0,0 +1,192 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+# Parâmetros padrão do limitador adaptativo (requisições por segundo)
+DEFAULT_RATE = float(os.getenv("FIPE_RATE_LIMIT", "2.0"))
+DEFAULT_MIN_RATE = float(os.getenv("FIPE_RATE_LIMIT_MIN", "0.2"))
+DEFAULT_MAX_RATE = float(os.getenv("FIPE_RATE_LIMIT_MAX", "20.0"))
+DEFAULT_BURST = float(os.getenv("FIPE_RATE_LIMIT_BURST", "2"))
+DEFAULT_INCREASE = float(os.getenv("FIPE_RATE_LIMIT_INCREASE", "0.05"))
+DEFAULT_DECREASE_FACTOR = float(os.getenv("FIPE_RATE_LIMIT_DECREASE", "0.5"))
+
+# Quantidade de eventos de throttling mantidos em memória para diagnóstico
+MAX_THROTTLE_EVENTS = 100
+
+
+class RateLimiter:
+    """
+    Interface dos limitadores de taxa usados pelo FipeAPI.
+
+    A implementação base não impõe nenhum limite; subclasses sobrescrevem
+    `reserve`, `on_success` e `on_throttle`.
+    """
+
+    def reserve(self):
+        """Reserva uma requisição e retorna quantos segundos aguardar antes dela."""
+        return 0.0
+
+    def acquire(self):
+        """Bloqueia a thread atual até que a requisição possa ser enviada."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self):
+        """Versão assíncrona de `acquire`, que não bloqueia o event loop."""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def on_success(self):
+        """Notifica o limitador de que a requisição foi aceita pela API."""
+
+    def on_throttle(self, retry_after=None):
+        """Notifica o limitador de que a API respondeu 429 (Too Many Requests)."""
+
+    @property
+    def current_rate(self):
+        return None
+
+    @property
+    def throttle_events(self):
+        return []
+
+    def stats(self):
+        """Retorna um resumo do estado do limitador."""
+        return {
+            "current_rate": self.current_rate,
+            "throttle_count": len(self.throttle_events),
+        }
+
+
+class TokenBucketRateLimiter(RateLimiter):
+    """
+    Token bucket com ajuste AIMD (additive increase, multiplicative decrease).
+
+    Cada resposta bem-sucedida aumenta a taxa em `increase` req/s até
+    `max_rate`; cada 429 multiplica a taxa por `decrease_factor`, sem
+    descer abaixo de `min_rate`, e respeita o cabeçalho `Retry-After`
+    quando presente. É seguro para uso por várias threads.
+    """
+
+    def __init__(
+        self,
+        rate=None,
+        burst=None,
+        min_rate=None,
+        max_rate=None,
+        increase=None,
+        decrease_factor=None,
+    ):
+        self.rate = float(rate or DEFAULT_RATE)
+        self.burst = float(burst or DEFAULT_BURST)
+        self.min_rate = float(min_rate or DEFAULT_MIN_RATE)
+        self.max_rate = float(max_rate or DEFAULT_MAX_RATE)
+        self.increase = float(increase or DEFAULT_INCREASE)
+        self.decrease_factor = float(decrease_factor or DEFAULT_DECREASE_FACTOR)
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.throttle_count = 0
+        self._events = deque(maxlen=MAX_THROTTLE_EVENTS)
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            return max(wait, self.blocked_until - now)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after=None):
+        with self._lock:
+            now = time.monotonic()
+            previous_rate = self.rate
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+            self.throttle_count += 1
+            self._events.append(
+                {
+                    "timestamp": time.time(),
+                    "rate_before": previous_rate,
+                    "rate_after": self.rate,
+                    "retry_after": retry_after,
+                }
+            )
+        logger.warning(
+            f"[429] - Taxa reduzida de {previous_rate:.2f} para {self.rate:.2f} req/s"
+            f" (Retry-After: {retry_after})"
+        )
+
+    @property
+    def current_rate(self):
+        return self.rate
+
+    @property
+    def throttle_events(self):
+        return list(self._events)
+
+    def stats(self):
+        return {
+            "current_rate": round(self.rate, 3),
+            "throttle_count": self.throttle_count,
+            "last_throttle": self._events[-1] if self._events else None,
+        }
+
+
+def parse_retry_after(value):
+    """
+    Converte o cabeçalho Retry-After para segundos (float), se possível. O
+    valor pode ser um número de segundos ou uma data HTTP
+    (ex.: "Wed, 21 Oct 2015 07:28:00 GMT"), convertida no tempo até ela.
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if retry_at is None:
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+# Limitador compartilhado no escopo do módulo, preservado entre invocações
+# "quentes" da Lambda para que a taxa aprendida não seja perdida
+_shared_rate_limiter = None
+
+
+def get_shared_rate_limiter():
+    """Retorna o limitador de taxa padrão compartilhado pelo processo."""
+    global _shared_rate_limiter
+    if _shared_rate_limiter is None:
+        _shared_rate_limiter = TokenBucketRateLimiter()
+    return _shared_rate_limiter
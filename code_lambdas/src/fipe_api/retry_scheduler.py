@@ -0,0 +1,121 @@
+import os
+import json
+import random
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Parâmetros do backoff exponencial com jitter (em segundos)
+RETRY_BASE_DELAY = int(os.getenv("FIPE_RETRY_BASE_DELAY", "5"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("FIPE_RETRY_MAX_ATTEMPTS", "6"))
+# Limite máximo de DelaySeconds/VisibilityTimeout aceito pelo SQS para o reagendamento
+SQS_MAX_DELAY = 900
+
+# Campo da mensagem que carrega o número de reagendamentos já realizados
+RETRY_ATTEMPT_FIELD = "retryAttempt"
+
+
+def queue_url_from_arn(queue_arn):
+    """Converte o ARN de uma fila SQS (eventSourceARN) na URL da fila."""
+    _, _, _, region, account_id, queue_name = queue_arn.split(":", 5)
+    return f"https://sqs.{region}.amazonaws.com/{account_id}/{queue_name}"
+
+
+class RetryScheduler:
+    """
+    Reagenda na própria fila SQS as unidades de trabalho que receberam 429.
+
+    Em vez de dormir dentro da Lambda, a mensagem é reenviada com
+    `DelaySeconds` (backoff exponencial com jitter), levando o número da
+    tentativa no campo `retryAttempt`. Se o reenvio falhar, a visibilidade
+    da mensagem original é estendida com `ChangeMessageVisibility` e ela deve
+    ser reportada em `batchItemFailures`.
+    """
+
+    def __init__(self, sqs_client, queue_url=None, base_delay=None, max_attempts=None):
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url or os.getenv("SQS_INPUT_URL")
+        self.base_delay = int(base_delay or RETRY_BASE_DELAY)
+        self.max_attempts = int(max_attempts or RETRY_MAX_ATTEMPTS)
+        self.scheduled = 0
+        self.requeued = 0
+
+    def compute_delay(self, attempt, retry_after=None):
+        """Backoff exponencial com "equal jitter", respeitando o Retry-After."""
+        cap = min(SQS_MAX_DELAY, self.base_delay * (2 ** (attempt - 1)))
+        delay = cap / 2 + random.uniform(0, cap / 2)
+        if retry_after:
+            delay = max(delay, retry_after)
+        return int(min(SQS_MAX_DELAY, max(1, round(delay))))
+
+    def schedule(self, record, message, retry_after=None):
+        """
+        Reagenda a mensagem da fila de entrada.
+
+        Args:
+            record (dict): Registro SQS original (messageId, receiptHandle, ...)
+            message (dict): Corpo da mensagem já decodificado
+            retry_after (float): Valor do cabeçalho Retry-After, se houver
+
+        Returns:
+            bool: True se a mensagem foi reenfileirada (o registro original pode
+            ser considerado concluído); False se ela deve ser reportada como
+            falha para que o SQS a entregue novamente
+        """
+        attempt = int(message.get(RETRY_ATTEMPT_FIELD, 0)) + 1
+        delay = self.compute_delay(attempt, retry_after)
+        queue_url = self.queue_url or queue_url_from_arn(record["eventSourceARN"])
+
+        if attempt > self.max_attempts:
+            logger.error(
+                f"Mensagem {record['messageId']} excedeu {self.max_attempts} reagendamentos"
+            )
+            return False
+
+        try:
+            self.sqs_client.send_message(
+                QueueUrl=queue_url,
+                MessageBody=json.dumps(
+                    {**message, RETRY_ATTEMPT_FIELD: attempt}, ensure_ascii=False
+                ),
+                DelaySeconds=delay,
+            )
+            self.scheduled += 1
+            logger.warning(
+                f"[429] - Mensagem {record['messageId']} reagendada em {delay}s (tentativa {attempt})"
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao reagendar mensagem {record['messageId']}: {e}")
+
+        try:
+            self.sqs_client.change_message_visibility(
+                QueueUrl=queue_url,
+                ReceiptHandle=record["receiptHandle"],
+                VisibilityTimeout=delay,
+            )
+        except Exception as e:
+            logger.error(f"Erro ao alterar visibilidade da mensagem {record['messageId']}: {e}")
+        return False
+
+    def requeue(self, record, message):
+        """
+        Reenfileira imediatamente uma continuação de trabalho (sem backoff e sem
+        contar como nova tentativa), usada quando o tempo da invocação se esgota.
+
+        Returns:
+            bool: True se a mensagem foi reenfileirada; False se o registro
+            original deve ser reportado como falha
+        """
+        queue_url = self.queue_url or queue_url_from_arn(record["eventSourceARN"])
+        try:
+            self.sqs_client.send_message(
+                QueueUrl=queue_url,
+                MessageBody=json.dumps(message, ensure_ascii=False),
+            )
+            self.requeued += 1
+            logger.info(f"Continuação da mensagem {record['messageId']} reenfileirada")
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao reenfileirar continuação da mensagem {record['messageId']}: {e}")
+            return False
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from message_packing import pack_record_groups, PACK_MAX_BYTES, PACK_COMPRESSION
+from metrics import get_metrics, STAGE_SQS
+
+logger = logging.getLogger(__name__)
+
+# Limites do SendMessageBatch do SQS
+SQS_MAX_BATCH_ENTRIES = 10
+SQS_MAX_BATCH_BYTES = 262144
+
+# Threads que enviam lotes em paralelo e máximo de lotes em voo; ao atingir o
+# limite, `add` bloqueia o produtor até que algum envio termine
+SEND_WORKERS = int(os.getenv("FIPE_SQS_SEND_WORKERS", "4"))
+MAX_IN_FLIGHT = int(os.getenv("FIPE_SQS_MAX_IN_FLIGHT", "8"))
+# Tentativas de reenvio das entradas que falharam em um lote
+SEND_MAX_ATTEMPTS = int(os.getenv("FIPE_SQS_SEND_MAX_ATTEMPTS", "3"))
+SEND_RETRY_DELAY = 0.2
+
+# Volume de registros (bytes serializados) acumulado antes de empacotá-los
+PACK_BUFFER_BYTES = PACK_MAX_BYTES * (8 if PACK_COMPRESSION == "gzip" else 1)
+
+
+class SqsBatchSender:
+    """
+    Envio de mensagens para uma fila SQS em lotes paralelos.
+
+    As entradas são agrupadas por tamanho (até 10 entradas e 256 KB por
+    chamada a `send_message_batch`) e os lotes são enviados por um pequeno
+    pool de threads. Apenas as entradas que falharam são reenviadas. Com
+    `MAX_IN_FLIGHT` lotes pendentes, `add` bloqueia o produtor até que algum
+    envio termine, mantendo a memória limitada.
+
+    Cada mensagem pode receber uma `tag` (ex.: o messageId da mensagem de
+    entrada que a originou); `close` retorna as tags das mensagens que não
+    puderam ser enviadas. Com `pack=True`, a falha de um corpo empacotado
+    reporta todas as tags com registros nele: cada uma dessas mensagens de
+    entrada é reprocessada por inteiro, repetindo também os registros já
+    entregues em outros corpos (a gravação no ingestor é um upsert, então a
+    repetição é idempotente, mas refaz as consultas à API).
+
+        with SqsBatchSender(sqs_client, queue_url, pack=True) as sender:
+            sender.add(record, tag=message_id)
+        failed_tags = sender.failed_tags
+    """
+
+    def __init__(
+        self,
+        sqs_client,
+        queue_url,
+        pack=False,
+        workers=None,
+        max_in_flight=None,
+        max_attempts=None,
+        metrics=None,
+    ):
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url
+        self.metrics = metrics or get_metrics()
+        # Dimensões das métricas de envio: a fila é identificada pelo nome
+        self.metric_dimensions = {"stage": STAGE_SQS, "endpoint": queue_url.rstrip("/").rsplit("/", 1)[-1]}
+        self.pack = pack
+        self.max_attempts = int(max_attempts or SEND_MAX_ATTEMPTS)
+        self.executor = ThreadPoolExecutor(max_workers=int(workers or SEND_WORKERS))
+        self.in_flight = threading.BoundedSemaphore(int(max_in_flight or MAX_IN_FLIGHT))
+        self.futures = []
+        self.failed_tags = set()
+        self.sent = 0
+        self.requests = 0
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+        # Entradas acumuladas do próximo lote: (corpo, tamanho, tags)
+        self._entries = []
+        self._entries_bytes = 0
+        # Registros acumulados para empacotamento: (registro, tag)
+        self._records = []
+        self._records_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add(self, message, tag=None):
+        """Adiciona uma mensagem (dict) ao envio."""
+        body = json.dumps(message, ensure_ascii=False)
+        if not self.pack:
+            self._add_body(body, {tag})
+            return
+        self._records.append((message, tag))
+        self._records_bytes += len(body)
+        if self._records_bytes >= PACK_BUFFER_BYTES:
+            self._pack_records()
+
+    def _pack_records(self):
+        if not self._records:
+            return
+        offset = 0
+        for body, count in pack_record_groups([message for message, _ in self._records]):
+            # Um corpo empacotado pode conter registros de várias mensagens de
+            # entrada: em caso de falha, as tags dos registros deste corpo são
+            # reportadas (e não as dos demais corpos do mesmo buffer)
+            self._add_body(body, {tag for _, tag in self._records[offset:offset + count]})
+            offset += count
+        self._records = []
+        self._records_bytes = 0
+
+    def _add_body(self, body, tags):
+        size = len(body.encode("utf-8"))
+        if self._entries and (
+            len(self._entries) >= SQS_MAX_BATCH_ENTRIES
+            or self._entries_bytes + size > SQS_MAX_BATCH_BYTES
+        ):
+            self._dispatch()
+        self._entries.append((body, size, tags))
+        self._entries_bytes += size
+
+    def _dispatch(self):
+        """Envia o lote acumulado, bloqueando se houver lotes demais em voo."""
+        entries = self._entries
+        self._entries = []
+        self._entries_bytes = 0
+        if not entries:
+            return
+        start = time.monotonic()
+        self.in_flight.acquire()
+        self.wait_seconds += time.monotonic() - start
+        self.futures.append(self.executor.submit(self._send_batch, entries))
+
+    def _send_batch(self, entries):
+        try:
+            pending = {str(index): entry for index, entry in enumerate(entries)}
+            for attempt in range(1, self.max_attempts + 1):
+                start = time.monotonic()
+                try:
+                    response = self.sqs_client.send_message_batch(
+                        QueueUrl=self.queue_url,
+                        Entries=[
+                            {"Id": entry_id, "MessageBody": body}
+                            for entry_id, (body, _, _) in pending.items()
+                        ],
+                    )
+                    failed = response.get("Failed", [])
+                except Exception as e:
+                    logger.warning(f"Erro ao enviar lote para o SQS (tentativa {attempt}): {e}")
+                    failed = [{"Id": entry_id, "SenderFault": False} for entry_id in pending]
+                with self._lock:
+                    self.requests += 1
+                    self.sent += len(pending) - len(failed)
+                self.metrics.observe("Latency", (time.monotonic() - start) * 1000, **self.metric_dimensions)
+                self.metrics.increment("Requests", **self.metric_dimensions)
+                self.metrics.increment("Messages", len(pending) - len(failed), **self.metric_dimensions)
+
+                # Reenvia somente as entradas que falharam por erro do serviço
+                retryable = {}
+                for failure in failed:
+                    entry = pending[failure["Id"]]
+                    if failure.get("SenderFault"):
+                        logger.error(f"Mensagem rejeitada pelo SQS: {failure.get('Message')}")
+                        self._record_failure(entry)
+                    else:
+                        retryable[failure["Id"]] = entry
+                pending = retryable
+                if not pending:
+                    return
+                time.sleep(SEND_RETRY_DELAY * attempt)
+
+            logger.error(f"{len(pending)} mensagens não enviadas após {self.max_attempts} tentativas")
+            for entry in pending.values():
+                self._record_failure(entry)
+        finally:
+            self.in_flight.release()
+
+    def _record_failure(self, entry):
+        self.metrics.increment("FailedMessages", **self.metric_dimensions)
+        with self._lock:
+            self.failed_tags.update(entry[2])
+
+    def flush(self):
+        """Envia tudo o que estiver acumulado e aguarda os envios em andamento."""
+        self._pack_records()
+        self._dispatch()
+        for future in self.futures:
+            future.result()
+        self.futures = []
+        return self.failed_tags
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown(wait=True)
+        logger.info(f"Envio SQS: {self.stats()}")
+        return self.failed_tags
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "requests": self.requests,
+            "failed": len(self.failed_tags),
+            "producer_wait_seconds": round(self.wait_seconds, 3),
+        }
+
+
+def add_send_failures(sender, records, batch_item_failures):
+    """
+    Conclui o envio e reporta como falha as mensagens de entrada (tags =
+    messageId) cujas mensagens derivadas não puderam ser enviadas.
+    """
+    try:
+        failed_tags = sender.close()
+    except Exception as e:
+        logger.error(f"Error sending batch to SQS: {e}")
+        failed_tags = {record["messageId"] for record in records}
+
+    reported = {failure["itemIdentifier"] for failure in batch_item_failures}
+    for record in records:
+        message_id = record["messageId"]
+        if message_id in failed_tags and message_id not in reported:
+            batch_item_failures.append({"itemIdentifier": message_id})
@@ -0,0 +1,71 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Margem de segurança (ms) reservada antes do timeout da Lambda para enviar o
+# que já foi processado e reenfileirar a continuação do trabalho restante
+TIME_BUDGET_MARGIN_MS = int(os.getenv("FIPE_TIME_BUDGET_MARGIN_MS", "30000"))
+
+# Campo da mensagem de continuação com os pares ano/combustível pendentes
+PENDING_PAIRS_FIELD = "pendingPairs"
+
+
+class TimeBudgetExceeded(Exception):
+    """Sinaliza que uma chamada à API não foi feita por falta de tempo na invocação."""
+
+
+class TimeBudget:
+    """
+    Controle do tempo restante de uma invocação Lambda.
+
+    Usa `context.get_remaining_time_in_millis()`; sem contexto (execução
+    local), o orçamento nunca se esgota.
+    """
+
+    def __init__(self, context=None, margin_ms=None):
+        self.context = context
+        self.margin_ms = TIME_BUDGET_MARGIN_MS if margin_ms is None else int(margin_ms)
+        self.exhausted_logged = False
+
+    def remaining_ms(self):
+        get_remaining = getattr(self.context, "get_remaining_time_in_millis", None)
+        return get_remaining() if get_remaining else float("inf")
+
+    def exhausted(self):
+        """Indica se a invocação deve parar de iniciar novas chamadas à API."""
+        remaining = self.remaining_ms()
+        if remaining > self.margin_ms:
+            return False
+        if not self.exhausted_logged:
+            logger.warning(
+                f"Tempo restante ({remaining} ms) abaixo da margem de {self.margin_ms} ms;"
+                " o trabalho restante será reenfileirado"
+            )
+            self.exhausted_logged = True
+        return True
+
+
+def build_continuation(message, pending_pairs):
+    """
+    Monta a mensagem de continuação de um modelo com os pares ano/combustível
+    que ainda não foram consultados.
+
+    Args:
+        message (dict): Mensagem original do modelo
+        pending_pairs (list): Pares (ano, código do combustível) pendentes
+
+    Returns:
+        dict: Mensagem com o campo `pendingPairs`
+    """
+    return {
+        **message,
+        PENDING_PAIRS_FIELD: [
+            {
+                "yearModel": year.get("yearModel"),
+                "Label": year.get("Label"),
+                "fuelType": fuel_type_code,
+            }
+            for year, fuel_type_code in pending_pairs
+        ],
+    }
@@ -22,7 +22,7 @@ echo "=== Criando camada Lambda otimizada para FipeApiStack ==="
 # Definir diretórios e arquivos
 LAYER_DIR="fipe_api_layer/python/lib/python3.10/site-packages"
 ZIP_FILE="fipe_api_layer.zip"
-REQUIRED_PACKAGES="boto3 requests psycopg2-binary pydantic"
+REQUIRED_PACKAGES="boto3 requests httpx psycopg2-binary pydantic"
 
 # Criar estrutura de diretórios
 mkdir -p "$LAYER_DIR"
@@ -65,8 +65,23 @@ CREATE TABLE IF NOT EXISTS public.fipe_vehicle_model
         ON DELETE RESTRICT
 );
 
+-- DROP TABLE IF EXISTS public.fipe_reference_table;
+
+-- Tabelas de referência mensais da FIPE (código e nome do mês)
+
+CREATE TABLE IF NOT EXISTS public.fipe_reference_table
+(
+    code integer NOT NULL,
+    month_name character varying COLLATE pg_catalog."default" NOT NULL,
+    create_date timestamp without time zone,
+    CONSTRAINT fipe_reference_table_pkey PRIMARY KEY (code)
+);
+
 -- DROP TABLE IF EXISTS public.fipe_vehicle_model_value;
 
+-- Valores particionados por tabela de referência (uma partição por mês,
+-- criada sob demanda por public.fipe_ensure_value_partition)
+
 CREATE TABLE IF NOT EXISTS public.fipe_vehicle_model_value
 (
     id integer NOT NULL DEFAULT nextval('fipe_vehicle_model_value_id_seq'::regclass),
@@ -75,10 +90,9 @@ CREATE TABLE IF NOT EXISTS public.fipe_vehicle_model_value
     code character varying COLLATE pg_catalog."default",
     fipe_code character varying COLLATE pg_catalog."default" NOT NULL,
     manufacturer_id integer,
-    manufacture_year character varying COLLATE pg_catalog."default",
-    reference_month character varying COLLATE pg_catalog."default",
-    reference_month_code character varying COLLATE pg_catalog."default",
-    fipe_value double precision,
+    manufacture_year smallint,
+    reference_month_code integer NOT NULL,
+    fipe_value_cents integer,
     fuel_type character varying COLLATE pg_catalog."default",
     vehicle_type integer,
     active boolean,
@@ -87,7 +101,7 @@ CREATE TABLE IF NOT EXISTS public.fipe_vehicle_model_value
     create_date timestamp without time zone,
     write_uid integer,
     write_date timestamp without time zone,
-    CONSTRAINT fipe_vehicle_model_value_pkey PRIMARY KEY (id),
+    CONSTRAINT fipe_vehicle_model_value_pkey PRIMARY KEY (id, reference_month_code),
     CONSTRAINT fipe_vehicle_model_value_model_id_fkey FOREIGN KEY (model_id)
         REFERENCES public.fipe_vehicle_model (id) MATCH SIMPLE
         ON UPDATE NO ACTION
@@ -95,5 +109,144 @@ CREATE TABLE IF NOT EXISTS public.fipe_vehicle_model_value
     CONSTRAINT fipe_vehicle_model_manufacturer_id_fkey FOREIGN KEY (manufacturer_id)
         REFERENCES public.fipe_vehicle_manufacturer (id) MATCH SIMPLE
         ON UPDATE NO ACTION
-        ON DELETE SET NULL
-);
\ No newline at end of file
+        ON DELETE SET NULL,
+    CONSTRAINT fipe_vehicle_model_value_reference_month_code_fkey FOREIGN KEY (reference_month_code)
+        REFERENCES public.fipe_reference_table (code) MATCH SIMPLE
+        ON UPDATE NO ACTION
+        ON DELETE RESTRICT
+) PARTITION BY RANGE (reference_month_code);
+
+-- Chave natural dos valores (usada pelo INSERT ... ON CONFLICT do ingestor);
+-- os índices da tabela particionada são replicados em cada partição
+
+CREATE UNIQUE INDEX IF NOT EXISTS fipe_vehicle_model_value_natural_key_unique
+    ON public.fipe_vehicle_model_value (model_id, fipe_code, manufacture_year, reference_month_code, fuel_type)
+    NULLS NOT DISTINCT;
+
+-- Consultas por código FIPE + tabela de referência
+
+CREATE INDEX IF NOT EXISTS fipe_vehicle_model_value_fipe_code_reference_idx
+    ON public.fipe_vehicle_model_value (fipe_code, reference_month_code);
+
+-- Cria (se necessário) a partição de uma tabela de referência; chamada pelo
+-- FipeSomaIngestor antes de gravar valores de um mês ainda sem partição
+
+CREATE OR REPLACE FUNCTION public.fipe_ensure_value_partition(p_reference_month_code integer)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    partition_name text := format('fipe_vehicle_model_value_%s', p_reference_month_code);
+BEGIN
+    IF to_regclass(format('public.%I', partition_name)) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    -- Serializa a criação da mesma partição por instâncias concorrentes do ingestor
+    PERFORM pg_advisory_xact_lock(hashtext('fipe_vehicle_model_value'), p_reference_month_code);
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS public.%I PARTITION OF public.fipe_vehicle_model_value FOR VALUES FROM (%s) TO (%s)',
+        partition_name, p_reference_month_code, p_reference_month_code + 1
+    );
+END;
+$$;
+
+-- Valores no formato legível (nome do mês de referência e valor em reais)
+
+CREATE OR REPLACE VIEW public.fipe_vehicle_model_value_detail AS
+SELECT
+    v.id, v.name, v.model_id, v.code, v.fipe_code, v.manufacturer_id,
+    v.manufacture_year, r.month_name AS reference_month, v.reference_month_code,
+    v.fipe_value_cents / 100.0 AS fipe_value, v.fuel_type, v.vehicle_type,
+    v.active, v.create_date, v.write_date
+FROM public.fipe_vehicle_model_value v
+JOIN public.fipe_reference_table r ON r.code = v.reference_month_code;
+
+-- DROP TABLE IF EXISTS public.fipe_catalog_cache;
+
+-- Cache persistente das listagens de catálogo da API FIPE (marcas, modelos e anos)
+
+CREATE TABLE IF NOT EXISTS public.fipe_catalog_cache
+(
+    kind character varying COLLATE pg_catalog."default" NOT NULL,
+    vehicle_type integer NOT NULL,
+    brand_code character varying COLLATE pg_catalog."default" NOT NULL DEFAULT '',
+    model_code character varying COLLATE pg_catalog."default" NOT NULL DEFAULT '',
+    reference_table_code integer NOT NULL,
+    payload jsonb NOT NULL,
+    create_date timestamp without time zone,
+    write_date timestamp without time zone,
+    CONSTRAINT fipe_catalog_cache_pkey PRIMARY KEY (kind, vehicle_type, brand_code, model_code, reference_table_code)
+);
+
+-- DROP TABLE IF EXISTS public.fipe_idempotency_ledger;
+
+-- Registro de idempotência: unidades de trabalho concluídas por tabela de
+-- referência, etapa do pipeline e chave natural
+
+CREATE TABLE IF NOT EXISTS public.fipe_idempotency_ledger
+(
+    reference_table_code integer NOT NULL,
+    stage character varying COLLATE pg_catalog."default" NOT NULL,
+    natural_key character varying COLLATE pg_catalog."default" NOT NULL,
+    create_date timestamp without time zone,
+    CONSTRAINT fipe_idempotency_ledger_pkey PRIMARY KEY (reference_table_code, stage, natural_key)
+);
+
+-- DROP TABLE IF EXISTS public.fipe_crawl_unit;
+-- DROP TABLE IF EXISTS public.fipe_crawl_run;
+
+-- Progresso das execuções do crawl: uma linha por tabela de referência e uma
+-- por unidade de trabalho (marca, modelo e par ano/combustível)
+
+CREATE TABLE IF NOT EXISTS public.fipe_crawl_run
+(
+    reference_table_code integer NOT NULL,
+    reference_month_name character varying COLLATE pg_catalog."default",
+    status character varying COLLATE pg_catalog."default" NOT NULL DEFAULT 'running',
+    started_at timestamp without time zone,
+    resumed_at timestamp without time zone,
+    finished_at timestamp without time zone,
+    resume_count integer NOT NULL DEFAULT 0,
+    CONSTRAINT fipe_crawl_run_pkey PRIMARY KEY (reference_table_code)
+);
+
+CREATE TABLE IF NOT EXISTS public.fipe_crawl_unit
+(
+    reference_table_code integer NOT NULL,
+    unit_type character varying COLLATE pg_catalog."default" NOT NULL,
+    unit_key character varying COLLATE pg_catalog."default" NOT NULL,
+    parent_key character varying COLLATE pg_catalog."default",
+    status character varying COLLATE pg_catalog."default" NOT NULL,
+    payload jsonb NOT NULL,
+    attempts integer NOT NULL DEFAULT 0,
+    create_date timestamp without time zone,
+    write_date timestamp without time zone,
+    CONSTRAINT fipe_crawl_unit_pkey PRIMARY KEY (reference_table_code, unit_type, unit_key)
+);
+
+-- Unidades incompletas de uma execução (consulta da retomada)
+CREATE INDEX IF NOT EXISTS fipe_crawl_unit_incomplete_idx
+    ON public.fipe_crawl_unit (reference_table_code, unit_type)
+    WHERE status <> 'done';
+
+-- DROP TABLE IF EXISTS public.schema_migrations;
+
+-- Migrações versionadas aplicadas (sql/migrations); o script de criação já
+-- contém o esquema resultante das migrações listadas abaixo
+
+CREATE TABLE IF NOT EXISTS public.schema_migrations
+(
+    version character varying COLLATE pg_catalog."default" NOT NULL,
+    description character varying COLLATE pg_catalog."default",
+    applied_at timestamp without time zone DEFAULT NOW(),
+    CONSTRAINT schema_migrations_pkey PRIMARY KEY (version)
+);
+
+INSERT INTO public.schema_migrations (version, description)
+VALUES ('001', 'fipe_vehicle_model_value natural key and lookup indexes'),
+       ('002', 'fipe_vehicle_model_value range partitioned by reference_month_code'),
+       ('003', 'fipe_vehicle_model_value compact types and fipe_reference_table'),
+       ('004', 'fipe_idempotency_ledger'),
+       ('005', 'fipe_crawl_run and fipe_crawl_unit'),
+       ('006', 'fipe_catalog_cache')
+ON CONFLICT (version) DO NOTHING;
@@ -24,6 +24,7 @@ class FipeApiStack(NestedStack):
                 db_cluster_port: str,
                 db_secret_arn: str,
                 stage: str = "dev",
+                loader_subnets: ec2.SubnetSelection = None,
                 **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
@@ -72,6 +73,24 @@ class FipeApiStack(NestedStack):
             resources=[db_secret_arn]
         ))
         
+        # Permissão para a FipeManufacturerLoader invocar a si mesma com a continuação
+        # do trabalho quando o tempo da invocação se esgota
+        lambda_role.add_to_policy(iam.PolicyStatement(
+            actions=["lambda:InvokeFunction"],
+            resources=[f"arn:aws:lambda:{self.region}:{self.account}:function:FipeManufacturerLoader-{stage}"]
+        ))
+        
+        # Com sub-redes para as Lambdas de API (com saída para a internet, ex.: NAT),
+        # elas também acessam o banco: registro de idempotência e progresso do crawl
+        if loader_subnets is not None:
+            lambda_role.add_managed_policy(
+                iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaVPCAccessExecutionRole")
+            )
+            lambda_role.add_to_policy(iam.PolicyStatement(
+                actions=["secretsmanager:GetSecretValue"],
+                resources=[db_secret_arn]
+            ))
+        
         Tags.of(lambda_role).add("Stage", stage)
         Tags.of(db_lambda_role).add("Stage", stage)
         print(f"Roles para as Lambdas criadas")
@@ -86,6 +105,8 @@ class FipeApiStack(NestedStack):
             secret_name
         )
         db_secret.grant_read(db_lambda_role)
+        if loader_subnets is not None:
+            db_secret.grant_read(lambda_role)
         print(f"Permissão para acessar o segredo do banco de dados concedida à role")
         
         # Configuração de DLQ (Dead Letter Queue) para lidar com mensagens não processadas
@@ -170,36 +191,66 @@ class FipeApiStack(NestedStack):
             "URL_FIPE": "http://veiculos.fipe.org.br/api/veiculos",
         }
         
+        # Variáveis de conexão com o banco de dados
+        db_env = {
+            "RDS_HOST": db_cluster_endpoint,
+            "RDS_PORT": db_cluster_port,
+            "RDS_DATABASE": "fipedata",
+            "RDS_USER": "postgres",
+            "DB_SECRET_ARN": db_secret_arn,
+        }
+        
+        # Lambdas de API: com acesso ao banco, o registro de idempotência e o
+        # progresso do crawl usam o PostgreSQL; sem ele, ficam desabilitados
+        # explicitamente
+        if loader_subnets is not None:
+            loader_db_env = db_env
+            loader_vpc_config = {
+                "vpc": vpc,
+                "vpc_subnets": loader_subnets,
+                "security_groups": [lambda_security_group],
+            }
+        else:
+            loader_db_env = {
+                "FIPE_IDEMPOTENCY_LEDGER": "off",
+                "FIPE_CRAWL_PROGRESS": "false",
+            }
+            loader_vpc_config = {}
+            print("Sub-redes das Lambdas de API não informadas: registro de idempotência e progresso do crawl desabilitados")
+        
         # Variáveis de ambiente específicas para cada Lambda
         manufacturer_loader_env = {
             **common_env,
+            **loader_db_env,
             "SQS_OUTPUT_URL": manufacturer_queue.queue_url,
             "TEST": "false",
         }
         
         model_loader_env = {
             **common_env,
+            **loader_db_env,
             "SQS_INPUT_URL": manufacturer_queue.queue_url,
             "SQS_OUTPUT_URL": model_queue.queue_url,
         }
         
         price_loader_env = {
             **common_env,
+            **loader_db_env,
             "SQS_INPUT_URL": model_queue.queue_url,
             "SQS_OUTPUT_URL": price_queue.queue_url,
+            "FIPE_ASYNC_ENABLED": "true",
+            "FIPE_PRICE_CONCURRENCY": "8",
+            "FIPE_PACK_MESSAGES": "true",
         }
         
         ingestor_env = {
             **common_env,
+            **db_env,
             "SQS_INPUT_URL": price_queue.queue_url,
-            "RDS_HOST": db_cluster_endpoint,
-            "RDS_PORT": db_cluster_port,
-            "RDS_DATABASE": "fipedata",
-            "RDS_USER": "postgres",
-            "DB_SECRET_ARN": db_secret_arn,
         }
         
-        # Criar as funções Lambda de API SEM VPC para acesso à internet
+        # Criar as funções Lambda de API SEM VPC para acesso à internet, a menos
+        # que sejam informadas sub-redes com saída para a internet (loader_subnets)
         print("Criando função FipeManufacturerLoader...")
         manufacturer_lambda = lambda_.Function(
             self, f"FipeManufacturerLoader-{stage}",
@@ -211,6 +262,7 @@ class FipeApiStack(NestedStack):
             memory_size=256,
             environment=manufacturer_loader_env,
             role=lambda_role,
+            **loader_vpc_config,
             layers=[lambda_layer],
             description="Função para carregar fabricantes da API FIPE"
         )
@@ -254,6 +306,7 @@ class FipeApiStack(NestedStack):
             memory_size=256,
             environment=model_loader_env,
             role=lambda_role,
+            **loader_vpc_config,
             layers=[lambda_layer],
             description="Função para carregar modelos da API FIPE"
         )
@@ -283,6 +336,7 @@ class FipeApiStack(NestedStack):
             memory_size=256,
             environment=price_loader_env,
             role=lambda_role,
+            **loader_vpc_config,
             layers=[lambda_layer],
             description="Função para carregar preços da API FIPE"
         )
@@ -335,6 +389,36 @@ class FipeApiStack(NestedStack):
         )
         print(f"Fonte de evento SQS adicionada à Lambda {ingestor_lambda.function_name}")
         
+        # Retomada do crawl: reenfileira as unidades não concluídas de uma execução.
+        # Requer o progresso do crawl, ou seja, Lambdas de API com acesso ao banco
+        resume_lambda = None
+        if loader_subnets is not None:
+            print("Criando função FipeCrawlResume...")
+            resume_lambda = lambda_.Function(
+                self, f"FipeCrawlResume-{stage}",
+                function_name=f"FipeCrawlResume-{stage}",
+                runtime=lambda_.Runtime.PYTHON_3_10,
+                code=lambda_.Code.from_asset("code_lambdas/src/fipe_api", exclude=["__pycache__", "*.pyc"]),
+                handler="fipe_crawl_resume.lambda_handler",
+                timeout=Duration.minutes(5),
+                memory_size=256,
+                environment={
+                    **common_env,
+                    **db_env,
+                    "SQS_MANUFACTURER_URL": manufacturer_queue.queue_url,
+                    "SQS_MODEL_URL": model_queue.queue_url,
+                },
+                role=lambda_role,
+                **loader_vpc_config,
+                layers=[lambda_layer],
+                description="Função para retomar uma execução incompleta do crawl FIPE"
+            )
+            manufacturer_queue.grant_send_messages(resume_lambda)
+            model_queue.grant_send_messages(resume_lambda)
+            Tags.of(resume_lambda).add("Stage", stage)
+            Tags.of(resume_lambda).add("Function", "FipeCrawlResume")
+            print(f"Lambda FipeCrawlResume criada: {resume_lambda.function_name}")
+        
         # Outputs
         CfnOutput(
             self, f"ManufacturerQueueUrl-{stage}",
@@ -378,6 +462,13 @@ class FipeApiStack(NestedStack):
             description=f"Nome da função Lambda para carregamento de fabricantes - {stage}"
         )
         
+        if resume_lambda is not None:
+            CfnOutput(
+                self, f"FipeCrawlResumeLambda-{stage}",
+                value=resume_lambda.function_name,
+                description=f"Nome da função Lambda de retomada do crawl - {stage}"
+            )
+        
         CfnOutput(
             self, f"MonthlyEventRuleArn-{stage}",
             value=monthly_rule.rule_arn,
@@ -230,6 +230,13 @@ class FipeDataStack(Stack):
             description="Estágio da implantação (dev, stg, prd)"
         )
         
+        # Tipo das sub-redes (com saída para a internet, ex.: PRIVATE_WITH_EGRESS)
+        # em que as Lambdas de API acessam o banco; sem ele, ficam fora da VPC
+        loader_subnet_type = self.node.try_get_context("loader_subnet_type")
+        loader_subnets = None
+        if loader_subnet_type:
+            loader_subnets = ec2.SubnetSelection(subnet_type=ec2.SubnetType[loader_subnet_type.upper()])
+        
         # Criar o stack filho FipeApiStack
         print(f"Criando stack filho FipeApiStack para o estágio: {stage}")
         fipe_api_stack = FipeApiStack(
@@ -239,7 +246,8 @@ class FipeDataStack(Stack):
             db_cluster_endpoint=db_cluster.cluster_endpoint.hostname,
             db_cluster_port=str(db_cluster.cluster_endpoint.port),
             db_secret_arn=db_credentials.secret_arn,
-            stage=stage
+            stage=stage,
+            loader_subnets=loader_subnets
         )
         
         # Permitir que o grupo de segurança das Lambdas do FipeApiStack acesse o banco de dados
@@ -0,0 +1,48 @@
+-- Migração 001: chave natural única e índices de consulta em fipe_vehicle_model_value
+--
+-- Remove os valores duplicados (mantendo o registro mais recente de cada chave),
+-- cria o índice único da chave natural (modelo, código FIPE, ano, tabela de
+-- referência e combustível), usado pelo INSERT ... ON CONFLICT do ingestor, e o
+-- índice de leitura por código FIPE + tabela de referência.
+--
+-- A migração é idempotente e fica registrada em public.schema_migrations.
+-- A tabela fica bloqueada para escrita durante a execução: pause o
+-- FipeSomaIngestor (ou desabilite o trigger da fila de preços) antes de aplicá-la.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.schema_migrations
+(
+    version character varying COLLATE pg_catalog."default" NOT NULL,
+    description character varying COLLATE pg_catalog."default",
+    applied_at timestamp without time zone DEFAULT NOW(),
+    CONSTRAINT schema_migrations_pkey PRIMARY KEY (version)
+);
+
+-- Impede escritas concorrentes entre a remoção das duplicidades e a criação do índice
+LOCK TABLE public.fipe_vehicle_model_value IN SHARE ROW EXCLUSIVE MODE;
+
+DELETE FROM public.fipe_vehicle_model_value v
+USING (
+    SELECT id, ROW_NUMBER() OVER (
+        PARTITION BY model_id, fipe_code, manufacture_year, reference_month_code, fuel_type
+        ORDER BY COALESCE(write_date, create_date) DESC NULLS LAST, id DESC
+    ) AS position
+    FROM public.fipe_vehicle_model_value
+) duplicated
+WHERE v.id = duplicated.id AND duplicated.position > 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS fipe_vehicle_model_value_natural_key_unique
+    ON public.fipe_vehicle_model_value (model_id, fipe_code, manufacture_year, reference_month_code, fuel_type)
+    NULLS NOT DISTINCT;
+
+CREATE INDEX IF NOT EXISTS fipe_vehicle_model_value_fipe_code_reference_idx
+    ON public.fipe_vehicle_model_value (fipe_code, reference_month_code);
+
+INSERT INTO public.schema_migrations (version, description)
+VALUES ('001', 'fipe_vehicle_model_value natural key and lookup indexes')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
+
+ANALYZE public.fipe_vehicle_model_value;
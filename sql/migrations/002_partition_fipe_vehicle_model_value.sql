@@ -0,0 +1,129 @@
+-- Migração 002: particionamento de fipe_vehicle_model_value por tabela de referência
+--
+-- Recria a tabela de valores como tabela particionada por faixa (RANGE) de
+-- reference_month_code, com uma partição por tabela de referência mensal, e
+-- migra os dados da tabela atual. reference_month_code passa a ser integer para
+-- que os limites das faixas sejam numéricos.
+--
+-- A tabela anterior é mantida como fipe_vehicle_model_value_legacy (inclusive as
+-- linhas sem código de referência numérico, que não são migradas) e pode ser
+-- removida após a conferência dos dados:
+--     DROP TABLE public.fipe_vehicle_model_value_legacy;
+--
+-- Requer a migração 001. A tabela fica bloqueada durante a execução: pause o
+-- FipeSomaIngestor (ou desabilite o trigger da fila de preços) antes de aplicá-la.
+
+BEGIN;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM public.schema_migrations WHERE version = '002') THEN
+        RAISE NOTICE 'Migração 002 já aplicada';
+        RETURN;
+    END IF;
+
+    LOCK TABLE public.fipe_vehicle_model_value IN ACCESS EXCLUSIVE MODE;
+
+    ALTER TABLE public.fipe_vehicle_model_value RENAME TO fipe_vehicle_model_value_legacy;
+    ALTER TABLE public.fipe_vehicle_model_value_legacy
+        RENAME CONSTRAINT fipe_vehicle_model_value_pkey TO fipe_vehicle_model_value_legacy_pkey;
+    ALTER INDEX public.fipe_vehicle_model_value_natural_key_unique
+        RENAME TO fipe_vehicle_model_value_legacy_natural_key_unique;
+    ALTER INDEX public.fipe_vehicle_model_value_fipe_code_reference_idx
+        RENAME TO fipe_vehicle_model_value_legacy_fipe_code_reference_idx;
+
+    CREATE TABLE public.fipe_vehicle_model_value
+    (
+        id integer NOT NULL DEFAULT nextval('fipe_vehicle_model_value_id_seq'::regclass),
+        name character varying COLLATE pg_catalog."default" NOT NULL,
+        model_id integer,
+        code character varying COLLATE pg_catalog."default",
+        fipe_code character varying COLLATE pg_catalog."default" NOT NULL,
+        manufacturer_id integer,
+        manufacture_year character varying COLLATE pg_catalog."default",
+        reference_month character varying COLLATE pg_catalog."default",
+        reference_month_code integer NOT NULL,
+        fipe_value double precision,
+        fuel_type character varying COLLATE pg_catalog."default",
+        vehicle_type integer,
+        active boolean,
+        message_main_attachment_id integer,
+        create_uid integer,
+        create_date timestamp without time zone,
+        write_uid integer,
+        write_date timestamp without time zone,
+        CONSTRAINT fipe_vehicle_model_value_pkey PRIMARY KEY (id, reference_month_code),
+        CONSTRAINT fipe_vehicle_model_value_model_id_fkey FOREIGN KEY (model_id)
+            REFERENCES public.fipe_vehicle_model (id) MATCH SIMPLE
+            ON UPDATE NO ACTION
+            ON DELETE SET NULL,
+        CONSTRAINT fipe_vehicle_model_manufacturer_id_fkey FOREIGN KEY (manufacturer_id)
+            REFERENCES public.fipe_vehicle_manufacturer (id) MATCH SIMPLE
+            ON UPDATE NO ACTION
+            ON DELETE SET NULL
+    ) PARTITION BY RANGE (reference_month_code);
+
+    -- Índices criados na tabela particionada são replicados em cada partição
+    CREATE UNIQUE INDEX fipe_vehicle_model_value_natural_key_unique
+        ON public.fipe_vehicle_model_value (model_id, fipe_code, manufacture_year, reference_month_code, fuel_type)
+        NULLS NOT DISTINCT;
+
+    CREATE INDEX fipe_vehicle_model_value_fipe_code_reference_idx
+        ON public.fipe_vehicle_model_value (fipe_code, reference_month_code);
+END
+$$;
+
+-- Cria (se necessário) a partição de uma tabela de referência; chamada pelo
+-- FipeSomaIngestor antes de gravar valores de um mês ainda sem partição
+CREATE OR REPLACE FUNCTION public.fipe_ensure_value_partition(p_reference_month_code integer)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    partition_name text := format('fipe_vehicle_model_value_%s', p_reference_month_code);
+BEGIN
+    IF to_regclass(format('public.%I', partition_name)) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    -- Serializa a criação da mesma partição por instâncias concorrentes do ingestor
+    PERFORM pg_advisory_xact_lock(hashtext('fipe_vehicle_model_value'), p_reference_month_code);
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS public.%I PARTITION OF public.fipe_vehicle_model_value FOR VALUES FROM (%s) TO (%s)',
+        partition_name, p_reference_month_code, p_reference_month_code + 1
+    );
+END;
+$$;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM public.schema_migrations WHERE version = '002') THEN
+        RETURN;
+    END IF;
+
+    PERFORM public.fipe_ensure_value_partition(code)
+    FROM (
+        SELECT DISTINCT reference_month_code::integer AS code
+        FROM public.fipe_vehicle_model_value_legacy
+        WHERE reference_month_code ~ '^[0-9]+$'
+    ) reference_tables;
+
+    INSERT INTO public.fipe_vehicle_model_value (
+        id, name, model_id, code, fipe_code, manufacturer_id, manufacture_year,
+        reference_month, reference_month_code, fipe_value, fuel_type, vehicle_type,
+        active, message_main_attachment_id, create_uid, create_date, write_uid, write_date
+    )
+    SELECT
+        id, name, model_id, code, fipe_code, manufacturer_id, manufacture_year,
+        reference_month, reference_month_code::integer, fipe_value, fuel_type, vehicle_type,
+        active, message_main_attachment_id, create_uid, create_date, write_uid, write_date
+    FROM public.fipe_vehicle_model_value_legacy
+    WHERE reference_month_code ~ '^[0-9]+$';
+
+    INSERT INTO public.schema_migrations (version, description)
+    VALUES ('002', 'fipe_vehicle_model_value range partitioned by reference_month_code');
+END
+$$;
+
+COMMIT;
+
+ANALYZE public.fipe_vehicle_model_value;
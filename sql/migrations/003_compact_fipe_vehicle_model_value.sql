@@ -0,0 +1,80 @@
+-- Migração 003: tipos compactos em fipe_vehicle_model_value
+--
+-- - manufacture_year: character varying -> smallint
+-- - fipe_value (double precision, em reais) -> fipe_value_cents (integer, em
+--   centavos; exato e com 4 bytes, até R$ 21.474.836,47)
+-- - reference_month (nome do mês repetido em cada linha) é removida e passa a
+--   ficar na dimensão public.fipe_reference_table, referenciada por
+--   reference_month_code
+--
+-- A view public.fipe_vehicle_model_value_detail expõe as colunas no formato
+-- anterior (reference_month e fipe_value em reais) para consultas existentes.
+--
+-- Requer a migração 002. A tabela é reescrita e fica bloqueada durante a
+-- execução: pause o FipeSomaIngestor antes de aplicá-la.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.fipe_reference_table
+(
+    code integer NOT NULL,
+    month_name character varying COLLATE pg_catalog."default" NOT NULL,
+    create_date timestamp without time zone,
+    CONSTRAINT fipe_reference_table_pkey PRIMARY KEY (code)
+);
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM public.schema_migrations WHERE version = '003') THEN
+        RAISE NOTICE 'Migração 003 já aplicada';
+        RETURN;
+    END IF;
+
+    LOCK TABLE public.fipe_vehicle_model_value IN ACCESS EXCLUSIVE MODE;
+
+    INSERT INTO public.fipe_reference_table (code, month_name, create_date)
+    SELECT DISTINCT ON (reference_month_code)
+        reference_month_code, trim(reference_month), NOW()
+    FROM public.fipe_vehicle_model_value
+    WHERE reference_month IS NOT NULL
+    ORDER BY reference_month_code, COALESCE(write_date, create_date) DESC NULLS LAST
+    ON CONFLICT (code) DO NOTHING;
+
+    INSERT INTO public.fipe_reference_table (code, month_name, create_date)
+    SELECT DISTINCT reference_month_code, 'Desconhecido', NOW()
+    FROM public.fipe_vehicle_model_value
+    ON CONFLICT (code) DO NOTHING;
+
+    -- Um único ALTER TABLE reescreve cada partição uma vez, já sem a coluna removida
+    ALTER TABLE public.fipe_vehicle_model_value
+        DROP COLUMN reference_month,
+        ALTER COLUMN manufacture_year TYPE smallint
+            USING CASE WHEN manufacture_year ~ '^[0-9]{1,5}$' THEN manufacture_year::integer END,
+        ALTER COLUMN fipe_value TYPE integer
+            USING round(fipe_value * 100);
+
+    ALTER TABLE public.fipe_vehicle_model_value RENAME COLUMN fipe_value TO fipe_value_cents;
+
+    ALTER TABLE public.fipe_vehicle_model_value
+        ADD CONSTRAINT fipe_vehicle_model_value_reference_month_code_fkey FOREIGN KEY (reference_month_code)
+            REFERENCES public.fipe_reference_table (code) MATCH SIMPLE
+            ON UPDATE NO ACTION
+            ON DELETE RESTRICT;
+
+    INSERT INTO public.schema_migrations (version, description)
+    VALUES ('003', 'fipe_vehicle_model_value compact types and fipe_reference_table');
+END
+$$;
+
+CREATE OR REPLACE VIEW public.fipe_vehicle_model_value_detail AS
+SELECT
+    v.id, v.name, v.model_id, v.code, v.fipe_code, v.manufacturer_id,
+    v.manufacture_year, r.month_name AS reference_month, v.reference_month_code,
+    v.fipe_value_cents / 100.0 AS fipe_value, v.fuel_type, v.vehicle_type,
+    v.active, v.create_date, v.write_date
+FROM public.fipe_vehicle_model_value v
+JOIN public.fipe_reference_table r ON r.code = v.reference_month_code;
+
+COMMIT;
+
+ANALYZE public.fipe_vehicle_model_value;
@@ -0,0 +1,26 @@
+-- Migração 004: registro de idempotência do pipeline
+--
+-- Cria public.fipe_idempotency_ledger, com uma linha por unidade de trabalho
+-- concluída (tabela de referência, etapa e chave natural). O FipeModelLoader
+-- (etapa "models", chave tipo de veículo:marca) e o FipePriceLoader (etapa
+-- "prices", chave tipo de veículo:marca:modelo) consultam a tabela antes de
+-- processar uma mensagem e ignoram entregas duplicadas do SQS.
+--
+-- A migração é idempotente e não bloqueia as tabelas existentes.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.fipe_idempotency_ledger
+(
+    reference_table_code integer NOT NULL,
+    stage character varying COLLATE pg_catalog."default" NOT NULL,
+    natural_key character varying COLLATE pg_catalog."default" NOT NULL,
+    create_date timestamp without time zone,
+    CONSTRAINT fipe_idempotency_ledger_pkey PRIMARY KEY (reference_table_code, stage, natural_key)
+);
+
+INSERT INTO public.schema_migrations (version, description)
+VALUES ('004', 'fipe_idempotency_ledger')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,48 @@
+-- Migração 005: progresso das execuções do crawl
+--
+-- Cria public.fipe_crawl_run (uma linha por tabela de referência) e
+-- public.fipe_crawl_unit (uma linha por marca, modelo e par ano/combustível,
+-- com status pending, done ou failed e a mensagem SQS que a reenfileira).
+-- O script code_lambdas/src/fipe_api/fipe_crawl_resume.py usa essas tabelas
+-- para reenviar somente as unidades não concluídas de uma execução.
+--
+-- A migração é idempotente e não bloqueia as tabelas existentes.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.fipe_crawl_run
+(
+    reference_table_code integer NOT NULL,
+    reference_month_name character varying COLLATE pg_catalog."default",
+    status character varying COLLATE pg_catalog."default" NOT NULL DEFAULT 'running',
+    started_at timestamp without time zone,
+    resumed_at timestamp without time zone,
+    finished_at timestamp without time zone,
+    resume_count integer NOT NULL DEFAULT 0,
+    CONSTRAINT fipe_crawl_run_pkey PRIMARY KEY (reference_table_code)
+);
+
+CREATE TABLE IF NOT EXISTS public.fipe_crawl_unit
+(
+    reference_table_code integer NOT NULL,
+    unit_type character varying COLLATE pg_catalog."default" NOT NULL,
+    unit_key character varying COLLATE pg_catalog."default" NOT NULL,
+    parent_key character varying COLLATE pg_catalog."default",
+    status character varying COLLATE pg_catalog."default" NOT NULL,
+    payload jsonb NOT NULL,
+    attempts integer NOT NULL DEFAULT 0,
+    create_date timestamp without time zone,
+    write_date timestamp without time zone,
+    CONSTRAINT fipe_crawl_unit_pkey PRIMARY KEY (reference_table_code, unit_type, unit_key)
+);
+
+-- Unidades incompletas de uma execução (consulta da retomada)
+CREATE INDEX IF NOT EXISTS fipe_crawl_unit_incomplete_idx
+    ON public.fipe_crawl_unit (reference_table_code, unit_type)
+    WHERE status <> 'done';
+
+INSERT INTO public.schema_migrations (version, description)
+VALUES ('005', 'fipe_crawl_run and fipe_crawl_unit')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,30 @@
+-- Migração 006: cache persistente das listagens de catálogo
+--
+-- Cria public.fipe_catalog_cache, usada pelo cache de catálogo
+-- (code_lambdas/src/fipe_api/catalog_cache.py, FIPE_CATALOG_CACHE=postgres)
+-- para guardar as listagens de marcas, modelos e anos da API FIPE por tabela
+-- de referência. Sem a tabela, toda leitura e escrita do cache falha e ele
+-- apenas deixa de ser usado.
+--
+-- A migração é idempotente e não bloqueia as tabelas existentes.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.fipe_catalog_cache
+(
+    kind character varying COLLATE pg_catalog."default" NOT NULL,
+    vehicle_type integer NOT NULL,
+    brand_code character varying COLLATE pg_catalog."default" NOT NULL DEFAULT '',
+    model_code character varying COLLATE pg_catalog."default" NOT NULL DEFAULT '',
+    reference_table_code integer NOT NULL,
+    payload jsonb NOT NULL,
+    create_date timestamp without time zone,
+    write_date timestamp without time zone,
+    CONSTRAINT fipe_catalog_cache_pkey PRIMARY KEY (kind, vehicle_type, brand_code, model_code, reference_table_code)
+);
+
+INSERT INTO public.schema_migrations (version, description)
+VALUES ('006', 'fipe_catalog_cache')
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
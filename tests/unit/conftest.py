@@ -0,0 +1,16 @@
+import os
+import sys
+
+# As Lambdas importam seus módulos de forma plana (como no pacote implantado)
+LAMBDA_SRC = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "code_lambdas", "src", "fipe_api",
+)
+sys.path.insert(0, LAMBDA_SRC)
+
+# Variáveis lidas no import: região do boto3 e recursos externos desabilitados
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("FIPE_METRICS", "local")
+os.environ.setdefault("FIPE_IDEMPOTENCY_LEDGER", "memory")
+os.environ.setdefault("FIPE_CRAWL_PROGRESS", "false")
+os.environ.pop("RDS_HOST", None)
@@ -0,0 +1,120 @@
+import pytest
+
+from crawl_progress import (
+    STATUS_DONE,
+    STATUS_FAILED,
+    CrawlProgress,
+    ProgressRecorder,
+    brand_unit,
+    model_unit,
+)
+
+
+class FakeCrawlProgress(CrawlProgress):
+    """Progresso em memória: guarda o status gravado de cada unidade."""
+
+    def __init__(self):
+        super().__init__(connection_factory=lambda: None)
+        self.status = {}
+
+    def add_pending(self, units):
+        for unit in units:
+            self.status.setdefault(unit[2], "pending")
+
+    def mark(self, units, status):
+        for unit in units:
+            self.status[unit[2]] = status
+
+
+@pytest.fixture
+def progress():
+    return FakeCrawlProgress()
+
+
+def brand_message(brand_code, reference_table_code=315):
+    return {
+        "codigoTabelaReferencia": reference_table_code,
+        "codigoTipoVeiculo": 1,
+        "codigoMarca": brand_code,
+    }
+
+
+def model_message(model_code, brand_code=21, reference_table_code=315):
+    return {
+        "codigoTabelaReferencia": reference_table_code,
+        "vehicle_type": 1,
+        "manufacturer_code": brand_code,
+        "model_code": model_code,
+    }
+
+
+def test_completed_message_is_done_and_children_pending(progress):
+    recorder = ProgressRecorder(progress)
+    recorder.track("m1", brand_unit, brand_message(21))
+    recorder.child_pending("m1", model_unit, model_message(100))
+    recorder.child_pending("m1", model_unit, model_message(101))
+
+    recorder.flush(completed=["m1"], batch_item_failures=[])
+
+    assert progress.status == {
+        "1:21": STATUS_DONE,
+        "1:21:100": "pending",
+        "1:21:101": "pending",
+    }
+
+
+def test_unfinished_message_stays_pending(progress):
+    recorder = ProgressRecorder(progress)
+    recorder.track("m1", brand_unit, brand_message(21))
+
+    recorder.flush(completed=[], batch_item_failures=[])
+
+    assert progress.status == {"1:21": "pending"}
+
+
+def test_failed_message_is_failed_and_its_done_children_stay_pending(progress):
+    recorder = ProgressRecorder(progress)
+    recorder.track("m1", brand_unit, brand_message(21))
+    recorder.child_done("m1", model_unit, model_message(100))
+    recorder.track("m2", brand_unit, brand_message(22))
+    recorder.child_done("m2", model_unit, model_message(200, brand_code=22))
+
+    # m1 também consta como concluída, mas a falha reportada ao SQS prevalece
+    recorder.flush(completed=["m1", "m2"], batch_item_failures=[{"itemIdentifier": "m1"}])
+
+    assert progress.status == {
+        "1:21": STATUS_FAILED,
+        "1:21:100": "pending",
+        "1:22": STATUS_DONE,
+        "1:22:200": STATUS_DONE,
+    }
+
+
+def test_flush_clears_the_invocation_entries(progress):
+    recorder = ProgressRecorder(progress)
+    recorder.track("m1", brand_unit, brand_message(21))
+    recorder.flush(completed=["m1"], batch_item_failures=[])
+    progress.status.clear()
+
+    recorder.flush(completed=["m1"], batch_item_failures=[])
+
+    assert progress.status == {}
+
+
+def test_invalid_message_has_no_unit(progress):
+    recorder = ProgressRecorder(progress)
+    recorder.track("m1", brand_unit, {"codigoMarca": 21})
+
+    recorder.flush(completed=["m1"], batch_item_failures=[])
+
+    assert progress.status == {}
+
+
+def test_recorder_without_progress_ignores_calls():
+    recorder = ProgressRecorder(None)
+    recorder.track("m1", brand_unit, brand_message(21))
+    recorder.child_pending("m1", model_unit, model_message(100))
+
+    recorder.flush(completed=["m1"], batch_item_failures=[])
+
+    assert recorder._entries == {}
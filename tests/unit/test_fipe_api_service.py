@@ -0,0 +1,87 @@
+import pytest
+
+import fipe_api_service
+from fipe_api_service import FipeAPI
+
+# Resposta de ConsultarTabelaDeReferencia: a mais recente primeiro
+REFERENCE_TABLES = [
+    {"Codigo": 315, "Mes": "outubro/2026 "},
+    {"Codigo": 314, "Mes": "setembro/2026 "},
+]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(fipe_api_service.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def posts(monkeypatch, clock):
+    # Cache do módulo vazio e _post simulado, registrando os endpoints chamados
+    monkeypatch.setenv("URL_FIPE", "http://fipe.test/api/veiculos")
+    monkeypatch.setattr(fipe_api_service, "_reference_table_cache", {})
+    monkeypatch.setattr(fipe_api_service, "_reference_table_expires_at", 0.0)
+    posts = []
+
+    def post(self, endpoint, payload=None):
+        posts.append(endpoint)
+        return REFERENCE_TABLES
+
+    monkeypatch.setattr(FipeAPI, "_post", post)
+    return posts
+
+
+def api(period=None, **kwargs):
+    return FipeAPI(period=period, session=object(), **kwargs)
+
+
+def test_reference_table_is_resolved_lazily_and_cached(posts):
+    client = api()
+    assert posts == []
+
+    assert client.reference_table_code == 315
+    assert client.reference_month_name == "outubro/2026"
+    assert posts == ["ConsultarTabelaDeReferencia"]
+
+    # Outros clientes, de qualquer período indexado, usam o cache do módulo
+    assert api().reference_table_code == 315
+    assert api(period=(9, 2026)).reference_table_code == 314
+    assert posts == ["ConsultarTabelaDeReferencia"]
+
+
+def test_reference_table_cache_expires_after_ttl(posts, clock):
+    assert api().reference_table_code == 315
+
+    clock.now += fipe_api_service.REFERENCE_TABLE_TTL - 1
+    assert api().reference_table_code == 315
+    assert len(posts) == 1
+
+    clock.now += 1
+    assert api().reference_table_code == 315
+    assert len(posts) == 2
+
+
+def test_unknown_period_raises(posts):
+    with pytest.raises(ValueError):
+        api(period=(1, 1990)).reference_table
+
+
+def test_from_message_skips_reference_table_call(posts):
+    client = FipeAPI.from_message(
+        {"codigoTabelaReferencia": 300, "mesReferenciaAno": "junho/2025 "},
+        session=object(),
+    )
+
+    assert client.reference_table_code == 300
+    assert client.reference_month_name == "junho/2025"
+    assert posts == []
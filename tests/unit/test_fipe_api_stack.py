@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+core = pytest.importorskip("aws_cdk")
+assertions = pytest.importorskip("aws_cdk.assertions")
+ec2 = pytest.importorskip("aws_cdk.aws_ec2")
+
+from fipe_api_stack import FipeApiStack
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_ENV = ("RDS_HOST", "RDS_PORT", "RDS_DATABASE", "RDS_USER", "DB_SECRET_ARN")
+LOADERS = ("FipeManufacturerLoader-dev", "FipeModelLoader-dev", "FipePriceLoader-dev")
+
+
+def synth(loader_subnet_type=None):
+    # Os assets (código e camada) são relativos à raiz do repositório
+    if not os.path.exists(os.path.join(REPO_ROOT, "fipe_api_layer.zip")):
+        pytest.skip("fipe_api_layer.zip não gerado (create-fipe-api-layer.sh)")
+    cwd = os.getcwd()
+    os.chdir(REPO_ROOT)
+    try:
+        app = core.App()
+        parent = core.Stack(app, "FipeDataStack")
+        vpc = ec2.Vpc(parent, "Vpc", max_azs=2)
+        stack = FipeApiStack(
+            parent,
+            "FipeApiStack-dev",
+            vpc=vpc,
+            db_cluster_endpoint="db.example.com",
+            db_cluster_port="5432",
+            db_secret_arn="arn:aws:secretsmanager:us-east-1:123456789012:secret:fipe-db-AbCdEf",
+            stage="dev",
+            loader_subnets=(
+                ec2.SubnetSelection(subnet_type=loader_subnet_type) if loader_subnet_type else None
+            ),
+        )
+        return assertions.Template.from_stack(stack)
+    finally:
+        os.chdir(cwd)
+
+
+def function_env(template, function_name):
+    functions = template.find_resources(
+        "AWS::Lambda::Function", {"Properties": {"FunctionName": function_name}}
+    )
+    assert len(functions) == 1
+    function = next(iter(functions.values()))
+    return function["Properties"], function["Properties"]["Environment"]["Variables"]
+
+
+def test_loaders_with_subnets_get_database_access():
+    template = synth(ec2.SubnetType.PRIVATE_WITH_EGRESS)
+
+    for function_name in LOADERS:
+        properties, env = function_env(template, function_name)
+        for name in DB_ENV:
+            assert name in env, f"{function_name} sem {name}"
+        assert "VpcConfig" in properties
+        assert "FIPE_IDEMPOTENCY_LEDGER" not in env
+        assert "FIPE_CRAWL_PROGRESS" not in env
+
+    template.has_resource_properties("AWS::IAM::Policy", {
+        "PolicyDocument": {
+            "Statement": assertions.Match.array_with([
+                assertions.Match.object_like({"Action": "secretsmanager:GetSecretValue"}),
+            ]),
+        },
+        "Roles": assertions.Match.array_with([
+            {"Ref": assertions.Match.string_like_regexp("FipeApiLambdaRole")},
+        ]),
+    })
+
+
+def test_loaders_without_subnets_disable_ledger_explicitly():
+    template = synth()
+
+    for function_name in LOADERS:
+        properties, env = function_env(template, function_name)
+        assert env["FIPE_IDEMPOTENCY_LEDGER"] == "off"
+        assert env["FIPE_CRAWL_PROGRESS"] == "false"
+        assert "RDS_HOST" not in env
+        assert "VpcConfig" not in properties
+
+    assert not template.find_resources(
+        "AWS::Lambda::Function", {"Properties": {"FunctionName": "FipeCrawlResume-dev"}}
+    )
+
+
+def test_resume_lambda_is_deployed_with_database_and_queues():
+    template = synth(ec2.SubnetType.PRIVATE_WITH_EGRESS)
+
+    properties, env = function_env(template, "FipeCrawlResume-dev")
+    assert properties["Handler"] == "fipe_crawl_resume.lambda_handler"
+    assert "VpcConfig" in properties
+    for name in DB_ENV + ("SQS_MANUFACTURER_URL", "SQS_MODEL_URL"):
+        assert name in env
+
+    template.has_resource_properties("AWS::IAM::Policy", {
+        "PolicyDocument": {
+            "Statement": assertions.Match.array_with([
+                assertions.Match.object_like({
+                    "Action": assertions.Match.array_with(["sqs:SendMessage"]),
+                }),
+            ]),
+        },
+    })
+
+
+def test_ingestor_keeps_database_env():
+    template = synth()
+
+    _, env = function_env(template, "FipeSomaIngestor-dev")
+    for name in DB_ENV:
+        assert name in env
@@ -0,0 +1,109 @@
+import pytest
+
+import fipe_crawl_resume
+from crawl_progress import UNIT_BRAND, UNIT_MODEL, UNIT_PRICE, CrawlProgress
+from fipe_crawl_resume import build_resume_messages, resume_run
+from time_budget import PENDING_PAIRS_FIELD
+
+
+class FakeCrawlProgress(CrawlProgress):
+    """Progresso em memória com unidades incompletas fixas."""
+
+    def __init__(self, units, latest_run_code=315):
+        super().__init__(connection_factory=lambda: None)
+        self.units = units
+        self.latest = latest_run_code
+        self.resumes = []
+
+    def latest_run_code(self):
+        return self.latest
+
+    def incomplete_units(self, reference_table_code):
+        return self.units
+
+    def summary(self, reference_table_code):
+        return {}
+
+    def record_resume(self, reference_table_code, finished):
+        self.resumes.append((reference_table_code, finished))
+
+
+def brand_payload(brand_code):
+    return {"codigoTabelaReferencia": 315, "codigoTipoVeiculo": 1, "codigoMarca": brand_code}
+
+
+def model_payload(model_code, brand_code=21):
+    return {
+        "codigoTabelaReferencia": 315,
+        "vehicle_type": 1,
+        "manufacturer_code": brand_code,
+        "model_code": model_code,
+    }
+
+
+UNITS = [
+    # Marca 21 incompleta: reenviada inteira, com seus modelos
+    (UNIT_BRAND, "1:21", None, "pending", brand_payload(21)),
+    (UNIT_MODEL, "1:21:100", "1:21", "pending", model_payload(100)),
+    # Modelos de uma marca concluída: com e sem pares pendentes
+    (UNIT_MODEL, "1:22:200", "1:22", "failed", model_payload(200, brand_code=22)),
+    (UNIT_PRICE, "1:22:200:2020:1", "1:22:200", "pending", {"yearModel": 2020, "fuelType": 1}),
+    (UNIT_MODEL, "1:22:201", "1:22", "pending", model_payload(201, brand_code=22)),
+]
+
+
+@pytest.fixture
+def progress(monkeypatch):
+    progress = FakeCrawlProgress(UNITS)
+    monkeypatch.setattr(fipe_crawl_resume, "get_crawl_progress", lambda: progress)
+    return progress
+
+
+def test_build_resume_messages():
+    brand_messages, model_messages = build_resume_messages(UNITS)
+
+    assert brand_messages == [brand_payload(21)]
+    assert model_messages == [
+        {**model_payload(200, brand_code=22), PENDING_PAIRS_FIELD: [{"yearModel": 2020, "fuelType": 1}]},
+        model_payload(201, brand_code=22),
+    ]
+
+
+def test_dry_run_sends_nothing(progress, monkeypatch):
+    def fail(*args):
+        raise AssertionError("dry run não deve enviar mensagens")
+
+    monkeypatch.setattr(fipe_crawl_resume, "send_messages", fail)
+
+    result = resume_run(dry_run=True)
+
+    assert result["codigoTabelaReferencia"] == 315
+    assert result["incomplete_units"] == len(UNITS)
+    assert result["brand_messages"] == 1
+    assert result["model_messages"] == 2
+    assert result["dry_run"] is True
+    assert progress.resumes == []
+
+
+def test_resume_sends_and_records(progress, monkeypatch):
+    sent = {}
+
+    def send_messages(queue_url, messages):
+        sent[queue_url] = messages
+        return 0
+
+    monkeypatch.setattr(fipe_crawl_resume, "send_messages", send_messages)
+
+    result = resume_run(manufacturer_queue_url="manufacturer", model_queue_url="model")
+
+    assert len(sent["manufacturer"]) == 1
+    assert len(sent["model"]) == 2
+    assert result["failed_messages"] == 0
+    assert progress.resumes == [(315, False)]
+
+
+def test_resume_without_progress_fails(monkeypatch):
+    monkeypatch.setattr(fipe_crawl_resume, "get_crawl_progress", lambda: None)
+
+    with pytest.raises(ValueError):
+        resume_run(dry_run=True)
@@ -0,0 +1,120 @@
+import json
+
+from fipe_api_service import parse_years
+from fipe_price_loader import expand_year_fuel_pairs, fetch_model_prices, pending_year_fuel_pairs
+from time_budget import PENDING_PAIRS_FIELD, build_continuation
+
+# Resposta de ConsultarAnoModelo de um modelo com anos/combustíveis distintos
+YEARS_RESPONSE = [
+    {"Label": "32000 Gasolina", "Value": "32000-1"},
+    {"Label": "2021 Gasolina", "Value": "2021-1"},
+    {"Label": "2021 Diesel", "Value": "2021-3"},
+    {"Label": "2020 Diesel", "Value": "2020-3"},
+    {"Label": "2019 Gasolina", "Value": "2019-1"},
+]
+
+MESSAGE = {
+    "codigoTabelaReferencia": 315,
+    "mesReferenciaAno": "janeiro de 2025",
+    "manufacturer": "Scania",
+    "manufacturer_code": "114",
+    "model": "R-440",
+    "model_code": "4321",
+    "vehicle_type": 3,
+}
+
+
+def pair_keys(pairs):
+    return [(year["yearModel"], fuel_type) for year, fuel_type in pairs]
+
+
+class FakeApi:
+    def __init__(self, years_response=YEARS_RESPONSE):
+        self.years_response = years_response
+        self.year_calls = 0
+        self.price_calls = []
+
+    def get_years(self, manufacturer_code, model_code, vehicle_type):
+        self.year_calls += 1
+        return parse_years(self.years_response)
+
+    def get_price(self, manufacturer_code, model_code, year_model, vehicle_type, fuel_type):
+        self.price_calls.append((year_model, fuel_type))
+        return {"Valor": "R$ 500.000,00", "CodigoFipe": "509001-1"}
+
+
+class StopAfter:
+    """Orçamento de tempo que se esgota após `calls` verificações."""
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    def exhausted(self):
+        self.calls -= 1
+        return self.calls < 0
+
+
+class Unlimited:
+    def exhausted(self):
+        return False
+
+
+def test_expansion_uses_each_year_own_fuel_type():
+    years, fuel_types = parse_years(YEARS_RESPONSE)
+
+    pairs, saved = expand_year_fuel_pairs(years, fuel_types)
+
+    assert pair_keys(pairs) == [
+        ("32000", "1"),
+        ("2021", "1"),
+        ("2021", "3"),
+        ("2020", "3"),
+        ("2019", "1"),
+    ]
+    # Produto cartesiano: 5 itens x 2 combustíveis = 10 consultas
+    assert saved == 5
+
+
+def test_years_without_fuel_type_fall_back_to_all_fuel_types():
+    years, fuel_types = parse_years(YEARS_RESPONSE[:2] + [{"Label": "2018", "Value": "2018"}])
+
+    pairs, saved = expand_year_fuel_pairs(years, fuel_types)
+
+    assert pair_keys(pairs) == [("32000", "1"), ("2021", "1"), ("2018", "1")]
+    assert saved == 0
+
+
+def test_repeated_year_fuel_pairs_are_queried_once():
+    years, fuel_types = parse_years(YEARS_RESPONSE + [{"Label": "2019 Gasolina", "Value": "2019-1"}])
+
+    pairs, _ = expand_year_fuel_pairs(years, fuel_types)
+
+    assert pair_keys(pairs).count(("2019", "1")) == 1
+
+
+def test_message_without_pending_pairs_is_a_new_model():
+    assert pending_year_fuel_pairs(MESSAGE) is None
+
+
+def test_continuation_resumes_only_the_pending_pairs():
+    api = FakeApi()
+
+    # Orçamento esgotado após duas consultas de preço
+    records, pending, saved, error = fetch_model_prices(api, MESSAGE, StopAfter(2))
+
+    assert error is None
+    assert saved == 5
+    assert api.price_calls == [("32000", "1"), ("2021", "1")]
+    assert len(records) == 2
+    assert pair_keys(pending) == [("2021", "3"), ("2020", "3"), ("2019", "1")]
+
+    # A continuação passa pela fila SQS (JSON) e não consulta os anos novamente
+    continuation = json.loads(json.dumps(build_continuation(MESSAGE, pending)))
+    assert len(continuation[PENDING_PAIRS_FIELD]) == 3
+    resumed_api = FakeApi()
+    records, pending, saved, error = fetch_model_prices(resumed_api, continuation, Unlimited())
+
+    assert resumed_api.year_calls == 0
+    assert resumed_api.price_calls == [("2021", "3"), ("2020", "3"), ("2019", "1")]
+    assert pending == []
+    assert [(r["model_year_code"], r["fuel_type"]) for r in records] == resumed_api.price_calls
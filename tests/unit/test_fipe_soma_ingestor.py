@@ -0,0 +1,147 @@
+import json
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import fipe_soma_ingestor
+from dimension_cache import DimensionCache
+from message_packing import pack_records
+
+MANUFACTURER_ID = 10
+MODEL_ID = 20
+
+
+class FakeCursor:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, *args):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor()
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakeValueTable:
+    """
+    Substitui o execute_values da escrita dos valores, reproduzindo as regras
+    do PostgreSQL relevantes ao ingestor: um INSERT ... ON CONFLICT DO UPDATE
+    não pode afetar a mesma chave duas vezes, e uma linha inválida faz o
+    comando inteiro falhar.
+    """
+
+    def __init__(self, bad_fipe_codes=()):
+        self.rows = {}
+        self.calls = []
+        self.bad_fipe_codes = set(bad_fipe_codes)
+
+    def __call__(self, cur, sql, argslist, **kwargs):
+        argslist = list(argslist)
+        self.calls.append(len(argslist))
+        keys = [(row[2], row[3], row[5], row[6], row[8]) for row in argslist]
+        if len(set(keys)) != len(keys):
+            raise RuntimeError("ON CONFLICT DO UPDATE command cannot affect row a second time")
+        if any(row[3] in self.bad_fipe_codes for row in argslist):
+            raise RuntimeError("value too long for type character varying")
+        for key, row in zip(keys, argslist):
+            self.rows[key] = row
+
+
+@pytest.fixture
+def value_table(monkeypatch):
+    # Fabricante e modelo já em cache: o lote só escreve os valores
+    cache = DimensionCache()
+    cache.loaded = True
+    cache.put_manufacturer("Fiat", "21", 1, MANUFACTURER_ID)
+    cache.put_model("Uno", "4321", MANUFACTURER_ID, MODEL_ID)
+    monkeypatch.setattr(fipe_soma_ingestor, "get_dimension_cache", lambda conn: cache)
+    monkeypatch.setattr(fipe_soma_ingestor, "ensure_reference_tables", lambda conn, tables: None)
+    table = FakeValueTable(bad_fipe_codes={"BAD"})
+    monkeypatch.setattr(fipe_soma_ingestor, "execute_values", table)
+    return table
+
+
+def price(year, fipe_value="R$ 10.000,00", fipe_code="001234-5", **overrides):
+    record = {
+        "manufacturer": "Fiat",
+        "manufacturer_code": "21",
+        "model": "Uno",
+        "model_code": "4321",
+        "model_year_code": year,
+        "codigoTabelaReferencia": 315,
+        "mesReferenciaAno": "janeiro de 2025",
+        "fipe_value": fipe_value,
+        "fipe_code": fipe_code,
+        "fuel_type": "G",
+        "vehicle_type": 1,
+    }
+    record.update(overrides)
+    return record
+
+
+def sqs_record(message_id, body):
+    return {"messageId": message_id, "body": body if isinstance(body, str) else json.dumps(body)}
+
+
+def test_only_invalid_messages_are_reported(value_table):
+    records = [
+        sqs_record("valid", price(2020)),
+        sqs_record("missing-field", {k: v for k, v in price(2021).items() if k != "fipe_code"}),
+        sqs_record("bad-value", price(2022, fipe_value="R$ abc")),
+        sqs_record("not-json", "{not json"),
+        sqs_record("packed-partial", pack_records([price(2023), price(2024, model_year_code=None)])[0]),
+    ]
+
+    failed = fipe_soma_ingestor.process_batch(FakeConnection(), records)
+
+    assert failed == ["missing-field", "bad-value", "not-json", "packed-partial"]
+    # Uma única escrita em lote com os registros válidos, inclusive o da mensagem empacotada
+    assert value_table.calls == [2]
+    assert sorted(key[2] for key in value_table.rows) == [2020, 2023]
+
+
+def test_bulk_failure_falls_back_to_per_row_writes(value_table):
+    records = [
+        sqs_record("m1", price(2020)),
+        sqs_record("m2", price(2021, fipe_code="BAD")),
+        sqs_record("m3", price(2022)),
+    ]
+    conn = FakeConnection()
+
+    failed = fipe_soma_ingestor.process_batch(conn, records)
+
+    assert failed == ["m2"]
+    # Lote (falha) seguido de uma escrita por registro
+    assert value_table.calls == [3, 1, 1, 1]
+    assert sorted(key[2] for key in value_table.rows) == [2020, 2022]
+    assert conn.rollbacks >= 2
+
+
+def test_same_natural_key_twice_in_a_batch_keeps_the_last_value(value_table):
+    records = [
+        sqs_record("m1", price(2020, fipe_value="R$ 10.000,00")),
+        sqs_record("m2", price(2020, fipe_value="R$ 11.000,00")),
+    ]
+
+    failed = fipe_soma_ingestor.process_batch(FakeConnection(), records)
+
+    assert failed == []
+    assert value_table.calls == [1]
+    (row,) = value_table.rows.values()
+    assert row[7] == 1100000
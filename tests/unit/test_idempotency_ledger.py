@@ -0,0 +1,98 @@
+import json
+import logging
+
+import pytest
+
+import idempotency_ledger
+from idempotency_ledger import (
+    BACKEND_POSTGRES,
+    STAGE_MODELS,
+    IdempotencyLedger,
+    MemoryIdempotencyLedger,
+    check_records,
+    get_idempotency_ledger,
+    mark_completed,
+)
+
+
+@pytest.fixture
+def ledger(monkeypatch):
+    ledger = MemoryIdempotencyLedger()
+    monkeypatch.setattr(idempotency_ledger, "_idempotency_ledger", ledger)
+    return ledger
+
+
+def brand_record(message_id, brand_code, reference_table_code=315):
+    body = {
+        "codigoTabelaReferencia": reference_table_code,
+        "codigoTipoVeiculo": 1,
+        "codigoMarca": brand_code,
+    }
+    return {"messageId": message_id, "body": json.dumps(body)}
+
+
+def test_duplicate_delivery_is_skipped(ledger):
+    first = [brand_record("m1", "21"), brand_record("m2", "22")]
+    _, entries, done = check_records(STAGE_MODELS, first)
+    assert done == set()
+    mark_completed(ledger, entries, ["m1", "m2"], [])
+
+    # Reentrega da marca 21 (outro messageId) junto com uma marca nova
+    _, entries, done = check_records(STAGE_MODELS, [brand_record("m3", "21"), brand_record("m4", "23")])
+
+    assert done == {entries["m3"]}
+    assert entries["m4"] not in done
+    assert ledger.stats() == {"skipped": 1, "marked": 2}
+
+
+def test_failed_message_is_not_marked_done(ledger):
+    records = [brand_record("m1", "21"), brand_record("m2", "22")]
+    _, entries, _ = check_records(STAGE_MODELS, records)
+
+    mark_completed(ledger, entries, ["m1", "m2"], [{"itemIdentifier": "m2"}])
+
+    _, entries, done = check_records(STAGE_MODELS, records)
+    assert done == {entries["m1"]}
+
+
+def test_same_key_in_another_reference_table_is_not_a_duplicate(ledger):
+    _, entries, _ = check_records(STAGE_MODELS, [brand_record("m1", "21", reference_table_code=315)])
+    mark_completed(ledger, entries, ["m1"], [])
+
+    _, _, done = check_records(STAGE_MODELS, [brand_record("m2", "21", reference_table_code=316)])
+
+    assert done == set()
+
+
+def test_invalid_bodies_are_always_processed(ledger):
+    records = [{"messageId": "m1", "body": "{not json"}, {"messageId": "m2", "body": "{}"}]
+
+    _, entries, done = check_records(STAGE_MODELS, records)
+    mark_completed(ledger, entries, ["m1", "m2"], [])
+
+    assert entries == {"m1": None, "m2": None}
+    assert done == set()
+    assert ledger.entries == set()
+
+
+def test_base_ledger_records_nothing():
+    ledger = IdempotencyLedger()
+    entry = (315, STAGE_MODELS, "1:21")
+
+    ledger.mark_done([entry])
+
+    assert ledger.done([entry]) == set()
+
+
+def test_postgres_backend_without_database_warns(monkeypatch, caplog):
+    monkeypatch.setattr(idempotency_ledger, "IDEMPOTENCY_LEDGER_BACKEND", BACKEND_POSTGRES)
+    monkeypatch.setattr(idempotency_ledger, "_idempotency_ledger", None)
+    monkeypatch.delenv("RDS_HOST", raising=False)
+
+    with caplog.at_level(logging.WARNING):
+        assert get_idempotency_ledger() is None
+
+    assert any(
+        record.levelno == logging.WARNING and "RDS_HOST" in record.getMessage()
+        for record in caplog.records
+    )
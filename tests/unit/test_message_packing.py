@@ -0,0 +1,92 @@
+import json
+import random
+import string
+
+import pytest
+
+import message_packing
+from message_packing import PACKED_FORMAT, pack_records, unpack_body
+
+# Limite de tamanho de mensagem do SQS
+SQS_MAX_BYTES = 262144
+
+
+def price_record(index):
+    return {
+        "codigoTabelaReferencia": 315,
+        "model_code": str(index),
+        "model": f"Modelo {index} 1.0 Flex",
+        "model_year_code": 2020 + index % 5,
+        "fuel_type": "G",
+        "fipe_value": f"R$ {index},00",
+        "vehicle_type": 1,
+    }
+
+
+def noise_record(index, size=2000):
+    """Registro com conteúdo aleatório, que o gzip praticamente não comprime."""
+    rng = random.Random(index)
+    return {"id": index, "noise": "".join(rng.choice(string.ascii_letters) for _ in range(size))}
+
+
+def unpack_all(bodies):
+    return [record for body in bodies for record in unpack_body(body)]
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip"])
+def test_round_trip_preserves_records_and_order(compression):
+    records = [price_record(i) for i in range(500)]
+
+    bodies = pack_records(records, compression=compression)
+
+    assert unpack_all(bodies) == records
+    envelope = json.loads(bodies[0])
+    assert envelope["format"] == PACKED_FORMAT
+    assert envelope["encoding"] == ("gzip+base64" if compression == "gzip" else "json")
+    assert sum(json.loads(body)["count"] for body in bodies) == len(records)
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip"])
+def test_bodies_respect_the_sqs_size_limit(compression):
+    records = [noise_record(i) for i in range(400)]
+
+    bodies = pack_records(records, compression=compression)
+
+    assert len(bodies) > 1
+    assert all(len(body.encode("utf-8")) <= SQS_MAX_BYTES for body in bodies)
+    assert unpack_all(bodies) == records
+
+
+def test_oversized_group_is_halved_until_it_fits(monkeypatch):
+    # A estimativa inicial (4x) superestima a compressão de dados aleatórios:
+    # o primeiro grupo excede o limite e é dividido ao meio recursivamente
+    calls = []
+    original = message_packing._encode_within_limit
+
+    def spy(encoded_records, compress, max_bytes):
+        calls.append(len(encoded_records))
+        return original(encoded_records, compress, max_bytes)
+
+    monkeypatch.setattr(message_packing, "_encode_within_limit", spy)
+    records = [noise_record(i) for i in range(100)]
+
+    bodies = pack_records(records, max_bytes=50000, compression="gzip")
+
+    assert len(calls) > 1
+    assert calls[1] == calls[0] // 2
+    assert all(len(body.encode("utf-8")) <= 50000 for body in bodies)
+    assert unpack_all(bodies) == records
+
+
+def test_record_larger_than_the_limit_is_rejected():
+    with pytest.raises(ValueError):
+        pack_records([noise_record(0, size=5000)], max_bytes=1000, compression="none")
+
+
+def test_unpack_legacy_single_record_message():
+    record = price_record(7)
+
+    assert unpack_body(json.dumps(record, ensure_ascii=False)) == [record]
+    assert unpack_body(json.dumps(record).encode("utf-8")) == [record]
+    # Corpo já decodificado (dict)
+    assert unpack_body(record) == [record]
@@ -0,0 +1,107 @@
+import io
+import json
+
+import metrics
+from metrics import EmfMetrics, Histogram, LocalMetrics, log_metrics
+
+
+def emf_documents(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def definition(document):
+    (directive,) = document["_aws"]["CloudWatchMetrics"]
+    return directive
+
+
+def test_emf_flush_groups_by_dimension_set_and_splits_at_100_values():
+    stream = io.StringIO()
+    sink = EmfMetrics(namespace="FipeTest", service="FipePriceLoader-dev", stream=stream)
+    for index in range(250):
+        sink.observe("Latency", float(index), stage="fipe_api", endpoint="ConsultarValorComTodosParametros", vehicle_type=1)
+    sink.increment("Requests", 250, stage="fipe_api", endpoint="ConsultarValorComTodosParametros", vehicle_type=1)
+    sink.increment("Throttles", stage="fipe_api", endpoint="ConsultarValorComTodosParametros", vehicle_type=1)
+    sink.increment("Messages", 7, stage="sqs", endpoint="fipe-price-queue-dev")
+
+    sink.flush()
+    documents = emf_documents(stream)
+
+    api = [d for d in documents if d["stage"] == "fipe_api"]
+    sqs = [d for d in documents if d["stage"] == "sqs"]
+    # 250 latências: documentos de 100, 100 e 50 valores
+    assert [len(d["Latency"]) for d in api] == [100, 100, 50]
+    assert [v for d in api for v in d["Latency"]] == [float(i) for i in range(250)]
+    # Contadores somados, apenas no primeiro documento do grupo
+    assert api[0]["Requests"] == 250 and api[0]["Throttles"] == 1
+    assert all("Requests" not in d for d in api[1:])
+    assert definition(api[0])["Dimensions"] == [["service", "endpoint", "stage", "vehicle_type"]]
+    assert {m["Name"] for m in definition(api[0])["Metrics"]} == {"Latency", "Requests", "Throttles"}
+    assert {m["Name"] for m in definition(api[2])["Metrics"]} == {"Latency"}
+    assert api[0]["vehicle_type"] == "1"
+    assert api[0]["service"] == "FipePriceLoader-dev"
+
+    (queue,) = sqs
+    assert queue["Messages"] == 7
+    assert definition(queue)["Namespace"] == "FipeTest"
+    assert definition(queue)["Dimensions"] == [["service", "endpoint", "stage"]]
+    assert definition(queue)["Metrics"] == [{"Name": "Messages", "Unit": "Count"}]
+
+
+def test_emf_flush_drains_the_metrics():
+    stream = io.StringIO()
+    sink = EmfMetrics(namespace="FipeTest", stream=stream)
+    sink.increment("Requests", stage="sqs")
+
+    sink.flush()
+    sink.flush()
+
+    assert len(emf_documents(stream)) == 1
+    assert sink.snapshot() == []
+
+
+def test_histogram_memory_is_bounded_but_totals_are_exact():
+    histogram = Histogram(max_values=50)
+
+    for value in range(10000):
+        histogram.add(float(value))
+
+    assert len(histogram.values) == 50
+    assert histogram.count == 10000
+    assert histogram.sum == sum(range(10000))
+    assert histogram.max == 9999.0
+
+
+def test_local_metrics_snapshot_and_total():
+    sink = LocalMetrics(max_values=10)
+    for value in range(100):
+        sink.observe("Latency", value, stage="ingest", endpoint="bulk_upsert")
+    sink.increment("Rows", 30, stage="ingest", endpoint="bulk_upsert", vehicle_type=1)
+    sink.increment("Rows", 12, stage="ingest", endpoint="bulk_upsert", vehicle_type=2)
+
+    (latency,) = [s for s in sink.snapshot() if s["name"] == "Latency"]
+
+    assert latency["count"] == 100
+    assert latency["max"] == 99
+    assert sink.total("Rows", stage="ingest") == 42
+    assert sink.total("Rows", vehicle_type=2) == 12
+    assert sink.total("Latency", endpoint="bulk_upsert") == 100
+
+
+def test_log_metrics_flushes_even_when_the_handler_fails(monkeypatch):
+    flushed = []
+
+    class Sink(LocalMetrics):
+        def flush(self):
+            flushed.append(True)
+
+    monkeypatch.setattr(metrics, "_metrics", Sink())
+
+    @log_metrics
+    def handler(event, context):
+        raise RuntimeError("falha")
+
+    try:
+        handler({}, None)
+    except RuntimeError:
+        pass
+    assert flushed == [True]
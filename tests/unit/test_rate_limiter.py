@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+import rate_limiter
+from rate_limiter import TokenBucketRateLimiter, parse_retry_after
+
+
+class FakeClock:
+    """Relógio controlado pelo teste no lugar de time.monotonic/time.sleep."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limiter.time, "sleep", clock.sleep)
+    return clock
+
+
+def make_limiter(**kwargs):
+    params = dict(rate=2.0, burst=2, min_rate=0.5, max_rate=4.0, increase=0.5, decrease_factor=0.5)
+    params.update(kwargs)
+    return TokenBucketRateLimiter(**params)
+
+
+def test_burst_is_served_without_waiting(clock):
+    limiter = make_limiter()
+
+    assert limiter.acquire() == 0.0
+    assert limiter.acquire() == 0.0
+    assert clock.sleeps == []
+
+
+def test_acquire_blocks_until_a_token_is_refilled(clock):
+    limiter = make_limiter()
+    limiter.acquire()
+    limiter.acquire()
+
+    # Balde vazio: a 2 req/s o próximo token leva 0,5 s
+    assert limiter.acquire() == pytest.approx(0.5)
+    assert clock.sleeps == [pytest.approx(0.5)]
+
+
+def test_tokens_refill_with_elapsed_time_up_to_burst(clock):
+    limiter = make_limiter()
+    limiter.acquire()
+    limiter.acquire()
+
+    clock.now += 10
+    assert limiter.reserve() == 0.0
+    # O acúmulo é limitado ao burst (2 tokens)
+    assert limiter.tokens == pytest.approx(1.0)
+
+
+def test_throttle_decreases_rate_multiplicatively(clock):
+    limiter = make_limiter()
+
+    limiter.on_throttle()
+    assert limiter.current_rate == pytest.approx(1.0)
+    limiter.on_throttle()
+    limiter.on_throttle()
+    # Nunca abaixo de min_rate
+    assert limiter.current_rate == pytest.approx(0.5)
+    assert limiter.stats()["throttle_count"] == 3
+    assert limiter.throttle_events[0]["rate_before"] == pytest.approx(2.0)
+
+
+def test_throttle_empties_the_bucket(clock):
+    limiter = make_limiter()
+
+    limiter.on_throttle()
+    assert limiter.reserve() == pytest.approx(1.0)
+
+
+def test_success_recovers_rate_additively_up_to_max(clock):
+    limiter = make_limiter()
+    limiter.on_throttle()
+
+    limiter.on_success()
+    assert limiter.current_rate == pytest.approx(1.5)
+    for _ in range(10):
+        limiter.on_success()
+    assert limiter.current_rate == pytest.approx(4.0)
+
+
+def test_retry_after_blocks_requests_until_it_expires(clock):
+    limiter = make_limiter(burst=5)
+
+    limiter.on_throttle(retry_after=3)
+    assert limiter.reserve() == pytest.approx(3.0)
+    clock.now += 3
+    assert limiter.reserve() == 0.0
+
+
+def test_parse_retry_after_seconds():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("1.5") == 1.5
+    assert parse_retry_after("-2") == 0.0
+    assert parse_retry_after(None) is None
+
+
+def test_parse_retry_after_http_date():
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+
+    assert parse_retry_after(format_datetime(retry_at, usegmt=True)) == pytest.approx(30, abs=2)
+    # Datas passadas não geram espera
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+
+@pytest.mark.parametrize("value", ["", "soon", "12 parsecs", "Wed, 99 Foo 2015"])
+def test_parse_retry_after_garbage(value):
+    assert parse_retry_after(value) is None
@@ -0,0 +1,177 @@
+import json
+
+import pytest
+import requests
+
+import fipe_model_loader
+import idempotency_ledger
+from idempotency_ledger import MemoryIdempotencyLedger
+from retry_scheduler import RETRY_ATTEMPT_FIELD, SQS_MAX_DELAY, RetryScheduler, queue_url_from_arn
+from time_budget import TimeBudget
+
+QUEUE_ARN = "arn:aws:sqs:us-east-1:000000000000:fipe-manufacturer-queue-dev"
+QUEUE_URL = "https://sqs.us-east-1.amazonaws.com/000000000000/fipe-manufacturer-queue-dev"
+
+BRAND_MESSAGE = {"codigoTabelaReferencia": 315, "codigoTipoVeiculo": 1, "codigoMarca": 21}
+
+
+class FakeSqsClient:
+    """Cliente SQS que registra as chamadas; `fail` faz `send_message` falhar."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+        self.visibility = []
+
+    def send_message(self, **kwargs):
+        if self.fail:
+            raise RuntimeError("SQS indisponível")
+        self.sent.append(kwargs)
+        return {"MessageId": str(len(self.sent))}
+
+    def change_message_visibility(self, **kwargs):
+        self.visibility.append(kwargs)
+
+
+class FakeContext:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+def sqs_record(message_id, message):
+    return {
+        "messageId": message_id,
+        "receiptHandle": f"handle-{message_id}",
+        "eventSourceARN": QUEUE_ARN,
+        "body": json.dumps(message),
+    }
+
+
+def test_delay_is_capped_at_sqs_maximum():
+    scheduler = RetryScheduler(FakeSqsClient(), QUEUE_URL, base_delay=5)
+
+    delays = [scheduler.compute_delay(30) for _ in range(200)]
+
+    assert all(SQS_MAX_DELAY / 2 <= delay <= SQS_MAX_DELAY for delay in delays)
+    assert scheduler.compute_delay(1, retry_after=10000) == SQS_MAX_DELAY
+
+
+@pytest.mark.parametrize("attempt", [1, 2, 3, 6])
+def test_equal_jitter_bounds(attempt):
+    scheduler = RetryScheduler(FakeSqsClient(), QUEUE_URL, base_delay=8)
+    cap = min(SQS_MAX_DELAY, 8 * 2 ** (attempt - 1))
+
+    delays = {scheduler.compute_delay(attempt) for _ in range(200)}
+
+    assert min(delays) >= max(1, round(cap / 2))
+    assert max(delays) <= cap
+
+
+def test_retry_after_takes_precedence_over_shorter_backoff():
+    scheduler = RetryScheduler(FakeSqsClient(), QUEUE_URL, base_delay=5)
+
+    assert scheduler.compute_delay(1, retry_after=120) == 120
+    # Retry-After menor que o backoff não o reduz
+    assert scheduler.compute_delay(4, retry_after=1) >= 20
+
+
+def test_schedule_resends_with_delay_and_attempt():
+    sqs = FakeSqsClient()
+    scheduler = RetryScheduler(sqs, base_delay=5)
+
+    assert scheduler.schedule(sqs_record("m1", BRAND_MESSAGE), BRAND_MESSAGE, retry_after=60)
+
+    (sent,) = sqs.sent
+    assert sent["QueueUrl"] == QUEUE_URL
+    assert sent["DelaySeconds"] == 60
+    assert json.loads(sent["MessageBody"])[RETRY_ATTEMPT_FIELD] == 1
+    assert scheduler.scheduled == 1
+
+
+def test_schedule_gives_up_after_max_attempts():
+    sqs = FakeSqsClient()
+    scheduler = RetryScheduler(sqs, QUEUE_URL, max_attempts=2)
+    message = {**BRAND_MESSAGE, RETRY_ATTEMPT_FIELD: 2}
+
+    assert not scheduler.schedule(sqs_record("m1", message), message)
+    assert sqs.sent == []
+
+
+def test_failed_send_extends_visibility_and_returns_false():
+    sqs = FakeSqsClient(fail=True)
+    scheduler = RetryScheduler(sqs, QUEUE_URL, base_delay=5)
+
+    assert not scheduler.schedule(sqs_record("m1", BRAND_MESSAGE), BRAND_MESSAGE, retry_after=30)
+
+    (visibility,) = sqs.visibility
+    assert visibility["ReceiptHandle"] == "handle-m1"
+    assert visibility["VisibilityTimeout"] == 30
+    assert scheduler.scheduled == 0
+
+
+def test_requeue_sends_without_delay_or_attempt():
+    sqs = FakeSqsClient()
+    scheduler = RetryScheduler(sqs, QUEUE_URL)
+
+    assert scheduler.requeue(sqs_record("m1", BRAND_MESSAGE), BRAND_MESSAGE)
+
+    (sent,) = sqs.sent
+    assert "DelaySeconds" not in sent
+    assert json.loads(sent["MessageBody"]) == BRAND_MESSAGE
+    assert not RetryScheduler(FakeSqsClient(fail=True), QUEUE_URL).requeue(
+        sqs_record("m1", BRAND_MESSAGE), BRAND_MESSAGE
+    )
+
+
+def test_queue_url_from_arn():
+    assert queue_url_from_arn(QUEUE_ARN) == QUEUE_URL
+
+
+def test_time_budget():
+    assert not TimeBudget().exhausted()
+    assert not TimeBudget(FakeContext(60000), margin_ms=30000).exhausted()
+    assert TimeBudget(FakeContext(30000), margin_ms=30000).exhausted()
+
+
+def throttled_api(sqs):
+    """FipeAPI simulada cuja consulta de modelos sempre recebe 429."""
+
+    class FakeRateLimiter:
+        def stats(self):
+            return {}
+
+    class ThrottledApi:
+        sqs_client = sqs
+        rate_limiter = FakeRateLimiter()
+
+        @classmethod
+        def from_message(cls, message):
+            return cls()
+
+        def get_models(self, brand_code, vehicle_type):
+            response = requests.Response()
+            response.status_code = 429
+            response.headers["Retry-After"] = "30"
+            raise requests.HTTPError(response=response)
+
+    return ThrottledApi
+
+
+@pytest.mark.parametrize("fail, failures", [(False, []), (True, [{"itemIdentifier": "m1"}])])
+def test_model_loader_reports_unscheduled_throttles(monkeypatch, fail, failures):
+    sqs = FakeSqsClient(fail=fail)
+    monkeypatch.setenv("SQS_INPUT_URL", QUEUE_URL)
+    monkeypatch.setenv("SQS_OUTPUT_URL", QUEUE_URL.replace("manufacturer", "model"))
+    monkeypatch.setattr(fipe_model_loader, "FipeAPI", throttled_api(sqs))
+    monkeypatch.setattr(idempotency_ledger, "_idempotency_ledger", MemoryIdempotencyLedger())
+
+    result = fipe_model_loader.lambda_handler(
+        {"Records": [sqs_record("m1", BRAND_MESSAGE)]}, FakeContext(300000)
+    )
+
+    assert result["statusCode"] == 200
+    assert result["batchItemFailures"] == failures
+    assert len(sqs.sent) == (0 if fail else 1)
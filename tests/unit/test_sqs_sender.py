@@ -0,0 +1,143 @@
+import threading
+
+import pytest
+
+import message_packing
+import sqs_sender
+from message_packing import unpack_body
+from sqs_sender import SqsBatchSender, add_send_failures
+
+QUEUE_URL = "https://sqs.us-east-1.amazonaws.com/000000000000/fipe-price-queue-dev"
+
+
+class FakeSqsClient:
+    """
+    Cliente SQS que registra cada chamada a `send_message_batch` e responde
+    com as falhas de `failures`: uma função (chamada, entradas) -> lista de
+    entradas `Failed` do SQS.
+    """
+
+    def __init__(self, failures=None):
+        self.failures = failures or (lambda call, entries: [])
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def send_message_batch(self, QueueUrl, Entries):
+        with self._lock:
+            call = len(self.calls)
+            self.calls.append(Entries)
+        return {"Failed": self.failures(call, Entries)}
+
+
+def fail_bodies(predicate, sender_fault, calls=None):
+    """Falha as entradas cujo corpo satisfaz `predicate` (nas chamadas `calls`)."""
+
+    def failures(call, entries):
+        if calls is not None and call not in calls:
+            return []
+        return [
+            {"Id": entry["Id"], "SenderFault": sender_fault, "Code": "Error", "Message": "falha"}
+            for entry in entries
+            if predicate(entry["MessageBody"])
+        ]
+
+    return failures
+
+
+def records(*message_ids):
+    return [{"messageId": message_id} for message_id in message_ids]
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(sqs_sender, "SEND_RETRY_DELAY", 0)
+
+
+def send(client, messages, **kwargs):
+    sender = SqsBatchSender(client, QUEUE_URL, workers=1, **kwargs)
+    for tag, message in messages:
+        sender.add(message, tag=tag)
+    return sender
+
+
+def test_sender_fault_is_reported_without_retry():
+    client = FakeSqsClient(fail_bodies(lambda body: '"b"' in body, sender_fault=True))
+    sender = send(client, [("m1", {"id": "a"}), ("m2", {"id": "b"}), ("m3", {"id": "c"})])
+
+    assert sender.close() == {"m2"}
+    assert len(client.calls) == 1
+    assert sender.stats()["sent"] == 2
+
+
+def test_service_fault_retries_only_the_failed_entries():
+    client = FakeSqsClient(fail_bodies(lambda body: '"b"' in body, sender_fault=False, calls={0}))
+    sender = send(client, [("m1", {"id": "a"}), ("m2", {"id": "b"}), ("m3", {"id": "c"})])
+
+    assert sender.close() == set()
+    assert len(client.calls) == 2
+    assert [entry["MessageBody"] for entry in client.calls[1]] == ['{"id": "b"}']
+    assert sender.stats()["sent"] == 3
+
+
+def test_persistent_service_fault_fails_after_max_attempts():
+    client = FakeSqsClient(fail_bodies(lambda body: '"b"' in body, sender_fault=False))
+    sender = send(client, [("m1", {"id": "a"}), ("m2", {"id": "b"})], max_attempts=3)
+
+    assert sender.close() == {"m2"}
+    assert len(client.calls) == 3
+
+
+def test_client_error_fails_the_whole_batch():
+    class BrokenClient:
+        def send_message_batch(self, QueueUrl, Entries):
+            raise RuntimeError("sem rede")
+
+    sender = send(BrokenClient(), [("m1", {"id": "a"}), ("m2", {"id": "b"})], max_attempts=2)
+
+    assert sender.close() == {"m1", "m2"}
+
+
+def test_add_send_failures_reports_input_messages_once():
+    client = FakeSqsClient(fail_bodies(lambda body: '"x"' in body, sender_fault=True))
+    sender = send(client, [("m1", {"id": "x"}), ("m1", {"id": "y"}), ("m2", {"id": "z"}), ("m3", {"id": "x"})])
+    batch_item_failures = [{"itemIdentifier": "m3"}]
+
+    add_send_failures(sender, records("m1", "m2", "m3"), batch_item_failures)
+
+    assert batch_item_failures == [{"itemIdentifier": "m3"}, {"itemIdentifier": "m1"}]
+
+
+def test_add_send_failures_reports_every_record_when_close_raises():
+    class FailingSender:
+        def close(self):
+            raise RuntimeError("falha no envio")
+
+    batch_item_failures = []
+    add_send_failures(FailingSender(), records("m1", "m2"), batch_item_failures)
+
+    assert batch_item_failures == [{"itemIdentifier": "m1"}, {"itemIdentifier": "m2"}]
+
+
+def test_packed_body_failure_reports_only_the_tags_in_that_body(monkeypatch):
+    # Registros de ~100 bytes, até ~3 por corpo, todos acumulados antes do empacotamento
+    monkeypatch.setattr(message_packing, "PACK_MAX_BYTES", 450)
+    monkeypatch.setattr(message_packing, "PACK_COMPRESSION", "none")
+    monkeypatch.setattr(sqs_sender, "PACK_BUFFER_BYTES", 10 ** 6)
+    messages = [
+        (f"m{index // 2}", {"id": index, "padding": "x" * 80})
+        for index in range(12)
+    ]
+
+    def contains_record_7(body):
+        return any(record["id"] == 7 for record in unpack_body(body))
+
+    client = FakeSqsClient(fail_bodies(contains_record_7, sender_fault=True))
+    sender = send(client, messages, pack=True)
+    failed = sender.close()
+
+    bodies = [entry["MessageBody"] for entry in client.calls[0]]
+    assert len(bodies) > 2
+    failed_body = next(body for body in bodies if contains_record_7(body))
+    expected = {f"m{record['id'] // 2}" for record in unpack_body(failed_body)}
+    assert failed == expected
+    assert len(failed) < 6